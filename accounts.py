@@ -0,0 +1,109 @@
+"""
+Account deletion for TigerStudy
+
+Deleting a user is one DELETE statement: the database's ON DELETE CASCADE
+rules remove their hosted groups (with those groups' members, waitlists and
+chat), their posts, replies, votes, messages and notifications. Before that,
+the user leaves the groups they joined so the freed seats go to the next
+person on each waitlist, and afterwards the denormalized reply counts and
+scores of the posts they touched are recomputed with a few set-based
+UPDATEs instead of loading anything into the session. Their messages are
+also cut out of the compressed chat archive blocks. All of it is one
+transaction, so a failure part way leaves the account untouched.
+"""
+from sqlalchemy import delete, func, select, update
+from models import (db, User, StudyGroup, Participant, DiscussionPost, DiscussionReply, PostVote, ReplyVote,
+                    Notification)
+import chat_archive
+import group_membership
+import http_cache
+import notifications
+import profile_activity
+
+
+def _touched_post_ids(user_id):
+    """Get the ids of other users' posts whose counters change when a user is deleted"""
+    replied = select(DiscussionReply.post_id).where(DiscussionReply.author_id == user_id)
+    voted = select(PostVote.post_id).where(PostVote.user_id == user_id)
+    voted_replies = (select(DiscussionReply.post_id)
+                     .join(ReplyVote, ReplyVote.reply_id == DiscussionReply.id)
+                     .where(ReplyVote.user_id == user_id))
+    post_ids = db.session.execute(
+        select(DiscussionPost.id, DiscussionPost.course_id)
+        .where(DiscussionPost.id.in_(replied.union(voted, voted_replies)),
+               DiscussionPost.author_id != user_id)
+    ).all()
+    return post_ids
+
+
+def _recount(post_ids):
+    """Recompute reply counts and scores for the given posts and their replies"""
+    reply_count = (select(func.count(DiscussionReply.id))
+                   .where(DiscussionReply.post_id == DiscussionPost.id).scalar_subquery())
+    post_score = (select(func.coalesce(func.sum(PostVote.vote_type), 0))
+                  .where(PostVote.post_id == DiscussionPost.id).scalar_subquery())
+    db.session.execute(
+        update(DiscussionPost).where(DiscussionPost.id.in_(post_ids))
+        .values(reply_count=reply_count, score=post_score)
+        .execution_options(synchronize_session=False)
+    )
+
+    children = db.aliased(DiscussionReply)
+    child_count = (select(func.count(children.id))
+                   .where(children.parent_id == DiscussionReply.id).scalar_subquery())
+    reply_score = (select(func.coalesce(func.sum(ReplyVote.vote_type), 0))
+                   .where(ReplyVote.reply_id == DiscussionReply.id).scalar_subquery())
+    db.session.execute(
+        update(DiscussionReply).where(DiscussionReply.post_id.in_(post_ids))
+        .values(child_count=child_count, score=reply_score)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def delete_account(user):
+    """Delete a user and everything they own, keeping other users' counters right"""
+    user_id = user.id
+    tenant_id = user.tenant_id
+
+    try:
+        # Leaving through group_membership promotes waitlisted users into the freed seats;
+        # release_seat() does not commit, so the leaves and the delete share one transaction
+        joined = StudyGroup.query.join(Participant).filter(
+            Participant.user_id == user_id,
+            StudyGroup.host_id != user_id
+        ).all()
+        promoted = []
+        for study_group in joined:
+            _, promoted_user_id = group_membership.release_seat(study_group, user_id)
+            if promoted_user_id is not None:
+                promoted.append((promoted_user_id, study_group.id, study_group.title))
+
+        touched = _touched_post_ids(user_id)
+        course_ids = {course_id for _, course_id in touched}
+        course_ids.update(study_group.course_id for study_group in joined)
+        course_ids.update(db.session.scalars(
+            select(StudyGroup.course_id).where(StudyGroup.host_id == user_id)
+        ))
+        course_ids.update(db.session.scalars(
+            select(DiscussionPost.course_id).where(DiscussionPost.author_id == user_id)
+        ))
+
+        # Archived chat is not covered by the cascade: cut the user's messages out of the blocks
+        chat_archive.scrub_author(user_id)
+        db.session.execute(delete(User).where(User.id == user_id))
+        if touched:
+            _recount([post_id for post_id, _ in touched])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    db.session.expunge_all()
+
+    profile_activity.clear()
+    for course_id in course_ids:
+        http_cache.bump_course(course_id, tenant_id)
+    for post_id, course_id in touched:
+        http_cache.bump_post(post_id, course_id, tenant_id)
+    http_cache.bump_users(user_id)
+    for promoted_user_id, group_id, title in promoted:
+        notifications.notify(Notification.WAITLIST_PROMOTED, [promoted_user_id], group_id, title)
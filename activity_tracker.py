@@ -0,0 +1,128 @@
+"""
+Write-behind login and last-seen tracking for TigerStudy
+
+Logins and authenticated requests only record a timestamp in memory. A
+background thread writes the buffered users.last_login / users.last_seen
+values every FLUSH_INTERVAL_SECONDS in one executemany UPDATE per column,
+and the buffer is flushed once more when the process exits. Each user
+costs at most one row update per interval, however many requests they
+make.
+
+User.last_active() reads a user's buffered timestamp before falling back
+to the stored column, so pages never show a stale value for this process.
+Each flush also bumps the flushed users' profile versions, so cached public
+profiles pick up the new "Last active" time.
+"""
+import atexit
+import threading
+from datetime import datetime
+from flask import request
+from flask_login import current_user
+from sqlalchemy import bindparam, update
+from models import db, User
+import http_cache
+
+# Seconds between background flushes (ACTIVITY_FLUSH_INTERVAL overrides)
+FLUSH_INTERVAL_SECONDS = 30
+
+# Endpoints that are not user activity (asset downloads, presence pings)
+IGNORED_ENDPOINTS = {'static', 'dist_asset', 'chat_presence'}
+
+_last_seen = {}
+_last_login = {}
+_buffer_lock = threading.Lock()
+
+
+def touch(user_id, when=None):
+    """Buffer a user's last-seen time"""
+    with _buffer_lock:
+        _last_seen[user_id] = when or datetime.now()
+
+
+def record_login(user_id, when=None):
+    """Buffer a successful login (also counts as being seen)"""
+    when = when or datetime.now()
+    with _buffer_lock:
+        _last_login[user_id] = when
+        _last_seen[user_id] = when
+
+
+def pending_last_seen(user_id):
+    """Get a user's buffered last-seen time (None if nothing is buffered)"""
+    with _buffer_lock:
+        return _last_seen.get(user_id)
+
+
+def flush():
+    """Write buffered timestamps in bulk (returns the number of users updated)"""
+    with _buffer_lock:
+        last_seen = dict(_last_seen)
+        last_login = dict(_last_login)
+        _last_seen.clear()
+        _last_login.clear()
+
+    if not last_seen and not last_login:
+        return 0
+
+    # Core executemany on the table: unlike an ORM bulk UPDATE it does not insist that every
+    # row still exists, so users deleted since they were buffered are simply skipped
+    users = User.__table__
+    try:
+        if last_seen:
+            db.session.execute(
+                update(users).where(users.c.id == bindparam('uid')).values(last_seen=bindparam('when')),
+                [{'uid': user_id, 'when': when} for user_id, when in last_seen.items()]
+            )
+        if last_login:
+            db.session.execute(
+                update(users).where(users.c.id == bindparam('uid')).values(last_login=bindparam('when')),
+                [{'uid': user_id, 'when': when} for user_id, when in last_login.items()]
+            )
+        db.session.commit()
+    except Exception:
+        # Put the timestamps back (unless newer ones arrived) so the next flush retries
+        db.session.rollback()
+        with _buffer_lock:
+            for user_id, when in last_seen.items():
+                _last_seen.setdefault(user_id, when)
+            for user_id, when in last_login.items():
+                _last_login.setdefault(user_id, when)
+        raise
+
+    # Public profiles show "Last active", so their ETags must move with it
+    flushed = set(last_seen) | set(last_login)
+    http_cache.bump_users(*flushed)
+    return len(flushed)
+
+
+def _flush_loop(app, interval, stop):
+    """Flush the buffer every interval seconds until stopped"""
+    while not stop.wait(interval):
+        with app.app_context():
+            try:
+                flush()
+            except Exception:
+                app.logger.exception('Failed to flush user activity')
+
+
+def init_activity_tracking(app):
+    """Record activity for signed-in requests and start the background flusher"""
+
+    @app.before_request
+    def track_activity():
+        """Buffer the current user's last-seen time"""
+        if request.endpoint not in IGNORED_ENDPOINTS and current_user.is_authenticated:
+            touch(current_user.id)
+
+    interval = app.config.get('ACTIVITY_FLUSH_INTERVAL', FLUSH_INTERVAL_SECONDS)
+    if interval:
+        stop = threading.Event()
+        threading.Thread(target=_flush_loop, args=(app, interval, stop), name='activity-flush', daemon=True).start()
+        atexit.register(stop.set)
+
+    def flush_on_exit():
+        """Write whatever is still buffered when the process stops"""
+        with app.app_context():
+            flush()
+
+    atexit.register(flush_on_exit)
@@ -2,26 +2,44 @@
 TigerStudy - Main Flask Application
 A modern web app for Princeton students to find and join study groups
 """
-from flask import Flask, render_template, redirect, url_for, flash, request
+from flask import render_template, redirect, url_for, flash, request, g, jsonify
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from datetime import datetime, timedelta
-from models import db, bcrypt, User, Course, StudyGroup, Participant, DiscussionPost, DiscussionReply, PostVote, ReplyVote, ChatMessage
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import joinedload
+import click
+from models import db, Tenant, Building, User, Course, StudyGroup, Participant, DiscussionPost, DiscussionReply, PostVote, ReplyVote, ChatMessage, Notification
 from forms import (CreateStudyGroupForm, JoinStudyGroupForm, CreateDiscussionPostForm,
-                   CreateDiscussionReplyForm, RegistrationForm, LoginForm, EditProfileForm, VoteForm, ChatMessageForm)
-import os
-
-app = Flask(__name__)
-
-# Configuration
-app.config['SECRET_KEY'] = 'tigerstudy-secret-key-2025'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///study_groups.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Initialize database
-db.init_app(app)
-
-# Initialize Bcrypt
-bcrypt.init_app(app)
+                   CreateDiscussionReplyForm, RegistrationForm, LoginForm, EditProfileForm, VoteForm, ChatMessageForm,
+                   PresenceForm)
+from factory import create_app
+import accounts
+import activity_tracker
+import chat_archive
+import group_membership
+import http_cache
+import locations
+import near_duplicates
+import notifications
+import presence
+import profile_activity
+import rate_limit
+import read_models
+import recommendations
+import reply_threads
+import request_profiler
+import schedule
+import static_assets
+import streaming
+import template_cache
+import tenancy
+import trending
+
+# Configuration, database and Bcrypt are set up by the factory
+app = create_app()
+
+# Map every request to its campus before anything else runs
+tenancy.init_tenancy(app)
 
 # Initialize Flask-Login
 login_manager = LoginManager()
@@ -30,11 +48,35 @@ login_manager.login_view = 'login'
 login_manager.login_message = 'Please log in to access this page.'
 login_manager.login_message_category = 'info'
 
+# Buffer last-seen / last-login times and write them in bulk
+activity_tracker.init_activity_tracking(app)
+
+# Cache compiled templates on disk so restarted workers skip compilation
+template_cache.init_template_cache(app)
+
+# Token-bucket throttling for login, registration and write routes
+rate_limit.init_rate_limit(app)
+
+# In-memory chat presence (online / typing), no database writes
+presence.init_presence(app)
+
+# Hourly vote buckets behind the "Trending" discussion sort
+trending.init_trending(app)
+
+# Hashed CSS bundle, icon sprite and the asset_url / icon template globals
+static_assets.init_static_assets(app)
+
+# MinHash/LSH index that flags new posts repeating an existing question
+near_duplicates.init_near_duplicates(app)
+
+# Sampling profiler for flagged or sampled requests (off unless PROFILER_TOKEN is set)
+request_profiler.init_request_profiler(app)
+
 
 @login_manager.user_loader
 def load_user(user_id):
     """Load user by ID for Flask-Login"""
-    return User.query.get(int(user_id))
+    return User.query.filter_by(id=int(user_id), tenant_id=g.tenant.id).first()
 
 
 # Custom Jinja2 filters
@@ -59,27 +101,48 @@ def format_datetime(dt):
 
 
 @app.route('/')
+@http_cache.conditional(http_cache.site_page_keys)
 def home():
     """Home page showing all courses"""
     search_query = request.args.get('search', '').strip()
 
+    # Course rows (read_models.CourseRow), not ORM objects
+    query = read_models.select_courses().where(Course.tenant_id == g.tenant.id)
     if search_query:
         # Search courses by code or title
-        courses = Course.query.filter(
-            db.or_(
-                Course.code.ilike(f'%{search_query}%'),
-                Course.title.ilike(f'%{search_query}%')
-            )
-        ).order_by(Course.code).all()
-    else:
-        courses = Course.query.order_by(Course.code).all()
-
-    return render_template('home.html', courses=courses, search_query=search_query)
+        query = query.where(db.or_(
+            Course.code.ilike(f'%{search_query}%'),
+            Course.title.ilike(f'%{search_query}%')
+        ))
+    courses = read_models.fetch(read_models.CourseRow, query.order_by(Course.code))
+
+    # Badge counts for every listed course in two grouped queries instead of two per course
+    course_ids = [course.id for course in courses]
+    active_counts = dict(db.session.execute(
+        select(StudyGroup.course_id, func.count(StudyGroup.id))
+        .where(StudyGroup.course_id.in_(course_ids), StudyGroup.date_time >= datetime.now())
+        .group_by(StudyGroup.course_id)
+    ).all()) if course_ids else {}
+    post_counts = dict(db.session.execute(
+        select(DiscussionPost.course_id, func.count(DiscussionPost.id))
+        .where(DiscussionPost.course_id.in_(course_ids))
+        .group_by(DiscussionPost.course_id)
+    ).all()) if course_ids else {}
+
+    # Precomputed "recommended for you" feed (one indexed lookup)
+    recommended_groups = []
+    if current_user.is_authenticated and not search_query:
+        recommended_groups = recommendations.get_recommendations(current_user.id)
+
+    return render_template('home.html', courses=courses, search_query=search_query,
+                           active_counts=active_counts, post_counts=post_counts,
+                           recommended_groups=recommended_groups)
 
 
 # ==================== AUTHENTICATION ROUTES ====================
 
 @app.route('/register', methods=['GET', 'POST'])
+@rate_limit.limit('register')
 def register():
     """User registration page"""
     # Redirect if already logged in
@@ -92,6 +155,7 @@ def register():
     if form.validate_on_submit():
         # Create new user
         user = User(
+            tenant_id=g.tenant.id,
             email=form.email.data.lower(),
             username=form.username.data,
             full_name=form.full_name.data,
@@ -102,13 +166,14 @@ def register():
         db.session.add(user)
         db.session.commit()
 
-        flash(f'Welcome to TigerStudy, {user.full_name}! Please log in.', 'success')
+        flash(f'Welcome to {g.tenant.app_name}, {user.full_name}! Please log in.', 'success')
         return redirect(url_for('login'))
 
     return render_template('register.html', form=form)
 
 
 @app.route('/login', methods=['GET', 'POST'])
+@rate_limit.limit('login')
 def login():
     """User login page"""
     # Redirect if already logged in
@@ -122,6 +187,7 @@ def login():
         # Find user by email or username
         email_or_username = form.email_or_username.data.lower()
         user = User.query.filter(
+            User.tenant_id == g.tenant.id,
             db.or_(
                 User.email == email_or_username,
                 User.username == email_or_username
@@ -130,9 +196,8 @@ def login():
 
         # Check credentials
         if user and user.check_password(form.password.data):
-            # Update last login
-            user.last_login = datetime.now()
-            db.session.commit()
+            # Record the login (written by the activity tracker's next flush)
+            activity_tracker.record_login(user.id)
 
             # Log user in
             login_user(user, remember=form.remember_me.data)
@@ -160,19 +225,17 @@ def logout():
 @login_required
 def profile():
     """View current user's profile"""
-    # Get user's activity
-    hosted_groups = current_user.get_study_groups_hosting()
-    joined_groups = current_user.get_study_groups_joined()
-    discussion_posts = current_user.get_discussion_posts_created()
-    replies_count = current_user.total_replies_count()
+    # Get user's activity (batched and cached per user)
+    activity = profile_activity.get_profile_activity(current_user.id)
 
     return render_template(
         'profile.html',
         user=current_user,
-        hosted_groups=hosted_groups,
-        joined_groups=joined_groups,
-        discussion_posts=discussion_posts,
-        replies_count=replies_count
+        activity=activity,
+        hosted_groups=activity.hosted_groups,
+        joined_groups=activity.joined_groups,
+        discussion_posts=activity.discussion_posts,
+        replies_count=activity.replies_count
     )
 
 
@@ -192,6 +255,7 @@ def edit_profile():
             current_user.set_password(form.new_password.data)
 
         db.session.commit()
+        http_cache.bump_users(current_user.id)
 
         flash('Your profile has been updated successfully!', 'success')
         return redirect(url_for('profile'))
@@ -205,66 +269,80 @@ def edit_profile():
 
 
 @app.route('/user/<username>')
+@http_cache.conditional(http_cache.profile_page_keys)
 def user_profile(username):
     """View another user's public profile"""
-    user = User.query.filter_by(username=username).first_or_404()
+    user = User.query.filter_by(tenant_id=g.tenant.id, username=username).first_or_404()
 
-    # Get user's activity
-    hosted_groups = user.get_study_groups_hosting()
-    joined_groups = user.get_study_groups_joined()
-    discussion_posts = user.get_discussion_posts_created()
-    replies_count = user.total_replies_count()
+    # Get user's activity (batched and cached per user)
+    activity = profile_activity.get_profile_activity(user.id)
 
     return render_template(
         'user_profile.html',
         user=user,
-        hosted_groups=hosted_groups,
-        joined_groups=joined_groups,
-        discussion_posts=discussion_posts,
-        replies_count=replies_count
+        activity=activity,
+        hosted_groups=activity.hosted_groups,
+        joined_groups=activity.joined_groups,
+        discussion_posts=activity.discussion_posts,
+        replies_count=activity.replies_count
     )
 
 
 # ==================== COURSE AND STUDY GROUP ROUTES ====================
 
 @app.route('/course/<course_code>')
+@http_cache.conditional(http_cache.course_page_keys)
 def course_detail(course_code):
     """Course detail page showing all study groups"""
-    course = Course.query.filter_by(code=course_code.upper()).first_or_404()
+    course = tenancy.get_course_or_404(course_code)
 
-    # Create form for joining groups
-    form = JoinStudyGroupForm()
+    # Create form for joining groups (signed-in visitors only: the CSRF token would
+    # touch the session and make the anonymous page uncacheable)
+    form = JoinStudyGroupForm() if current_user.is_authenticated else None
 
     # Get filter parameters
     time_filter = request.args.get('time', 'upcoming')
     location_type = request.args.get('location', 'all')
 
-    # Base query
-    query = StudyGroup.query.filter_by(course_id=course.id)
+    # Base query (group rows with host names, see read_models)
+    query = read_models.select_groups().where(StudyGroup.course_id == course.id)
 
     # Apply time filter
     now = datetime.now()
     if time_filter == 'upcoming':
-        query = query.filter(StudyGroup.date_time >= now)
+        query = query.where(StudyGroup.date_time >= now)
     elif time_filter == 'past':
-        query = query.filter(StudyGroup.date_time < now)
+        query = query.where(StudyGroup.date_time < now)
 
-    # Apply location filter
+    # Apply location filter (is_virtual is stored at create time and indexed with course_id, date_time)
     if location_type == 'in-person':
-        query = query.filter(~StudyGroup.location.ilike('%virtual%'), ~StudyGroup.location.ilike('%zoom%'))
+        query = query.where(StudyGroup.is_virtual.is_(False))
     elif location_type == 'virtual':
-        query = query.filter(db.or_(StudyGroup.location.ilike('%virtual%'), StudyGroup.location.ilike('%zoom%')))
+        query = query.where(StudyGroup.is_virtual.is_(True))
 
     # Order by date/time
     if time_filter == 'past':
-        study_groups = query.order_by(StudyGroup.date_time.desc()).all()
+        query = query.order_by(StudyGroup.date_time.desc())
     else:
-        study_groups = query.order_by(StudyGroup.date_time.asc()).all()
+        query = query.order_by(StudyGroup.date_time.asc())
+    study_groups = read_models.with_participants(read_models.fetch(read_models.GroupRow, query))
+
+    # The participants say which groups the current user is in; waitlist places take one more query
+    joined_group_ids = set()
+    waitlist_positions = {}
+    if current_user.is_authenticated:
+        joined_group_ids = {group.id for group in study_groups
+                            if any(user_id == current_user.id for user_id, _ in group.participants)}
+        waitlist_positions = read_models.waitlist_positions(
+            current_user.id, [group.id for group in study_groups if group.is_full() and not group.is_past()]
+        )
 
     return render_template(
         'course_detail.html',
         course=course,
         study_groups=study_groups,
+        joined_group_ids=joined_group_ids,
+        waitlist_positions=waitlist_positions,
         form=form,
         time_filter=time_filter,
         location_type=location_type
@@ -275,14 +353,43 @@ def course_detail(course_code):
 @login_required
 def create_study_group(course_code):
     """Create a new study group"""
-    course = Course.query.filter_by(code=course_code.upper()).first_or_404()
+    course = tenancy.get_course_or_404(course_code)
     form = CreateStudyGroupForm()
 
+    # Open times for the course (and the host) on the selected day
+    try:
+        slot_day = datetime.strptime(request.args.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        slot_day = datetime.now().date()
+    free_slots = schedule.free_slots(course.id, slot_day, user_id=current_user.id)
+
+    def render_form():
+        return render_template('create_study_group.html', course=course, form=form,
+                               slot_day=slot_day, free_slots=free_slots)
+
     if form.validate_on_submit():
         # Check if date is in the future
         if form.date_time.data < datetime.now():
             flash('Study group date must be in the future.', 'error')
-            return render_template('create_study_group.html', course=course, form=form)
+            return render_form()
+
+        start = form.date_time.data
+        end = start + timedelta(minutes=form.duration_minutes.data)
+
+        # Check if the host is already in a study group at that time
+        user_conflicts = schedule.find_user_conflicts(current_user.id, start, end)
+        if user_conflicts:
+            flash(f'You already have "{user_conflicts[0].title}" at that time.', 'error')
+            return render_form()
+
+        # Check if the room is already booked at that time
+        location_conflicts = schedule.find_location_conflicts(g.tenant.id, form.location.data, start, end)
+        if location_conflicts:
+            flash(f'{form.location.data} is already booked by "{location_conflicts[0].title}" at that time.', 'error')
+            return render_form()
+
+        # Classify the location once so filters never have to parse it
+        is_virtual, building_id = locations.classify(g.tenant.id, form.location.data)
 
         # Create new study group with current user as host
         study_group = StudyGroup(
@@ -291,8 +398,12 @@ def create_study_group(course_code):
             title=form.title.data,
             description=form.description.data,
             date_time=form.date_time.data,
+            duration_minutes=form.duration_minutes.data,
             location=form.location.data,
-            max_participants=form.max_participants.data
+            is_virtual=is_virtual,
+            building_id=building_id,
+            max_participants=form.max_participants.data,
+            participant_count=1
         )
 
         db.session.add(study_group)
@@ -305,41 +416,47 @@ def create_study_group(course_code):
         db.session.add(host_participant)
 
         db.session.commit()
+        profile_activity.invalidate(current_user.id)
+        http_cache.bump_course(course.id, course.tenant_id)
 
         flash(f'Study group "{study_group.title}" created successfully!', 'success')
         return redirect(url_for('course_detail', course_code=course.code))
 
-    return render_template('create_study_group.html', course=course, form=form)
+    return render_form()
 
 
 @app.route('/study_group/<int:group_id>/join', methods=['POST'])
 @login_required
 def join_study_group(group_id):
     """Join a study group"""
-    study_group = StudyGroup.query.get_or_404(group_id)
+    study_group = tenancy.get_group_or_404(group_id)
     form = JoinStudyGroupForm()
 
     if form.validate_on_submit():
-        # Check if group is full
-        if study_group.is_full():
-            flash('Sorry, this study group is already full.', 'error')
         # Check if study group is in the past
-        elif study_group.is_past():
+        if study_group.is_past():
             flash('Cannot join a study group that has already occurred.', 'error')
+            return redirect(url_for('course_detail', course_code=study_group.course.code))
+
+        # Check if the session clashes with a group the user already joined
+        conflicts = schedule.find_user_conflicts(current_user.id, study_group.date_time,
+                                                 study_group.end_time(), exclude_group_id=study_group.id)
+        if conflicts:
+            flash(f'"{study_group.title}" overlaps "{conflicts[0].title}", which you have already joined.', 'error')
         else:
-            # Check if user already joined (using user_id instead of name)
-            if study_group.user_is_participant(current_user.id):
+            group_title = study_group.title
+
+            # Claim a seat atomically (falls back to the waitlist when full)
+            outcome = group_membership.join_group(study_group, current_user.id)
+
+            if outcome == group_membership.JOINED:
+                flash(f'Successfully joined "{group_title}"!', 'success')
+            elif outcome == group_membership.ALREADY_JOINED:
                 flash('You have already joined this study group.', 'warning')
+            elif outcome == group_membership.WAITLISTED:
+                flash(f'"{group_title}" is full. You have been added to the waitlist.', 'info')
             else:
-                # Add participant
-                participant = Participant(
-                    study_group_id=group_id,
-                    user_id=current_user.id
-                )
-                db.session.add(participant)
-                db.session.commit()
-
-                flash(f'Successfully joined "{study_group.title}"!', 'success')
+                flash('You are already on the waitlist for this study group.', 'warning')
     else:
         # Form validation failed
         for field, errors in form.errors.items():
@@ -353,7 +470,7 @@ def join_study_group(group_id):
 @login_required
 def leave_study_group(group_id):
     """Leave a study group"""
-    study_group = StudyGroup.query.get_or_404(group_id)
+    study_group = tenancy.get_group_or_404(group_id)
     form = JoinStudyGroupForm()
 
     if form.validate_on_submit():
@@ -364,22 +481,17 @@ def leave_study_group(group_id):
         elif study_group.host_id == current_user.id:
             flash('You cannot leave a study group you are hosting. Please delete the group instead.', 'warning')
         else:
-            # Check if user is actually a participant
-            if not study_group.user_is_participant(current_user.id):
-                flash('You are not a member of this study group.', 'warning')
+            group_title = study_group.title
+
+            # Release the seat (the next waitlisted user is promoted into it)
+            outcome = group_membership.leave_group(study_group, current_user.id)
+
+            if outcome == group_membership.LEFT:
+                flash(f'You have left "{group_title}".', 'success')
+            elif outcome == group_membership.LEFT_WAITLIST:
+                flash(f'You have left the waitlist for "{group_title}".', 'success')
             else:
-                # Remove participant
-                participant = Participant.query.filter_by(
-                    study_group_id=group_id,
-                    user_id=current_user.id
-                ).first()
-
-                if participant:
-                    db.session.delete(participant)
-                    db.session.commit()
-                    flash(f'You have left "{study_group.title}".', 'success')
-                else:
-                    flash('Error leaving study group.', 'error')
+                flash('You are not a member of this study group.', 'warning')
     else:
         # Form validation failed
         for field, errors in form.errors.items():
@@ -393,7 +505,7 @@ def leave_study_group(group_id):
 @login_required
 def delete_study_group(group_id):
     """Delete a study group (host only)"""
-    study_group = StudyGroup.query.get_or_404(group_id)
+    study_group = tenancy.get_group_or_404(group_id)
     form = JoinStudyGroupForm()
 
     if form.validate_on_submit():
@@ -403,11 +515,15 @@ def delete_study_group(group_id):
         else:
             # Store the course code and title before deletion
             course_code = study_group.course.code
+            course_id = study_group.course_id
             group_title = study_group.title
+            member_ids = [user_id for (user_id,) in db.session.query(Participant.user_id).filter_by(study_group_id=group_id)]
 
-            # Delete the study group (cascade will delete participants and chat messages)
-            db.session.delete(study_group)
+            # One DELETE; the database cascades to participants, waitlist, chat and archives
+            db.session.execute(delete(StudyGroup).where(StudyGroup.id == group_id))
             db.session.commit()
+            profile_activity.invalidate(current_user.id, *member_ids)
+            http_cache.bump_course(course_id, g.tenant.id)
 
             flash(f'Study group "{group_title}" has been deleted successfully.', 'success')
             return redirect(url_for('course_detail', course_code=course_code))
@@ -421,112 +537,179 @@ def delete_study_group(group_id):
 
 
 @app.route('/course/<course_code>/discussions')
+@http_cache.conditional(http_cache.course_page_keys)
 def discussion_board(course_code):
     """Discussion board for a course"""
-    course = Course.query.filter_by(code=course_code.upper()).first_or_404()
+    course = tenancy.get_course_or_404(course_code)
 
     # Get sort parameter (default: hot)
     sort_by = request.args.get('sort', 'hot')
 
-    # Base query
-    query = DiscussionPost.query.filter_by(course_id=course.id)
+    # Base query (post rows with author names, see read_models)
+    query = read_models.select_posts().where(DiscussionPost.course_id == course.id)
 
     # Apply sorting
     if sort_by == 'top':
         # Sort by score (highest first), then by creation time
-        posts = query.order_by(
+        posts = read_models.fetch(read_models.PostRow, query.order_by(
             DiscussionPost.pinned.desc(),
             DiscussionPost.score.desc(),
             DiscussionPost.created_at.desc()
-        ).all()
+        ))
     elif sort_by == 'new':
         # Sort by most recent
-        posts = query.order_by(
+        posts = read_models.fetch(read_models.PostRow, query.order_by(
             DiscussionPost.pinned.desc(),
             DiscussionPost.created_at.desc()
-        ).all()
-    elif sort_by == 'trending':
-        # Posts from last 48 hours sorted by score
-        cutoff_time = datetime.now() - timedelta(hours=48)
-        posts = query.filter(DiscussionPost.created_at >= cutoff_time).order_by(
+        ))
+    elif sort_by == 'active':
+        # Most recently replied to (stored activity time, served by the course/active index)
+        posts = read_models.fetch(read_models.PostRow, query.order_by(
             DiscussionPost.pinned.desc(),
-            DiscussionPost.score.desc()
-        ).all()
+            DiscussionPost.last_activity_at.desc()
+        ))
+    elif sort_by == 'trending':
+        # Posts gaining votes fastest right now (decayed hourly vote counts, kept in memory)
+        ranking = [post_id for _, post_id in trending.get_engine(app).top_posts(course.id)]
+        rows = read_models.fetch(read_models.PostRow, query.where(DiscussionPost.id.in_(ranking))) if ranking else []
+        by_id = {post.id: post for post in rows}
+        posts = sorted((by_id[post_id] for post_id in ranking if post_id in by_id),
+                       key=lambda p: not p.pinned)
     else:  # hot (default)
         # Calculate hot score for each post and sort
-        all_posts = query.all()
+        all_posts = read_models.fetch(read_models.PostRow, query)
         # Sort by pinned first, then by hot score
         posts = sorted(all_posts, key=lambda p: (not p.pinned, -p.calculate_hot_score()))
 
-    # Create vote form
-    vote_form = VoteForm()
+    # The current user's votes on every listed post in one query
+    user_votes = {}
+    if current_user.is_authenticated:
+        user_votes = PostVote.votes_by_user(current_user.id, [post.id for post in posts])
+
+    # Create vote form (signed-in visitors only, see course_detail)
+    vote_form = VoteForm() if current_user.is_authenticated else None
 
-    return render_template('discussion_board.html', course=course, posts=posts, sort_by=sort_by, vote_form=vote_form)
+    return render_template('discussion_board.html', course=course, posts=posts, sort_by=sort_by,
+                           user_votes=user_votes, vote_form=vote_form)
 
 
 @app.route('/course/<course_code>/discussions/new', methods=['GET', 'POST'])
 @login_required
 def create_discussion(course_code):
     """Create a new discussion post"""
-    course = Course.query.filter_by(code=course_code.upper()).first_or_404()
+    course = tenancy.get_course_or_404(course_code)
     form = CreateDiscussionPostForm()
 
+    similar_posts = []
     if form.validate_on_submit():
-        # Create new discussion post with current user as author
-        post = DiscussionPost(
-            course_id=course.id,
-            author_id=current_user.id,
-            title=form.title.data,
-            content=form.content.data,
-            category=form.category.data
-        )
+        # Ask before posting a question the board already has (LSH lookup, no table scan)
+        duplicate_index = near_duplicates.get_index(app)
+        signature = near_duplicates.signature(form.title.data, form.content.data)
+        if not form.post_anyway.data:
+            matches = duplicate_index.find(course.id, signature)
+            if matches:
+                rows = read_models.fetch(read_models.PostRow, read_models.select_posts().where(
+                    DiscussionPost.id.in_([post_id for _, post_id in matches])
+                ))
+                by_id = {row.id: row for row in rows}
+                similar_posts = [by_id[post_id] for _, post_id in matches if post_id in by_id]
+
+        if not similar_posts:
+            # Create new discussion post with current user as author
+            post = DiscussionPost(
+                course_id=course.id,
+                author_id=current_user.id,
+                title=form.title.data,
+                content=form.content.data,
+                category=form.category.data
+            )
 
-        db.session.add(post)
-        db.session.commit()
+            db.session.add(post)
+            db.session.flush()
+            db.session.add(near_duplicates.signature_row(post, signature))
+            db.session.commit()
+            duplicate_index.add(course.id, post.id, signature)
+            profile_activity.invalidate(current_user.id)
+            http_cache.bump_course(course.id, course.tenant_id)
 
-        flash(f'Discussion post "{post.title}" created successfully!', 'success')
-        return redirect(url_for('discussion_post_detail', post_id=post.id))
+            flash(f'Discussion post "{post.title}" created successfully!', 'success')
+            return redirect(url_for('discussion_post_detail', post_id=post.id))
 
-    return render_template('create_discussion.html', course=course, form=form)
+    return render_template('create_discussion.html', course=course, form=form, similar_posts=similar_posts)
 
 
 @app.route('/discussion/<int:post_id>')
+@http_cache.conditional(http_cache.post_page_keys)
 def discussion_post_detail(post_id):
     """View individual discussion post with replies"""
-    post = DiscussionPost.query.get_or_404(post_id)
-    form = CreateDiscussionReplyForm()
-
-    # Get all replies sorted by score (highest first), then by creation time
-    replies = DiscussionReply.query.filter_by(post_id=post_id).order_by(
-        DiscussionReply.score.desc(),
-        DiscussionReply.created_at.asc()
-    ).all()
+    post = tenancy.get_post_or_404(post_id)
+
+    # Reply and vote forms are for signed-in visitors only (see course_detail)
+    form = CreateDiscussionReplyForm() if current_user.is_authenticated else None
+    vote_form = VoteForm() if current_user.is_authenticated else None
+
+    # Either one branch of the thread (?thread=<reply id>) or a page of top-level replies
+    page = max(request.args.get('page', 1, type=int), 1)
+    focus = None
+    has_more = False
+    thread_id = request.args.get('thread', type=int)
+    if thread_id is not None:
+        focus = DiscussionReply.query.filter_by(id=thread_id, post_id=post_id).first_or_404()
+        replies = reply_threads.load_branch(focus)
+    else:
+        replies, has_more = reply_threads.load_page(post_id, page)
 
-    # Create vote form
-    vote_form = VoteForm()
+    # The current user's votes on the post and every shown reply, looked up once
+    post_vote = None
+    reply_votes = {}
+    if current_user.is_authenticated:
+        post_vote = PostVote.votes_by_user(current_user.id, [post.id]).get(post.id)
+        reply_votes = ReplyVote.votes_by_user(current_user.id, [entry.reply.id for entry in replies])
 
-    return render_template('discussion_post_detail.html', post=post, replies=replies, form=form, vote_form=vote_form)
+    return streaming.stream_page('discussion_post_detail.html', post=post, replies=replies,
+                                 reply_count=post.reply_count, focus=focus, page=page, has_more=has_more,
+                                 post_vote=post_vote, reply_votes=reply_votes, form=form, vote_form=vote_form)
 
 
 @app.route('/discussion/<int:post_id>/reply', methods=['POST'])
 @login_required
+@rate_limit.limit('reply')
 def reply_to_discussion(post_id):
     """Add a reply to a discussion post"""
-    post = DiscussionPost.query.get_or_404(post_id)
+    post = tenancy.get_post_or_404(post_id)
     form = CreateDiscussionReplyForm()
 
     if form.validate_on_submit():
+        # Check if this is an answer to another reply on the same post
+        parent = None
+        if form.parent_id.data:
+            parent = DiscussionReply.query.filter_by(id=form.parent_id.data, post_id=post_id).first()
+            if parent is None:
+                flash('The reply you are responding to no longer exists.', 'error')
+                return redirect(url_for('discussion_post_detail', post_id=post_id))
+            parent = reply_threads.reply_target(parent)
+
         # Create new reply with current user as author
         reply = DiscussionReply(
             post_id=post_id,
+            parent_id=parent.id if parent else None,
             author_id=current_user.id,
             content=form.content.data
         )
 
         db.session.add(reply)
         db.session.commit()
+        profile_activity.invalidate(current_user.id, post.author_id)
+        http_cache.bump_post(post.id, post.course_id, g.tenant.id)
+        recipients = [post.author_id] + ([parent.author_id] if parent else [])
+        notifications.notify(Notification.REPLY, recipients, post.id, post.title, actor_id=current_user.id)
 
         flash('Reply posted successfully!', 'success')
+
+        # Deep replies only show up on their branch's page
+        if parent and reply.depth > reply_threads.INLINE_DEPTH:
+            return redirect(url_for('discussion_post_detail', post_id=post_id, thread=parent.id, _anchor=f'reply-{reply.id}'))
+        return redirect(url_for('discussion_post_detail', post_id=post_id, _anchor=f'reply-{reply.id}'))
     else:
         # Form validation failed
         for field, errors in form.errors.items():
@@ -538,9 +721,10 @@ def reply_to_discussion(post_id):
 
 @app.route('/discussion/post/<int:post_id>/vote', methods=['POST'])
 @login_required
+@rate_limit.limit('vote')
 def vote_on_post(post_id):
     """Upvote or downvote a discussion post"""
-    post = DiscussionPost.query.get_or_404(post_id)
+    post = tenancy.get_post_or_404(post_id)
     form = VoteForm()
 
     # Check if user is trying to vote on their own post
@@ -550,6 +734,7 @@ def vote_on_post(post_id):
 
     if form.validate_on_submit():
         vote_type = int(form.vote_type.data)  # Ensure it's an integer
+        old_score = post.score
 
         # Check if user has already voted
         existing_vote = PostVote.query.filter_by(post_id=post_id, user_id=current_user.id).first()
@@ -581,15 +766,27 @@ def vote_on_post(post_id):
             # Recalculate score
             post.score = sum(v.vote_type for v in post.votes)
             db.session.commit()
+            if vote_type == 1:
+                notifications.notify(Notification.POST_VOTE, [post.author_id], post.id, post.title,
+                                     actor_id=current_user.id)
+
+        # Score changes show up in the author's karma and top posts
+        profile_activity.invalidate(post.author_id)
+        http_cache.bump_post(post.id, post.course_id, g.tenant.id)
+
+        # Count the change towards the post's trending velocity
+        if post.score != old_score:
+            trending.get_engine(app).record_vote(post.course_id, post.id, post.score - old_score)
 
     return redirect(request.referrer or url_for('discussion_post_detail', post_id=post_id))
 
 
 @app.route('/discussion/reply/<int:reply_id>/vote', methods=['POST'])
 @login_required
+@rate_limit.limit('vote')
 def vote_on_reply(reply_id):
     """Upvote or downvote a discussion reply"""
-    reply = DiscussionReply.query.get_or_404(reply_id)
+    reply = tenancy.get_reply_or_404(reply_id)
     form = VoteForm()
 
     # Check if user is trying to vote on their own reply
@@ -630,6 +827,13 @@ def vote_on_reply(reply_id):
             # Recalculate score
             reply.score = sum(v.vote_type for v in reply.votes)
             db.session.commit()
+            if vote_type == 1:
+                notifications.notify(Notification.REPLY_VOTE, [reply.author_id], reply.post_id, reply.post.title,
+                                     actor_id=current_user.id)
+
+        # Score changes show up in the author's karma and top replies
+        profile_activity.invalidate(reply.author_id)
+        http_cache.bump_post(reply.post_id)
 
     return redirect(request.referrer or url_for('discussion_post_detail', post_id=reply.post_id))
 
@@ -640,32 +844,68 @@ def vote_on_reply(reply_id):
 @login_required
 def study_group_chat(group_id):
     """View study group chat page"""
-    group = StudyGroup.query.get_or_404(group_id)
+    group = tenancy.get_group_or_404(group_id)
 
     # Check if user is a participant or host
     if not group.user_is_participant(current_user.id):
         flash('You must be a member of this study group to view the chat.', 'warning')
         return redirect(url_for('course_detail', course_code=group.course.code))
 
-    # Get all chat messages, ordered by pinned first, then by time
-    messages = ChatMessage.query.filter_by(study_group_id=group_id).order_by(
+    # Stream chat messages, ordered by pinned first, then by time
+    message_count = ChatMessage.query.filter_by(study_group_id=group_id).count()
+    messages = streaming.iter_rows(ChatMessage.query.options(joinedload(ChatMessage.author)).filter_by(
+        study_group_id=group_id
+    ).order_by(
         ChatMessage.pinned.desc(),
         ChatMessage.created_at.asc()
-    ).all()
+    ))
+
+    # Members with their users in one query for the sidebar
+    members = Participant.query.options(joinedload(Participant.user)).filter_by(
+        study_group_id=group_id
+    ).order_by(Participant.id).all()
 
     form = ChatMessageForm()
 
-    return render_template('study_group_chat.html',
-                         group=group,
-                         messages=messages,
-                         form=form)
+    # Count the viewer as online as soon as the page renders
+    presence.get_store(app).heartbeat(group_id, current_user.id)
+
+    return streaming.stream_page('study_group_chat.html',
+                                 group=group,
+                                 messages=messages,
+                                 message_count=message_count,
+                                 members=members,
+                                 archive_block_id=chat_archive.newest_block_id(group_id),
+                                 form=form,
+                                 heartbeat_seconds=presence.HEARTBEAT_SECONDS)
+
+
+@app.route('/study_group/<int:group_id>/history/<int:block_id>')
+@login_required
+def study_group_chat_history(group_id, block_id):
+    """View one block of archived (older) chat messages"""
+    group = tenancy.get_group_or_404(group_id)
+
+    # Check if user is a participant or host
+    if not group.user_is_participant(current_user.id):
+        flash('You must be a member of this study group to view the chat.', 'warning')
+        return redirect(url_for('course_detail', course_code=group.course.code))
+
+    # Decompress the block on demand
+    messages, older_block_id = chat_archive.load_block(group_id, block_id)
+    if messages is None:
+        flash('Those messages are no longer available.', 'error')
+        return redirect(url_for('study_group_chat', group_id=group_id))
+
+    return render_template('chat_history.html', group=group, messages=messages, older_block_id=older_block_id)
 
 
 @app.route('/study_group/<int:group_id>/message', methods=['POST'])
 @login_required
+@rate_limit.limit('chat')
 def send_chat_message(group_id):
     """Send a chat message in a study group"""
-    group = StudyGroup.query.get_or_404(group_id)
+    group = tenancy.get_group_or_404(group_id)
 
     # Check if user is a participant or host
     if not group.user_is_participant(current_user.id):
@@ -682,16 +922,52 @@ def send_chat_message(group_id):
         )
         db.session.add(message)
         db.session.commit()
+        notifications.notify_group(Notification.CHAT_MESSAGE, group, actor_id=current_user.id)
         flash('Message sent!', 'success')
 
     return redirect(url_for('study_group_chat', group_id=group_id))
 
 
+@app.route('/study_group/<int:group_id>/presence', methods=['POST'])
+@login_required
+@rate_limit.limit('presence')
+def chat_presence(group_id):
+    """Record a chat heartbeat and return who is online and typing"""
+    # Check if user is a participant (one indexed read, no writes)
+    is_member = db.session.query(
+        Participant.query.join(StudyGroup, Participant.study_group_id == StudyGroup.id)
+        .join(Course, StudyGroup.course_id == Course.id)
+        .filter(
+            Participant.study_group_id == group_id,
+            Participant.user_id == current_user.id,
+            Course.tenant_id == g.tenant.id
+        ).exists()
+    ).scalar()
+    if not is_member:
+        return jsonify(error='You must be a member of this study group.'), 403
+
+    form = PresenceForm()
+    if not form.validate_on_submit():
+        return jsonify(error='Invalid heartbeat.'), 400
+
+    store = presence.get_store(app)
+    if form.leaving.data:
+        store.leave(group_id, current_user.id)
+    else:
+        store.heartbeat(group_id, current_user.id, typing=form.typing.data)
+
+    online = store.online(group_id)
+    return jsonify(
+        online=list(online),
+        typing=[user_id for user_id, typing in online.items() if typing and user_id != current_user.id]
+    )
+
+
 @app.route('/study_group/<int:group_id>/message/<int:message_id>/pin', methods=['POST'])
 @login_required
 def pin_chat_message(group_id, message_id):
     """Pin or unpin a chat message (host only)"""
-    group = StudyGroup.query.get_or_404(group_id)
+    group = tenancy.get_group_or_404(group_id)
     message = ChatMessage.query.get_or_404(message_id)
 
     # Check if user is the host
@@ -716,6 +992,28 @@ def pin_chat_message(group_id, message_id):
     return redirect(url_for('study_group_chat', group_id=group_id))
 
 
+# ==================== NOTIFICATION ROUTES ====================
+
+@app.route('/notifications')
+@login_required
+def notification_inbox():
+    """View the current user's notifications (opening the inbox marks them read)"""
+    inbox = notifications.get_inbox(current_user.id)
+    unread_ids = {notification.id for notification in inbox if not notification.is_read}
+
+    if current_user.unread_notifications or unread_ids:
+        # Detach the loaded entries and their actors so the commit doesn't expire them
+        # and rendering doesn't reload each one
+        for notification in inbox:
+            db.session.expunge(notification)
+            actor = notification.actor
+            if actor is not None and actor.id != current_user.id and actor in db.session:
+                db.session.expunge(actor)
+        notifications.mark_all_read(current_user.id)
+
+    return render_template('notifications.html', inbox=inbox, unread_ids=unread_ids)
+
+
 @app.errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
@@ -729,6 +1027,101 @@ def utility_processor():
     return dict(now=datetime.now)
 
 
+@app.cli.command('precompile-templates')
+def precompile_templates_command():
+    """Compile all templates into the bytecode cache (run at deploy time)"""
+    compiled = template_cache.precompile_templates(app)
+    print(f"Precompiled {len(compiled)} templates into {app.config['TEMPLATE_BYTECODE_CACHE_DIR']}")
+
+
+@app.cli.command('add-tenant')
+@click.argument('slug')
+@click.argument('hostname')
+@click.option('--name', required=True, help='Full campus name, e.g. "Princeton University"')
+@click.option('--short-name', required=True, help='Short campus name, e.g. "Princeton"')
+@click.option('--email-domain', required=True, help='Student email domain, e.g. "princeton.edu"')
+@click.option('--app-name', default='TigerStudy', help='Brand shown in the header and page titles')
+def add_tenant_command(slug, hostname, name, short_name, email_domain, app_name):
+    """Register a campus served from HOSTNAME"""
+    tenant = Tenant(slug=slug, hostname=hostname.lower(), name=name, short_name=short_name,
+                    email_domain=email_domain.lower(), app_name=app_name)
+    db.session.add(tenant)
+    db.session.commit()
+    tenancy.clear_cache()
+    print(f'Added tenant {tenant.slug} for {tenant.hostname}')
+
+
+@app.cli.command('backfill-post-stats')
+def backfill_post_stats_command():
+    """Recompute every post's stored reply count and last activity time"""
+    reply_count = select(func.count(DiscussionReply.id)).where(
+        DiscussionReply.post_id == DiscussionPost.id
+    ).scalar_subquery()
+    last_reply_at = select(func.max(DiscussionReply.created_at)).where(
+        DiscussionReply.post_id == DiscussionPost.id
+    ).scalar_subquery()
+    result = db.session.execute(update(DiscussionPost).values(
+        reply_count=reply_count,
+        last_activity_at=func.coalesce(last_reply_at, DiscussionPost.created_at)
+    ).execution_options(synchronize_session=False))
+    db.session.commit()
+    # Boards and threads show the counts, so let cached copies go stale
+    posts = db.session.execute(select(DiscussionPost.id, DiscussionPost.course_id)).all()
+    http_cache.bump(*{http_cache.course_key(course_id) for _, course_id in posts},
+                    *[http_cache.post_key(post_id) for post_id, _ in posts])
+    print(f'Backfilled reply counts for {result.rowcount} posts')
+
+
+@app.cli.command('add-building')
+@click.argument('tenant_slug')
+@click.argument('name')
+@click.option('--alias', 'aliases', multiple=True, help='Another name locations may use (repeatable)')
+def add_building_command(tenant_slug, name, aliases):
+    """Register a campus building that study group locations can name"""
+    tenant = Tenant.query.filter_by(slug=tenant_slug).first()
+    if tenant is None:
+        raise click.ClickException(f'Unknown tenant: {tenant_slug}')
+    building = Building(tenant_id=tenant.id, name=name, aliases=','.join(aliases))
+    db.session.add(building)
+    db.session.commit()
+    locations.buildings_changed(tenant.id)
+    print(f'Added building {building.name} for {tenant.slug}')
+
+
+@app.cli.command('classify-locations')
+def classify_locations_command():
+    """Re-classify every study group's location (after adding buildings or keywords)"""
+    changed = locations.reclassify_all()
+    print(f'Re-classified {changed} study groups')
+
+
+@app.cli.command('rebuild-trending')
+def rebuild_trending_command():
+    """Recompute the trending vote buckets from recent post votes"""
+    buckets = trending.rebuild_buckets()
+    print(f'Rebuilt {buckets} trending buckets')
+
+
+@app.cli.command('delete-user')
+@click.argument('tenant_slug')
+@click.argument('username')
+def delete_user_command(tenant_slug, username):
+    """Delete a user's account and everything they own"""
+    tenant = Tenant.query.filter_by(slug=tenant_slug).first()
+    if tenant is None:
+        raise click.ClickException(f'Unknown tenant: {tenant_slug}')
+    user = User.query.filter_by(tenant_id=tenant.id, username=username).first()
+    if user is None:
+        raise click.ClickException(f'Unknown user: {username}')
+    accounts.delete_account(user)
+    print(f'Deleted user {username} from {tenant_slug}')
+
+
+# Warm the hottest templates once all filters are registered
+if app.config['TEMPLATE_WARMUP']:
+    template_cache.warm_templates(app)
+
+
 if __name__ == '__main__':
     with app.app_context():
         # Create database tables
@@ -0,0 +1,105 @@
+"""
+Static asset build for TigerStudy
+
+Produces, under static/dist:
+  - app.<hash>.css   purged + minified Tailwind bundle (templates are scanned,
+                     so only classes actually used ship)
+  - icons.<hash>.svg sprite of every icon in assets/icons
+  - .gz (and .br, when the optional `brotli` package is installed) variants
+  - manifest.json    logical name -> hashed filename, read by static_assets.py
+
+The CSS step needs the Tailwind CLI (v3). Point TAILWIND_CLI at the standalone
+binary or at "npx tailwindcss"; without it the sprite is still built and the
+pages keep using the Tailwind CDN.
+
+Usage:
+    python build_assets.py [--require-css]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+
+import static_assets
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+TAILWIND_CLI = os.environ.get('TAILWIND_CLI', 'tailwindcss')
+TAILWIND_CONFIG = os.path.join(static_assets.PROJECT_DIR, 'tailwind.config.js')
+CSS_ENTRY = os.path.join(static_assets.PROJECT_DIR, 'assets', 'src', 'app.css')
+
+
+def build_css():
+    """Run the Tailwind CLI and return the minified CSS bytes"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output = os.path.join(tmp_dir, 'app.css')
+        subprocess.run(
+            shlex.split(TAILWIND_CLI) + ['-c', TAILWIND_CONFIG, '-i', CSS_ENTRY, '-o', output, '--minify'],
+            cwd=static_assets.PROJECT_DIR, check=True
+        )
+        with open(output, 'rb') as f:
+            return f.read()
+
+
+def write_hashed(logical_name, data):
+    """Write content under a content-hashed name plus compressed variants"""
+    stem, ext = os.path.splitext(logical_name)
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    hashed_name = f'{stem}.{digest}{ext}'
+    path = os.path.join(static_assets.DIST_DIR, hashed_name)
+
+    with open(path, 'wb') as f:
+        f.write(data)
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+
+    print(f"  {logical_name} -> {hashed_name} ({len(data)} bytes)")
+    return hashed_name
+
+
+def main():
+    """Build every asset and write the manifest"""
+    parser = argparse.ArgumentParser(description='Build TigerStudy static assets')
+    parser.add_argument('--require-css', action='store_true',
+                        help='fail instead of falling back to the CDN when the Tailwind CLI is missing')
+    args = parser.parse_args()
+
+    os.makedirs(static_assets.DIST_DIR, exist_ok=True)
+    manifest = {}
+
+    print("Building icon sprite...")
+    sprite = static_assets.build_sprite(static_assets.load_icons())
+    manifest['icons.svg'] = write_hashed('icons.svg', sprite.encode('utf-8'))
+
+    print("Building CSS bundle...")
+    try:
+        manifest['app.css'] = write_hashed('app.css', build_css())
+    except (FileNotFoundError, subprocess.CalledProcessError) as e:
+        if args.require_css:
+            print(f"Tailwind build failed: {e}")
+            return 1
+        print(f"  Skipped ({e}); pages will keep using the Tailwind CDN")
+
+    if brotli is None:
+        print("Note: install 'brotli' to also emit .br files")
+
+    with open(static_assets.MANIFEST_PATH, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    print(f"Wrote {static_assets.MANIFEST_PATH}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
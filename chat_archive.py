@@ -0,0 +1,252 @@
+"""
+Chat retention and compressed cold storage for TigerStudy
+
+Chat messages older than RETENTION_DAYS are moved out of chat_messages into
+chat_archive_blocks: each block packs up to BLOCK_SIZE consecutive messages
+of one group as JSON, compressed with zstd when the zstandard package is
+installed and zlib otherwise. Pinned messages are never archived, so the
+chat page's hot table only holds recent and pinned messages.
+
+Archived history is read back lazily, one block per "Load older messages"
+click, and recently decoded blocks are kept in a small in-process cache.
+Deleting an account rewrites the blocks holding that user's messages (see
+scrub_author()).
+
+Run the compaction from cron:
+
+    python chat_archive.py [--days 30] [--vacuum]
+"""
+import argparse
+import json
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from models import db, ChatMessage, ChatArchiveBlock, User
+import content_render
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Messages older than this many days are archived
+RETENTION_DAYS = 30
+
+# Messages per compressed block
+BLOCK_SIZE = 500
+
+# Decoded blocks kept in memory for repeat "load older" reads
+DECODED_CACHE_SIZE = 64
+
+_decoded = OrderedDict()
+_decoded_lock = threading.Lock()
+
+
+def _compress(data):
+    """Compress a block payload (returns codec, bytes)"""
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=10).compress(data)
+    return 'zlib', zlib.compress(data, 9)
+
+
+def _decompress(codec, payload):
+    """Decompress a block payload"""
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('Chat archive block is zstd-compressed but zstandard is not installed')
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return zlib.decompress(payload)
+
+
+def _pack(rows):
+    """Encode [id, author_id, created_at, content] rows as a block payload (returns codec, bytes)"""
+    return _compress(json.dumps(rows, separators=(',', ':')).encode())
+
+
+def _archive_block(group_id, messages):
+    """Pack messages into one compressed block and delete them from the hot table"""
+    codec, payload = _pack([
+        [message.id, message.author_id, message.created_at.isoformat(), message.content]
+        for message in messages
+    ])
+
+    db.session.add(ChatArchiveBlock(
+        study_group_id=group_id,
+        first_message_id=messages[0].id,
+        last_message_id=messages[-1].id,
+        first_created_at=messages[0].created_at,
+        last_created_at=messages[-1].created_at,
+        message_count=len(messages),
+        codec=codec,
+        payload=payload
+    ))
+    db.session.execute(
+        delete(ChatMessage).where(ChatMessage.id.in_([message.id for message in messages]))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def compact(retention_days=RETENTION_DAYS, block_size=BLOCK_SIZE):
+    """Archive every group's unpinned messages older than the retention window (returns count)"""
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    archived = 0
+
+    group_ids = db.session.execute(
+        select(ChatMessage.study_group_id).where(
+            ChatMessage.created_at < cutoff,
+            ChatMessage.pinned.isnot(True)
+        ).distinct()
+    ).scalars().all()
+
+    for group_id in group_ids:
+        while True:
+            messages = ChatMessage.query.filter(
+                ChatMessage.study_group_id == group_id,
+                ChatMessage.created_at < cutoff,
+                ChatMessage.pinned.isnot(True)
+            ).order_by(ChatMessage.id).limit(block_size).all()
+            if not messages:
+                break
+            _archive_block(group_id, messages)
+            archived += len(messages)
+
+    return archived
+
+
+class ArchivedMessage:
+    """Read-only chat message decoded from an archive block"""
+
+    pinned = False
+
+    def __init__(self, message_id, author, created_at, content):
+        self.id = message_id
+        self.author = author
+        self.created_at = created_at
+        self.content = content
+
+    def time_ago(self):
+        """Return human-readable time ago"""
+        return ChatMessage.time_ago(self)
+
+    def rendered_content(self):
+        """Get the content as sanitized HTML (rendered on read, cached in memory)"""
+        return content_render.stored_or_render(self.content, None, None)
+
+
+def _decode(block):
+    """Get a block's raw [id, author_id, created_at, content] rows (cached)"""
+    # Rewriting a block only ever removes messages, so the count tells versions of it apart
+    key = (block.id, block.message_count)
+    with _decoded_lock:
+        rows = _decoded.get(key)
+        if rows is not None:
+            _decoded.move_to_end(key)
+            return rows
+
+    rows = json.loads(_decompress(block.codec, block.payload))
+    with _decoded_lock:
+        _decoded[key] = rows
+        while len(_decoded) > DECODED_CACHE_SIZE:
+            _decoded.popitem(last=False)
+    return rows
+
+
+def newest_block_id(group_id):
+    """Get the id of a group's most recent archive block (None if nothing is archived)"""
+    return db.session.execute(
+        select(ChatArchiveBlock.id).where(ChatArchiveBlock.study_group_id == group_id)
+        .order_by(ChatArchiveBlock.last_message_id.desc(), ChatArchiveBlock.id.desc()).limit(1)
+    ).scalar()
+
+
+def load_block(group_id, block_id):
+    """Get an archive block's messages, oldest first, and the id of the block before it"""
+    block = ChatArchiveBlock.query.filter_by(id=block_id, study_group_id=group_id).first()
+    if block is None:
+        return None, None
+
+    rows = _decode(block)
+    author_ids = {author_id for _, author_id, _, _ in rows}
+    authors = {user.id: user for user in User.query.filter(User.id.in_(author_ids))}
+    messages = [
+        ArchivedMessage(message_id, authors.get(author_id), datetime.fromisoformat(created_at), content)
+        for message_id, author_id, created_at, content in rows
+    ]
+
+    # Blocks are paged in (last_message_id, id) order rather than by comparing id ranges:
+    # a message archived late (e.g. unpinned after retention) makes a block whose range
+    # overlaps older blocks, and those must stay reachable
+    older_block_id = db.session.execute(
+        select(ChatArchiveBlock.id).where(
+            ChatArchiveBlock.study_group_id == group_id,
+            db.or_(
+                ChatArchiveBlock.last_message_id < block.last_message_id,
+                db.and_(ChatArchiveBlock.last_message_id == block.last_message_id, ChatArchiveBlock.id < block.id)
+            )
+        ).order_by(ChatArchiveBlock.last_message_id.desc(), ChatArchiveBlock.id.desc()).limit(1)
+    ).scalar()
+    return messages, older_block_id
+
+
+def scrub_author(author_id, batch_size=100):
+    """Remove an author's messages from every archive block, without committing (returns the count)
+
+    Blocks do not record who wrote them, so each one is decompressed once;
+    only blocks holding the author's messages are re-packed, and blocks left
+    empty are deleted.
+    """
+    removed = 0
+    last_id = 0
+    while True:
+        blocks = ChatArchiveBlock.query.filter(ChatArchiveBlock.id > last_id).order_by(
+            ChatArchiveBlock.id
+        ).limit(batch_size).all()
+        if not blocks:
+            break
+
+        for block in blocks:
+            rows = json.loads(_decompress(block.codec, block.payload))
+            kept = [row for row in rows if row[1] != author_id]
+            if len(kept) == len(rows):
+                continue
+            removed += len(rows) - len(kept)
+            if not kept:
+                db.session.delete(block)
+                continue
+            block.codec, block.payload = _pack(kept)
+            block.first_message_id, block.last_message_id = kept[0][0], kept[-1][0]
+            block.first_created_at = datetime.fromisoformat(kept[0][2])
+            block.last_created_at = datetime.fromisoformat(kept[-1][2])
+            block.message_count = len(kept)
+
+        last_id = blocks[-1].id
+        db.session.flush()
+        for block in blocks:
+            db.session.expunge(block)
+    return removed
+
+
+def main():
+    """Archive old chat messages for every group"""
+    from factory import create_app
+
+    parser = argparse.ArgumentParser(description='Move old TigerStudy chat messages into compressed archive blocks')
+    parser.add_argument('--days', type=int, default=RETENTION_DAYS, help='keep messages newer than this in the hot table')
+    parser.add_argument('--vacuum', action='store_true', help='run VACUUM afterwards to return freed pages to the OS')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        archived = compact(retention_days=args.days)
+        if args.vacuum:
+            with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                connection.exec_driver_sql('VACUUM')
+    print(f"Archived {archived} chat messages")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""
+Markdown rendering for TigerStudy posts, replies and chat messages
+
+Content is still stored as the Markdown the user typed, but it is converted
+to sanitized HTML once, when the row is written (see the hooks at the end of
+models.py), and kept next to it in content_html together with the
+RENDERER_VERSION that produced it. Views only print the stored HTML, so
+rich content costs nothing per page view.
+
+Rows whose stored HTML is missing or from an older renderer version are
+rendered on read through a small in-process LRU keyed by a hash of the
+source, and fixed in bulk by the background job:
+
+    python content_render.py [--batch 500]
+
+With the optional `markdown` and `nh3` packages installed, full Markdown is
+rendered and then sanitized against ALLOWED_TAGS. Without them a built-in
+renderer handles the common subset (paragraphs, line breaks, **bold**,
+*italic*, `code`, fenced code blocks, lists, quotes and http(s) links); it
+escapes the text before adding any markup, so its output is safe as well.
+"""
+import argparse
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from markupsafe import Markup, escape
+
+try:
+    import markdown
+    import nh3
+except ImportError:
+    markdown = nh3 = None
+
+# Bump when rendering changes so the background job re-renders stored HTML
+RENDERER_VERSION = '1-markdown' if markdown is not None else '1-basic'
+
+# Tags and attributes kept by the sanitizer
+ALLOWED_TAGS = {'p', 'br', 'strong', 'em', 'code', 'pre', 'ul', 'ol', 'li', 'blockquote', 'a', 'h3', 'h4', 'h5', 'h6', 'hr'}
+ALLOWED_ATTRIBUTES = {'a': {'href', 'title'}}
+ALLOWED_URL_SCHEMES = {'http', 'https', 'mailto'}
+
+# Rendered sources kept for rows that have no up-to-date stored HTML yet
+RENDER_CACHE_SIZE = 2048
+
+_rendered = OrderedDict()
+_rendered_lock = threading.Lock()
+
+_FENCE_RE = re.compile(r'^```[^\n]*\n(.*?)^```[ \t]*$', re.M | re.S)
+_CODE_SPAN_RE = re.compile(r'`([^`\n]+)`')
+_LINK_RE = re.compile(r'\[([^\]\n]+)\]\((https?://[^\s)]+)\)')
+_BOLD_RE = re.compile(r'\*\*(?=\S)(.+?)(?<=\S)\*\*')
+_ITALIC_RE = re.compile(r'(?<![\w*])[*_](?=\S)(.+?)(?<=\S)[*_](?![\w*])')
+_HEADING_RE = re.compile(r'^(#{1,4})\s+(.*)$')
+_BULLET_RE = re.compile(r'^\s*[-*+]\s+(.*)$')
+_NUMBERED_RE = re.compile(r'^\s*\d+[.)]\s+(.*)$')
+
+
+def _inline(text):
+    """Render inline Markdown in one line of escaped text"""
+    # Code spans and link targets are set aside so emphasis never touches them
+    spans = []
+
+    def keep(html):
+        spans.append(html)
+        return f'\x00{len(spans) - 1}\x00'
+
+    text = _CODE_SPAN_RE.sub(lambda match: keep(f'<code>{match.group(1)}</code>'), text)
+    text = _LINK_RE.sub(lambda match: keep(f'<a href="{match.group(2)}" rel="nofollow noopener">') + match.group(1) + keep('</a>'), text)
+    text = _BOLD_RE.sub(r'<strong>\1</strong>', text)
+    text = _ITALIC_RE.sub(r'<em>\1</em>', text)
+    return re.sub('\x00(\\d+)\x00', lambda match: spans[int(match.group(1))], text)
+
+
+def _block(lines):
+    """Render one blank-line separated block of escaped lines"""
+    if all(_BULLET_RE.match(line) for line in lines):
+        items = ''.join(f'<li>{_inline(_BULLET_RE.match(line).group(1))}</li>' for line in lines)
+        return f'<ul>{items}</ul>'
+    if all(_NUMBERED_RE.match(line) for line in lines):
+        items = ''.join(f'<li>{_inline(_NUMBERED_RE.match(line).group(1))}</li>' for line in lines)
+        return f'<ol>{items}</ol>'
+    if all(line.startswith('&gt;') for line in lines):
+        quoted = [line[4:].lstrip() for line in lines]
+        return f'<blockquote>{"<br>".join(_inline(line) for line in quoted)}</blockquote>'
+    heading = _HEADING_RE.match(lines[0])
+    if heading and len(lines) == 1:
+        level = len(heading.group(1)) + 2
+        return f'<h{level}>{_inline(heading.group(2))}</h{level}>'
+    return f'<p>{"<br>".join(_inline(line) for line in lines)}</p>'
+
+
+def _render_basic(text):
+    """Render the Markdown subset without third-party packages"""
+    html = []
+    position = 0
+    # NUL marks the placeholders _inline() sets aside, so user text must never contain one
+    text = text.replace('\r\n', '\n').replace('\x00', '')
+    for fence in _FENCE_RE.finditer(text):
+        html.append(_render_paragraphs(text[position:fence.start()]))
+        html.append(f'<pre><code>{escape(fence.group(1))}</code></pre>')
+        position = fence.end()
+    html.append(_render_paragraphs(text[position:]))
+    return ''.join(html)
+
+
+def _render_paragraphs(text):
+    """Render text without fenced code blocks"""
+    blocks = re.split(r'\n\s*\n', str(escape(text)).strip())
+    return ''.join(_block(block.split('\n')) for block in blocks if block.strip())
+
+
+def render(text):
+    """Convert Markdown source to sanitized HTML"""
+    if markdown is not None:
+        html = markdown.markdown(text, extensions=['fenced_code', 'nl2br'])
+        return nh3.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES,
+                         url_schemes=ALLOWED_URL_SCHEMES, link_rel='nofollow noopener')
+    return _render_basic(text)
+
+
+def render_cached(text):
+    """Render source through the in-process LRU"""
+    key = hashlib.sha1(text.encode()).hexdigest()
+    with _rendered_lock:
+        html = _rendered.get(key)
+        if html is not None:
+            _rendered.move_to_end(key)
+            return html
+
+    html = render(text)
+    with _rendered_lock:
+        _rendered[key] = html
+        while len(_rendered) > RENDER_CACHE_SIZE:
+            _rendered.popitem(last=False)
+    return html
+
+
+def stored_or_render(text, content_html, render_version):
+    """Get a row's HTML, using the stored copy when it is current"""
+    if content_html is not None and render_version == RENDERER_VERSION:
+        return Markup(content_html)
+    return Markup(render_cached(text))
+
+
+def rerender_stale(batch_size=500):
+    """Re-render every row whose stored HTML is missing or outdated (returns count)"""
+    # Imported here because models imports this module for its write hooks
+    from sqlalchemy import or_, select, update
+    from models import db, DiscussionPost, DiscussionReply, ChatMessage
+
+    rendered = 0
+    for model in (DiscussionPost, DiscussionReply, ChatMessage):
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                select(model.id, model.content).where(
+                    model.id > last_id,
+                    or_(model.render_version.is_(None), model.render_version != RENDERER_VERSION)
+                ).order_by(model.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            db.session.execute(update(model).execution_options(synchronize_session=False), [
+                {'id': row_id, 'content_html': render(content), 'render_version': RENDERER_VERSION}
+                for row_id, content in rows
+            ])
+            db.session.commit()
+            rendered += len(rows)
+            last_id = rows[-1][0]
+    return rendered
+
+
+def main():
+    """Re-render stored content after a renderer change"""
+    from factory import create_app
+
+    parser = argparse.ArgumentParser(description='Re-render TigerStudy posts, replies and chat messages')
+    parser.add_argument('--batch', type=int, default=500, help='rows rendered per transaction')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        rendered = rerender_stale(batch_size=args.batch)
+    print(f"Re-rendered {rendered} rows with renderer {RENDERER_VERSION}")
+
+
+if __name__ == '__main__':
+    main()
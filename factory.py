@@ -0,0 +1,43 @@
+"""
+Application factory for TigerStudy
+
+create_app() builds a configured Flask app with only the database and
+password hashing attached. The web app (app.py) layers routes, Flask-Login
+and template caching on top of it; CLI tools such as seed_data.py use the
+bare app so they never import routes, forms or templates.
+"""
+import os
+from flask import Flask
+from models import db, bcrypt
+
+
+def create_app(config=None):
+    """Create a Flask app with configuration and core extensions"""
+    app = Flask(__name__)
+
+    # Configuration
+    app.config['SECRET_KEY'] = 'tigerstudy-secret-key-2025'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///study_groups.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['TEMPLATE_BYTECODE_CACHE_DIR'] = os.path.join(app.instance_path, 'jinja_cache')
+    app.config['TEMPLATE_WARMUP'] = True
+    app.config['STREAM_TEMPLATES'] = True
+    app.config['DEFAULT_TENANT'] = os.environ.get('DEFAULT_TENANT', 'princeton')  # Serves hosts with no tenant of their own
+    app.config['RATELIMIT_ENABLED'] = True
+    app.config['RATELIMIT_STORAGE_URL'] = os.environ.get('RATELIMIT_STORAGE_URL', 'memory://')
+    app.config['PRESENCE_STORAGE_URL'] = os.environ.get('PRESENCE_STORAGE_URL', 'memory://')
+    app.config['ACTIVITY_FLUSH_INTERVAL'] = int(os.environ.get('ACTIVITY_FLUSH_INTERVAL', 30))  # Seconds; 0 flushes only at exit
+    app.config['TRENDING_PERSIST_INTERVAL'] = int(os.environ.get('TRENDING_PERSIST_INTERVAL', 60))  # Seconds; 0 writes only at exit
+    app.config['PROFILER_TOKEN'] = os.environ.get('PROFILER_TOKEN')  # Unset disables the request profiler and its endpoints
+    app.config['PROFILER_SAMPLE_RATE'] = float(os.environ.get('PROFILER_SAMPLE_RATE', 0))  # Fraction of requests profiled without asking
+
+    if config:
+        app.config.update(config)
+
+    # Initialize database
+    db.init_app(app)
+
+    # Initialize Bcrypt
+    bcrypt.init_app(app)
+
+    return app
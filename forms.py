@@ -1,10 +1,12 @@
 """
 Flask-WTF forms for Princeton Study Group Finder with Authentication
 """
+from flask import g
 from flask_wtf import FlaskForm
 from wtforms import StringField, TextAreaField, DateTimeLocalField, SelectField, PasswordField, BooleanField, HiddenField, IntegerField
-from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError, Regexp, NumberRange
-from models import User
+from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError, Regexp, NumberRange, Optional
+from wtforms.widgets import HiddenInput
+from models import User, MAX_DURATION_MINUTES
 
 
 class RegistrationForm(FlaskForm):
@@ -69,17 +71,17 @@ class RegistrationForm(FlaskForm):
     )
 
     def validate_email(self, field):
-        """Validate that email ends with @princeton.edu and is unique"""
-        if not field.data.endswith('@princeton.edu'):
-            raise ValidationError('Must be a Princeton email address (@princeton.edu)')
+        """Validate that email is on the campus domain and is unique on the campus"""
+        if not field.data.lower().endswith(f'@{g.tenant.email_domain}'):
+            raise ValidationError(f'Must be a {g.tenant.short_name} email address (@{g.tenant.email_domain})')
 
-        user = User.query.filter_by(email=field.data.lower()).first()
+        user = User.query.filter_by(tenant_id=g.tenant.id, email=field.data.lower()).first()
         if user:
             raise ValidationError('Email already registered. Please log in.')
 
     def validate_username(self, field):
-        """Validate that username is unique"""
-        user = User.query.filter_by(username=field.data.lower()).first()
+        """Validate that username is unique on the campus"""
+        user = User.query.filter_by(tenant_id=g.tenant.id, username=field.data.lower()).first()
         if user:
             raise ValidationError('Username already taken. Please choose another.')
 
@@ -171,6 +173,21 @@ class CreateStudyGroupForm(FlaskForm):
         render_kw={'placeholder': 'Select date and time'}
     )
 
+    duration_minutes = SelectField(
+        'Duration',
+        choices=[
+            (30, '30 minutes'),
+            (60, '1 hour'),
+            (90, '1.5 hours'),
+            (120, '2 hours'),
+            (180, '3 hours'),
+            (MAX_DURATION_MINUTES, f'{MAX_DURATION_MINUTES // 60} hours')
+        ],
+        coerce=int,
+        default=60,
+        validators=[DataRequired()]
+    )
+
     location = StringField(
         'Location',
         validators=[
@@ -233,6 +250,9 @@ class CreateDiscussionPostForm(FlaskForm):
         render_kw={'placeholder': 'Share your question, tip, or resource...', 'rows': 8}
     )
 
+    # Set by the "Post anyway" button shown next to likely duplicates
+    post_anyway = BooleanField('Post anyway')
+
 
 class CreateDiscussionReplyForm(FlaskForm):
     """Form for replying to a discussion post"""
@@ -244,6 +264,7 @@ class CreateDiscussionReplyForm(FlaskForm):
         ],
         render_kw={'placeholder': 'Write your reply...', 'rows': 4}
     )
+    parent_id = IntegerField('Replying To', validators=[Optional()], widget=HiddenInput())
 
 
 class VoteForm(FlaskForm):
@@ -256,6 +277,12 @@ class VoteForm(FlaskForm):
     )
 
 
+class PresenceForm(FlaskForm):
+    """Form for chat presence heartbeats (sent by the chat page's script)"""
+    typing = BooleanField('Typing')
+    leaving = BooleanField('Leaving')
+
+
 class ChatMessageForm(FlaskForm):
     """Form for sending chat messages in study groups"""
     content = TextAreaField(
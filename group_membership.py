@@ -0,0 +1,186 @@
+"""
+Race-free study group membership for TigerStudy
+
+Seats are claimed with a single conditional UPDATE against the stored
+participant_count, so concurrent joins can never push a group past
+max_participants. The unique (group, user) constraints on participants and
+waitlist entries turn duplicate joins into integrity errors instead of
+duplicate rows. When a participant leaves, the oldest waitlist entry is
+promoted into the freed seat inside the same transaction. Hosts hear about
+new members and promoted users hear about their seat through their inbox.
+Waitlisted users whose schedule clashes with the group are passed over (they
+keep their place) rather than promoted into a double booking.
+"""
+from datetime import datetime
+from sqlalchemy import update, delete, insert
+from sqlalchemy.exc import IntegrityError
+from models import db, StudyGroup, Participant, WaitlistEntry, Notification
+import http_cache
+import notifications
+import profile_activity
+import schedule
+
+# Outcomes returned by join_group / leave_group / release_seat
+JOINED = 'joined'
+ALREADY_JOINED = 'already_joined'
+WAITLISTED = 'waitlisted'
+ALREADY_WAITLISTED = 'already_waitlisted'
+LEFT = 'left'
+LEFT_WAITLIST = 'left_waitlist'
+NOT_A_MEMBER = 'not_a_member'
+
+
+def _has_seat(group_id, user_id):
+    """Check if a user already holds a seat in the group"""
+    return db.session.query(Participant.id).filter_by(
+        study_group_id=group_id, user_id=user_id
+    ).first() is not None
+
+
+def join_group(study_group, user_id):
+    """Claim a seat in a study group, queueing on the waitlist when it is full"""
+    group_id = study_group.id
+    host_id = study_group.host_id
+    course_id = study_group.course_id
+    tenant_id = study_group.course.tenant_id
+    title = study_group.title
+
+    # Conditional increment: only succeeds while a seat is free
+    claimed = db.session.execute(
+        update(StudyGroup)
+        .where(
+            StudyGroup.id == group_id,
+            db.or_(
+                StudyGroup.max_participants == -1,
+                StudyGroup.participant_count < StudyGroup.max_participants
+            )
+        )
+        .values(participant_count=StudyGroup.participant_count + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    if claimed:
+        try:
+            db.session.execute(insert(Participant).values(
+                study_group_id=group_id, user_id=user_id, joined_at=datetime.now()
+            ))
+            db.session.commit()
+            profile_activity.invalidate(user_id, host_id)
+            http_cache.bump_course(course_id, tenant_id)
+            notifications.notify(Notification.GROUP_JOIN, [host_id], group_id, title, actor_id=user_id)
+            return JOINED
+        except IntegrityError:
+            # Already a participant - rolling back also releases the claimed seat
+            db.session.rollback()
+            return ALREADY_JOINED
+
+    # No seat available: members keep their seat, everyone else joins the queue
+    if _has_seat(group_id, user_id):
+        db.session.rollback()
+        return ALREADY_JOINED
+
+    try:
+        db.session.execute(insert(WaitlistEntry).values(
+            study_group_id=group_id, user_id=user_id, created_at=datetime.now()
+        ))
+        db.session.commit()
+        http_cache.bump_course(course_id, tenant_id)
+        return WAITLISTED
+    except IntegrityError:
+        db.session.rollback()
+        return ALREADY_WAITLISTED
+
+
+def _promote_next(group_id, start, end):
+    """Move the oldest eligible waitlisted user into a freed seat (returns their user id)"""
+    last_entry_id = 0
+    while True:
+        entry = db.session.query(WaitlistEntry.id, WaitlistEntry.user_id).filter(
+            WaitlistEntry.study_group_id == group_id,
+            WaitlistEntry.id > last_entry_id
+        ).order_by(WaitlistEntry.id).first()
+
+        if entry is None:
+            return None
+        last_entry_id = entry.id
+
+        # Same check as joining: a user already booked at that time stays queued
+        if schedule.find_user_conflicts(entry.user_id, start, end, exclude_group_id=group_id):
+            continue
+
+        # Another worker may have promoted this entry first; try the next one
+        removed = db.session.execute(
+            delete(WaitlistEntry).where(WaitlistEntry.id == entry.id)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+        if removed:
+            # A savepoint keeps a user who somehow already holds a seat from aborting the leave
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(Participant).values(
+                        study_group_id=group_id, user_id=entry.user_id, joined_at=datetime.now()
+                    ))
+            except IntegrityError:
+                continue
+            return entry.user_id
+
+
+def release_seat(study_group, user_id):
+    """Remove a user's seat or waitlist place and back-fill the seat, without committing
+
+    Returns (outcome, promoted user id or None). Callers commit, so several groups can be
+    left in one transaction.
+    """
+    group_id = study_group.id
+
+    removed = db.session.execute(
+        delete(Participant).where(
+            Participant.study_group_id == group_id,
+            Participant.user_id == user_id
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+
+    if not removed:
+        dequeued = db.session.execute(
+            delete(WaitlistEntry).where(
+                WaitlistEntry.study_group_id == group_id,
+                WaitlistEntry.user_id == user_id
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        return (LEFT_WAITLIST if dequeued else NOT_A_MEMBER), None
+
+    # The freed seat either goes straight to the next in line or is released
+    promoted_user_id = _promote_next(group_id, study_group.date_time, study_group.end_time())
+    if promoted_user_id is None:
+        db.session.execute(
+            update(StudyGroup)
+            .where(StudyGroup.id == group_id)
+            .values(participant_count=StudyGroup.participant_count - 1)
+            .execution_options(synchronize_session=False)
+        )
+    return LEFT, promoted_user_id
+
+
+def leave_group(study_group, user_id):
+    """Give up a seat (or a waitlist place) and back-fill the seat from the waitlist"""
+    group_id = study_group.id
+    host_id = study_group.host_id
+    course_id = study_group.course_id
+    tenant_id = study_group.course.tenant_id
+    title = study_group.title
+
+    outcome, promoted_user_id = release_seat(study_group, user_id)
+    db.session.commit()
+
+    if outcome == NOT_A_MEMBER:
+        return outcome
+    http_cache.bump_course(course_id, tenant_id)
+    if outcome == LEFT_WAITLIST:
+        return outcome
+
+    profile_activity.invalidate(user_id, host_id)
+    if promoted_user_id is not None:
+        profile_activity.invalidate(promoted_user_id)
+        notifications.notify(Notification.WAITLIST_PROMOTED, [promoted_user_id], group_id, title)
+    return outcome
@@ -0,0 +1,185 @@
+"""
+HTTP caching for TigerStudy's public pages
+
+Each public page is tied to a few version counters in content_versions:
+course pages to 'course:<id>', discussion threads to 'post:<id>', public
+profiles to 'user:<id>', and a campus's course list to 'site:<tenant id>'. Write paths bump
+the counters they affect (bump_course, bump_post, bump_users), so a page's
+ETag changes exactly when its content does.
+
+For anonymous visitors, @conditional() reads the counters (one indexed
+lookup) and answers If-None-Match / If-Modified-Since with 304 before the
+view runs. Full responses are marked publicly cacheable with Vary: Cookie
+so a fronting cache can serve them to other anonymous visitors. Logged-in
+responses stay private, since they show per-user state.
+
+Pages also print relative times ("Today at ...", "5 minutes ago"), so
+validators roll over every VALIDATOR_WINDOW_SECONDS even without writes.
+"""
+import hashlib
+import time
+from datetime import datetime
+from functools import wraps
+from flask import request, session, make_response
+from flask_login import current_user
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from models import db, Course, User, ContentVersion
+import tenancy
+
+# Validators (and Last-Modified) advance at least this often
+VALIDATOR_WINDOW_SECONDS = 300
+
+# How long shared caches and browsers may reuse an anonymous response
+PUBLIC_MAX_AGE = 60
+
+
+def site_key(tenant_id):
+    """Version key for a campus's course list"""
+    return f'site:{tenant_id}'
+
+
+def course_key(course_id):
+    """Version key for a course's study group and discussion pages"""
+    return f'course:{course_id}'
+
+
+def post_key(post_id):
+    """Version key for a discussion thread"""
+    return f'post:{post_id}'
+
+
+def user_key(user_id):
+    """Version key for a public profile"""
+    return f'user:{user_id}'
+
+
+def bump(*keys):
+    """Advance version counters (creating them on first use)"""
+    if not keys:
+        return
+    now = datetime.now()
+    statement = insert(ContentVersion).values([dict(key=key, version=1, updated_at=now) for key in set(keys)])
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[ContentVersion.key],
+        set_=dict(version=ContentVersion.version + 1, updated_at=now)
+    ))
+    db.session.commit()
+
+
+def bump_course(course_id, tenant_id):
+    """Mark a course's group and discussion pages (and its campus's course list) changed"""
+    bump(course_key(course_id), site_key(tenant_id))
+
+
+def bump_post(post_id, course_id=None, tenant_id=None):
+    """Mark a discussion thread (and optionally its course board) changed"""
+    if course_id is None:
+        bump(post_key(post_id))
+    else:
+        bump(post_key(post_id), course_key(course_id), site_key(tenant_id))
+
+
+def bump_users(*user_ids):
+    """Mark users' public profiles changed"""
+    bump(*(user_key(user_id) for user_id in user_ids))
+
+
+def site_page_keys():
+    """Version keys for the course list"""
+    return [site_key(tenancy.current_tenant_id())]
+
+
+def course_page_keys(course_code):
+    """Version keys for a course page (None if the course does not exist)"""
+    course_id = db.session.execute(select(Course.id).where(
+        Course.tenant_id == tenancy.current_tenant_id(),
+        Course.code == course_code.upper()
+    )).scalar()
+    return None if course_id is None else [course_key(course_id)]
+
+
+def post_page_keys(post_id):
+    """Version keys for a discussion thread"""
+    return [post_key(post_id)]
+
+
+def profile_page_keys(username):
+    """Version keys for a public profile (None if the user does not exist)"""
+    user_id = db.session.execute(select(User.id).where(
+        User.tenant_id == tenancy.current_tenant_id(),
+        User.username == username
+    )).scalar()
+    return None if user_id is None else [user_key(user_id)]
+
+
+def _validators(keys):
+    """Build the (ETag, Last-Modified) pair for the current request"""
+    rows = db.session.execute(
+        select(ContentVersion.key, ContentVersion.version, ContentVersion.updated_at)
+        .where(ContentVersion.key.in_(keys))
+    ).all()
+    versions = {row.key: row.version for row in rows}
+
+    window_start = int(time.time()) // VALIDATOR_WINDOW_SECONDS * VALIDATOR_WINDOW_SECONDS
+    last_modified = max([datetime.fromtimestamp(window_start)] + [row.updated_at for row in rows])
+
+    fingerprint = '|'.join([request.host, request.full_path, str(window_start)] +
+                           [f'{key}={versions.get(key, 0)}' for key in sorted(keys)])
+    etag = hashlib.sha1(fingerprint.encode()).hexdigest()[:20]
+    return etag, last_modified.replace(microsecond=0)
+
+
+def _not_modified(etag, last_modified):
+    """Check the request's validators against the current ones"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since:
+        return last_modified.astimezone() <= request.if_modified_since
+    return False
+
+
+def _is_cacheable():
+    """Check if the response is the same for every anonymous visitor"""
+    return request.method in ('GET', 'HEAD') and not current_user.is_authenticated and '_flashes' not in session
+
+
+def conditional(resolve_keys):
+    """Decorator adding validators to a public view
+
+    resolve_keys(**view_args) returns the version keys the page depends on,
+    or None when the view should handle the request itself (e.g. a 404).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if not _is_cacheable():
+                response = make_response(view(*args, **kwargs))
+                response.headers['Cache-Control'] = 'private, no-cache'
+                response.vary.add('Cookie')
+                return response
+
+            keys = resolve_keys(**kwargs)
+            if keys is None:
+                return view(*args, **kwargs)
+
+            etag, last_modified = _validators(keys)
+            if _not_modified(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                # Rendering that touched the session (e.g. a CSRF token) is per visitor
+                if session.modified:
+                    response.headers['Cache-Control'] = 'private, no-cache'
+                    response.vary.add('Cookie')
+                    return response
+                response.last_modified = last_modified.astimezone()
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = f'public, max-age={PUBLIC_MAX_AGE}'
+            response.vary.add('Cookie')
+            return response
+        return wrapped
+    return decorator
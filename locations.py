@@ -0,0 +1,126 @@
+"""
+Study group location classification for TigerStudy
+
+A study group's free-text location is classified once, when the group is
+created: `is_virtual` is set for online meetings (Zoom, Teams, Google Meet,
+meeting links, ...) and `building_id` points at the campus building the
+text names. Both are stored on the study group and indexed with course_id
+and date_time, so the course page's in-person / virtual filter is an index
+range scan instead of ILIKE scans over every location.
+
+To recognize a new meeting service, add it to VIRTUAL_KEYWORDS (or to
+STANDALONE_VIRTUAL_KEYWORDS if its name is also an everyday word); to add a
+building, run `flask add-building`. Either way, `flask classify-locations`
+re-classifies existing groups.
+
+Each process caches a campus's building matchers together with the
+'buildings:<tenant id>' counter in content_versions. Adding a building bumps
+the counter (see buildings_changed()), and every worker compares it (one
+primary-key read) before trusting its cache, so running workers pick up new
+buildings without a restart.
+"""
+import re
+import threading
+from sqlalchemy import select
+from models import db, Building, StudyGroup, Course, ContentVersion, normalize_location
+import http_cache
+
+# Words (matched whole, case-insensitively) that mark a location as online
+VIRTUAL_KEYWORDS = (
+    'virtual', 'online', 'remote', 'zoom', 'teams', 'google meet', 'meet.google.com',
+    'webex', 'discord', 'skype', 'facetime', 'gather.town',
+)
+
+# Words that mark a location as online only when they are the whole location: "Meet" alone
+# is Google Meet, but "Meet at Frist" is a room
+STANDALONE_VIRTUAL_KEYWORDS = ('meet',)
+
+_VIRTUAL_PATTERN = re.compile(
+    r'https?://|(?<![a-z0-9])(?:' + '|'.join(re.escape(keyword) for keyword in VIRTUAL_KEYWORDS) + r')(?![a-z0-9])'
+    r'|^[^a-z0-9]*(?:' + '|'.join(re.escape(keyword) for keyword in STANDALONE_VIRTUAL_KEYWORDS) + r')[^a-z0-9]*$'
+)
+
+_buildings_by_tenant = {}  # tenant_id -> (buildings version, matchers)
+_buildings_lock = threading.Lock()
+
+
+def is_virtual_location(location):
+    """Check if a location is an online meeting rather than a room"""
+    return _VIRTUAL_PATTERN.search(location.lower()) is not None
+
+
+def buildings_key(tenant_id):
+    """Version key for a campus's buildings"""
+    return f'buildings:{tenant_id}'
+
+
+def _buildings_version(tenant_id):
+    """Get the stored version of a campus's buildings (0 if they never changed)"""
+    return db.session.execute(
+        select(ContentVersion.version).where(ContentVersion.key == buildings_key(tenant_id))
+    ).scalar() or 0
+
+
+def _building_patterns(tenant_id):
+    """Get a campus's (pattern, building_id) matchers, longest names first (cached)"""
+    version = _buildings_version(tenant_id)
+    with _buildings_lock:
+        cached = _buildings_by_tenant.get(tenant_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    names = []
+    for building in Building.query.filter_by(tenant_id=tenant_id).all():
+        for name in building.match_names():
+            names.append((name, building.id))
+    names.sort(key=lambda item: len(item[0]), reverse=True)
+    patterns = [
+        (re.compile(r'(?<![a-z0-9])' + re.escape(name) + r'(?![a-z0-9])'), building_id)
+        for name, building_id in names
+    ]
+
+    with _buildings_lock:
+        _buildings_by_tenant[tenant_id] = (version, patterns)
+    return patterns
+
+
+def clear_cache():
+    """Forget this process's loaded buildings"""
+    with _buildings_lock:
+        _buildings_by_tenant.clear()
+
+
+def buildings_changed(tenant_id):
+    """Make every process reload a campus's buildings (call after adding or editing them)"""
+    http_cache.bump(buildings_key(tenant_id))
+    clear_cache()
+
+
+def find_building_id(tenant_id, location):
+    """Get the id of the campus building a location names (None if unknown)"""
+    location = normalize_location(location)
+    for pattern, building_id in _building_patterns(tenant_id):
+        if pattern.search(location):
+            return building_id
+    return None
+
+
+def classify(tenant_id, location):
+    """Classify a location (returns is_virtual, building_id)"""
+    if is_virtual_location(location):
+        return True, None
+    return False, find_building_id(tenant_id, location)
+
+
+def reclassify_all():
+    """Re-run the classifier over every study group (returns the number changed)"""
+    changed = 0
+    rows = db.session.query(StudyGroup, Course.tenant_id).join(Course, StudyGroup.course_id == Course.id)
+    for study_group, tenant_id in rows.all():
+        is_virtual, building_id = classify(tenant_id, study_group.location)
+        if (study_group.is_virtual, study_group.building_id) != (is_virtual, building_id):
+            study_group.is_virtual = is_virtual
+            study_group.building_id = building_id
+            changed += 1
+    db.session.commit()
+    return changed
@@ -4,33 +4,127 @@ Database models for Princeton Study Group Finder with User Authentication
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from flask_bcrypt import Bcrypt
-from datetime import datetime
+from datetime import datetime, timedelta
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm.attributes import set_committed_value
+import content_render
 
 db = SQLAlchemy()
 bcrypt = Bcrypt()
 
 
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """Turn on foreign key enforcement (and ON DELETE rules) for every SQLite connection"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+# Longest allowed study group session; bounds interval lookups in schedule.py
+MAX_DURATION_MINUTES = 240
+
+
+def normalize_location(location):
+    """Normalize a location for room matching (case and spacing insensitive)"""
+    return ' '.join(location.lower().split())
+
+
+def _location_key_default(context):
+    """Derive location_key from the location being inserted"""
+    return normalize_location(context.get_current_parameters()['location'])
+
+
+def _last_activity_default(context):
+    """Start a post's last activity at its creation time"""
+    return context.get_current_parameters().get('created_at') or datetime.now()
+
+
+class Tenant(db.Model):
+    """Model for a campus served by this deployment (resolved from the request hostname)"""
+    __tablename__ = 'tenants'
+
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(50), unique=True, nullable=False)
+    hostname = db.Column(db.String(255), unique=True, nullable=False)
+    name = db.Column(db.String(120), nullable=False)  # e.g. "Princeton University"
+    short_name = db.Column(db.String(50), nullable=False)  # e.g. "Princeton"
+    app_name = db.Column(db.String(50), nullable=False, default='TigerStudy')
+    email_domain = db.Column(db.String(120), nullable=False)  # e.g. "princeton.edu"
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f'<Tenant {self.slug}>'
+
+
+class Building(db.Model):
+    """Model for a campus building that study group locations are matched against"""
+    __tablename__ = 'buildings'
+
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    aliases = db.Column(db.String(300), nullable=False, default='')  # Comma-separated other names, e.g. "Frist"
+
+    __table_args__ = (
+        db.UniqueConstraint('tenant_id', 'name', name='_tenant_building_uc'),
+    )
+
+    def __repr__(self):
+        return f'<Building {self.name}>'
+
+    def match_names(self):
+        """Get the normalized names a location can use for this building"""
+        names = [self.name] + [alias for alias in self.aliases.split(',') if alias.strip()]
+        return [normalize_location(name) for name in names]
+
+
 class User(UserMixin, db.Model):
     """Model for registered users"""
     __tablename__ = 'users'
 
     id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    username = db.Column(db.String(20), unique=True, nullable=False)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=False)
+    email = db.Column(db.String(120), nullable=False)
+    username = db.Column(db.String(20), nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
     full_name = db.Column(db.String(100), nullable=False)
     class_year = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.now)
-    last_login = db.Column(db.DateTime)
+    last_login = db.Column(db.DateTime)  # Written in bulk by activity_tracker, may lag a flush interval
+    last_seen = db.Column(db.DateTime)
+    unread_notifications = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Kept in step with unread inbox rows
 
     # Relationships
-    hosted_study_groups = db.relationship('StudyGroup', backref='host', lazy=True, foreign_keys='StudyGroup.host_id')
-    participations = db.relationship('Participant', backref='user', lazy=True, cascade='all, delete-orphan')
-    discussion_posts = db.relationship('DiscussionPost', backref='author', lazy=True, cascade='all, delete-orphan')
-    discussion_replies = db.relationship('DiscussionReply', backref='author', lazy=True, cascade='all, delete-orphan')
-    post_votes = db.relationship('PostVote', backref='user', lazy=True, cascade='all, delete-orphan')
-    reply_votes = db.relationship('ReplyVote', backref='user', lazy=True, cascade='all, delete-orphan')
-    chat_messages = db.relationship('ChatMessage', backref='author', lazy=True, cascade='all, delete-orphan')
+    hosted_study_groups = db.relationship('StudyGroup', backref='host', lazy=True, foreign_keys='StudyGroup.host_id',
+                                          cascade='all, delete-orphan', passive_deletes=True)
+    participations = db.relationship('Participant', backref='user', lazy=True,
+                                     cascade='all, delete-orphan', passive_deletes=True)
+    discussion_posts = db.relationship('DiscussionPost', backref='author', lazy=True,
+                                       cascade='all, delete-orphan', passive_deletes=True)
+    discussion_replies = db.relationship('DiscussionReply', backref='author', lazy=True,
+                                         cascade='all, delete-orphan', passive_deletes=True)
+    post_votes = db.relationship('PostVote', backref='user', lazy=True,
+                                 cascade='all, delete-orphan', passive_deletes=True)
+    reply_votes = db.relationship('ReplyVote', backref='user', lazy=True,
+                                  cascade='all, delete-orphan', passive_deletes=True)
+    chat_messages = db.relationship('ChatMessage', backref='author', lazy=True,
+                                    cascade='all, delete-orphan', passive_deletes=True)
+    waitlist_entries = db.relationship('WaitlistEntry', backref='user', lazy=True,
+                                       cascade='all, delete-orphan', passive_deletes=True)
+    group_recommendations = db.relationship('GroupRecommendation', backref='user', lazy=True,
+                                            cascade='all, delete-orphan', passive_deletes=True)
+    notifications = db.relationship('Notification', backref='user', lazy=True,
+                                    cascade='all, delete-orphan', passive_deletes=True,
+                                    foreign_keys='Notification.user_id')
+
+    # Usernames and emails are unique within a campus
+    __table_args__ = (
+        db.UniqueConstraint('tenant_id', 'email', name='_tenant_email_uc'),
+        db.UniqueConstraint('tenant_id', 'username', name='_tenant_username_uc'),
+    )
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -49,8 +143,9 @@ class User(UserMixin, db.Model):
 
     def get_study_groups_joined(self):
         """Get study groups this user has joined (including as host)"""
-        group_ids = [p.study_group_id for p in self.participations]
-        return StudyGroup.query.filter(StudyGroup.id.in_(group_ids)).order_by(StudyGroup.date_time.desc()).all() if group_ids else []
+        return StudyGroup.query.join(Participant, Participant.study_group_id == StudyGroup.id).filter(
+            Participant.user_id == self.id
+        ).order_by(StudyGroup.date_time.desc()).all()
 
     def get_discussion_posts_created(self):
         """Get discussion posts created by this user"""
@@ -58,7 +153,7 @@ class User(UserMixin, db.Model):
 
     def total_replies_count(self):
         """Count total replies made by user"""
-        return len(self.discussion_replies)
+        return DiscussionReply.query.filter_by(author_id=self.id).count()
 
     def total_karma(self):
         """Calculate total karma (sum of all post and reply scores)"""
@@ -74,19 +169,30 @@ class User(UserMixin, db.Model):
         """Get user's highest-scored replies"""
         return DiscussionReply.query.filter_by(author_id=self.id).order_by(DiscussionReply.score.desc()).limit(limit).all()
 
+    def last_active(self):
+        """Get when the user was last seen, including activity not yet flushed"""
+        import activity_tracker
+        return activity_tracker.pending_last_seen(self.id) or self.last_seen or self.last_login
+
 
 class Course(db.Model):
-    """Model for Princeton courses"""
+    """Model for a campus's courses"""
     __tablename__ = 'courses'
 
     id = db.Column(db.Integer, primary_key=True)
-    code = db.Column(db.String(20), unique=True, nullable=False)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=False)
+    code = db.Column(db.String(20), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
 
     # Relationships
-    study_groups = db.relationship('StudyGroup', backref='course', lazy=True, cascade='all, delete-orphan')
-    discussion_posts = db.relationship('DiscussionPost', backref='course', lazy=True, cascade='all, delete-orphan')
+    study_groups = db.relationship('StudyGroup', backref='course', lazy=True,
+                                   cascade='all, delete-orphan', passive_deletes=True)
+    discussion_posts = db.relationship('DiscussionPost', backref='course', lazy=True,
+                                       cascade='all, delete-orphan', passive_deletes=True)
+
+    # Course codes are unique within a campus
+    __table_args__ = (db.UniqueConstraint('tenant_id', 'code', name='_tenant_course_code_uc'),)
 
     def __repr__(self):
         return f'<Course {self.code}: {self.title}>'
@@ -110,31 +216,59 @@ class StudyGroup(db.Model):
     __tablename__ = 'study_groups'
 
     id = db.Column(db.Integer, primary_key=True)
-    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False)
-    host_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id', ondelete='CASCADE'), nullable=False)
+    host_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
     date_time = db.Column(db.DateTime, nullable=False)
+    duration_minutes = db.Column(db.Integer, nullable=False, default=60, server_default='60')
     location = db.Column(db.String(200), nullable=False)
+    location_key = db.Column(db.String(200), nullable=False, default=_location_key_default)  # normalize_location(location)
+    is_virtual = db.Column(db.Boolean, nullable=False, default=False, server_default='0')  # Set by locations.classify()
+    building_id = db.Column(db.Integer, db.ForeignKey('buildings.id', ondelete='SET NULL'))
     max_participants = db.Column(db.Integer, nullable=False)  # -1 for unlimited
+    participant_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Seats taken, kept in step with participants
     created_at = db.Column(db.DateTime, default=datetime.now)
 
     # Relationships
-    participants = db.relationship('Participant', backref='study_group', lazy=True, cascade='all, delete-orphan')
-    chat_messages = db.relationship('ChatMessage', backref='study_group', lazy=True, cascade='all, delete-orphan')
+    participants = db.relationship('Participant', backref='study_group', lazy=True,
+                                   cascade='all, delete-orphan', passive_deletes=True)
+    chat_messages = db.relationship('ChatMessage', backref='study_group', lazy=True,
+                                    cascade='all, delete-orphan', passive_deletes=True)
+    waitlist_entries = db.relationship('WaitlistEntry', backref='study_group', lazy=True,
+                                       cascade='all, delete-orphan', passive_deletes=True,
+                                       order_by='WaitlistEntry.id')
+    recommendations = db.relationship('GroupRecommendation', backref='study_group', lazy=True,
+                                      cascade='all, delete-orphan', passive_deletes=True)
+    chat_archive_blocks = db.relationship('ChatArchiveBlock', backref='study_group', lazy=True,
+                                          cascade='all, delete-orphan', passive_deletes=True)
+    building = db.relationship('Building', lazy=True)
+
+    # Start-time indexes for interval lookups per course and per room, and the course page's location filter
+    __table_args__ = (
+        db.CheckConstraint(f'duration_minutes > 0 AND duration_minutes <= {MAX_DURATION_MINUTES}',
+                           name='_study_group_duration_ck'),
+        db.Index('ix_study_groups_course_time', 'course_id', 'date_time'),
+        db.Index('ix_study_groups_location_time', 'location_key', 'date_time'),
+        db.Index('ix_study_groups_course_virtual_time', 'course_id', 'is_virtual', 'date_time'),
+    )
 
     def __repr__(self):
         return f'<StudyGroup {self.title}>'
 
+    def end_time(self):
+        """Get when the study group session ends"""
+        return self.date_time + timedelta(minutes=self.duration_minutes)
+
+    def overlaps(self, start, end):
+        """Check if the session overlaps the half-open interval [start, end)"""
+        return self.date_time < end and start < self.end_time()
+
     def is_full(self):
         """Check if the study group is at capacity"""
         if self.max_participants == -1:  # Unlimited
             return False
-        return len(self.participants) >= self.max_participants
-
-    def participant_count(self):
-        """Get current number of participants"""
-        return len(self.participants)
+        return self.participant_count >= self.max_participants
 
     def is_past(self):
         """Check if the study group date has passed"""
@@ -143,8 +277,8 @@ class StudyGroup(db.Model):
     def formatted_capacity(self):
         """Return formatted capacity string"""
         if self.max_participants == -1:
-            return f"{self.participant_count()} participants"
-        return f"{self.participant_count()}/{self.max_participants}"
+            return f"{self.participant_count} participants"
+        return f"{self.participant_count}/{self.max_participants}"
 
     def user_is_participant(self, user_id):
         """Check if a user is already a participant"""
@@ -156,39 +290,93 @@ class Participant(db.Model):
     __tablename__ = 'participants'
 
     id = db.Column(db.Integer, primary_key=True)
-    study_group_id = db.Column(db.Integer, db.ForeignKey('study_groups.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    study_group_id = db.Column(db.Integer, db.ForeignKey('study_groups.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     joined_at = db.Column(db.DateTime, default=datetime.now)
 
+    # Unique constraint: a user holds at most one seat per group
+    __table_args__ = (
+        db.UniqueConstraint('study_group_id', 'user_id', name='_group_user_participant_uc'),
+        db.Index('ix_participants_user', 'user_id'),
+    )
+
     def __repr__(self):
         return f'<Participant {self.user.username}>'
 
 
+class WaitlistEntry(db.Model):
+    """Model for users queued for a seat in a full study group"""
+    __tablename__ = 'waitlist_entries'
+
+    id = db.Column(db.Integer, primary_key=True)
+    study_group_id = db.Column(db.Integer, db.ForeignKey('study_groups.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    # Unique constraint: one place in line per user per group
+    __table_args__ = (db.UniqueConstraint('study_group_id', 'user_id', name='_group_user_waitlist_uc'),)
+
+    def __repr__(self):
+        return f'<WaitlistEntry user={self.user_id} group={self.study_group_id}>'
+
+
+class GroupRecommendation(db.Model):
+    """Model for precomputed study group recommendations (see recommendations.py)"""
+    __tablename__ = 'group_recommendations'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    study_group_id = db.Column(db.Integer, db.ForeignKey('study_groups.id', ondelete='CASCADE'), nullable=False)
+    rank = db.Column(db.Integer, nullable=False)  # 1 = best match
+    score = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.now)
+
+    # The feed reads a user's rows in rank order straight off this index
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'study_group_id', name='_user_group_recommendation_uc'),
+        db.Index('ix_group_recommendations_user_rank', 'user_id', 'rank'),
+    )
+
+    def __repr__(self):
+        return f'<GroupRecommendation user={self.user_id} group={self.study_group_id} rank={self.rank}>'
+
+
 class DiscussionPost(db.Model):
     """Model for course discussion posts"""
     __tablename__ = 'discussion_posts'
 
     id = db.Column(db.Integer, primary_key=True)
-    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False)
-    author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id', ondelete='CASCADE'), nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    content_html = db.Column(db.Text)  # content rendered by content_render, see render_version
+    render_version = db.Column(db.String(20))
     category = db.Column(db.String(50), nullable=False, default='General')
     pinned = db.Column(db.Boolean, default=False)
     score = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    # Kept in step with discussion_replies by the DiscussionReply insert/delete hooks below
+    reply_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_activity_at = db.Column(db.DateTime, nullable=False, default=_last_activity_default)
 
     # Relationships
-    replies = db.relationship('DiscussionReply', backref='post', lazy=True, cascade='all, delete-orphan')
-    votes = db.relationship('PostVote', backref='post', lazy=True, cascade='all, delete-orphan')
+    replies = db.relationship('DiscussionReply', backref='post', lazy=True,
+                              cascade='all, delete-orphan', passive_deletes=True)
+    votes = db.relationship('PostVote', backref='post', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+
+    # Serves the board's "active" sort straight from the index
+    __table_args__ = (
+        db.Index('ix_discussion_posts_course_active', 'course_id', 'pinned', 'last_activity_at'),
+    )
 
     def __repr__(self):
         return f'<DiscussionPost {self.title}>'
 
-    def reply_count(self):
-        """Get number of replies"""
-        return len(self.replies)
+    def rendered_content(self):
+        """Get the content as sanitized HTML (stored at write time)"""
+        return content_render.stored_or_render(self.content, self.content_html, self.render_version)
 
     def preview_content(self, length=150):
         """Return preview of content"""
@@ -235,18 +423,36 @@ class DiscussionReply(db.Model):
     __tablename__ = 'discussion_replies'
 
     id = db.Column(db.Integer, primary_key=True)
-    post_id = db.Column(db.Integer, db.ForeignKey('discussion_posts.id'), nullable=False)
-    author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('discussion_posts.id', ondelete='CASCADE'), nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    content_html = db.Column(db.Text)
+    render_version = db.Column(db.String(20))
     score = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.now)
+    # Threading: path is the chain of zero-padded ancestor ids ending with this reply's own,
+    # e.g. "0000000012/0000000040/", so a subtree is one range scan on (post_id, path)
+    parent_id = db.Column(db.Integer, db.ForeignKey('discussion_replies.id', ondelete='CASCADE'))
+    path = db.Column(db.String(400), nullable=False, default='', server_default='')  # Filled in by _place_reply
+    depth = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    child_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Direct replies
 
     # Relationships
-    votes = db.relationship('ReplyVote', backref='reply', lazy=True, cascade='all, delete-orphan')
+    votes = db.relationship('ReplyVote', backref='reply', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    children = db.relationship('DiscussionReply', backref=db.backref('parent', remote_side=[id]),
+                               lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_discussion_replies_post_path', 'post_id', 'path'),
+    )
 
     def __repr__(self):
         return f'<DiscussionReply by {self.author.username}>'
 
+    def rendered_content(self):
+        """Get the content as sanitized HTML (stored at write time)"""
+        return content_render.stored_or_render(self.content, self.content_html, self.render_version)
+
     def time_ago(self):
         """Return human-readable time ago"""
         now = datetime.now()
@@ -276,13 +482,63 @@ class DiscussionReply(db.Model):
         return vote.vote_type if vote else None
 
 
+def reply_path_segment(reply_id):
+    """Path segment for one reply (fixed width so paths sort like the tree)"""
+    return f'{reply_id:010d}/'
+
+
+@event.listens_for(DiscussionReply, 'after_insert')
+def _place_reply(mapper, connection, reply):
+    """Store the new reply's path and depth under its parent"""
+    replies = DiscussionReply.__table__
+    path, depth = '', 0
+    if reply.parent_id is not None:
+        path, depth = connection.execute(
+            db.select(replies.c.path, replies.c.depth + 1).where(replies.c.id == reply.parent_id)
+        ).one()
+        connection.execute(replies.update().where(replies.c.id == reply.parent_id).values(
+            child_count=replies.c.child_count + 1
+        ))
+    path += reply_path_segment(reply.id)
+    connection.execute(replies.update().where(replies.c.id == reply.id).values(path=path, depth=depth))
+    set_committed_value(reply, 'path', path)
+    set_committed_value(reply, 'depth', depth)
+
+
+@event.listens_for(DiscussionReply, 'after_insert')
+def _count_reply(mapper, connection, reply):
+    """Bump the post's reply count and activity time in the reply's own transaction"""
+    posts = DiscussionPost.__table__
+    connection.execute(posts.update().where(posts.c.id == reply.post_id).values(
+        reply_count=posts.c.reply_count + 1,
+        last_activity_at=db.case(
+            (posts.c.last_activity_at < reply.created_at, reply.created_at),
+            else_=posts.c.last_activity_at
+        )
+    ))
+
+
+@event.listens_for(DiscussionReply, 'after_delete')
+def _uncount_reply(mapper, connection, reply):
+    """Drop a deleted reply from the post's and its parent's reply counts"""
+    posts = DiscussionPost.__table__
+    connection.execute(posts.update().where(posts.c.id == reply.post_id).values(
+        reply_count=db.case((posts.c.reply_count > 0, posts.c.reply_count - 1), else_=0)
+    ))
+    if reply.parent_id is not None:
+        replies = DiscussionReply.__table__
+        connection.execute(replies.update().where(replies.c.id == reply.parent_id).values(
+            child_count=db.case((replies.c.child_count > 0, replies.c.child_count - 1), else_=0)
+        ))
+
+
 class PostVote(db.Model):
     """Model for votes on discussion posts"""
     __tablename__ = 'post_votes'
 
     id = db.Column(db.Integer, primary_key=True)
-    post_id = db.Column(db.Integer, db.ForeignKey('discussion_posts.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('discussion_posts.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     vote_type = db.Column(db.Integer, nullable=False)  # 1 for upvote, -1 for downvote
     created_at = db.Column(db.DateTime, default=datetime.now)
 
@@ -292,14 +548,57 @@ class PostVote(db.Model):
     def __repr__(self):
         return f'<PostVote user={self.user_id} post={self.post_id} type={self.vote_type}>'
 
+    @classmethod
+    def votes_by_user(cls, user_id, post_ids):
+        """Get {post_id: vote_type} for a user's votes on a page of posts (one query)"""
+        if not post_ids:
+            return {}
+        return dict(db.session.execute(
+            db.select(cls.post_id, cls.vote_type).where(cls.user_id == user_id, cls.post_id.in_(post_ids))
+        ).all())
+
+
+class PostVoteBucket(db.Model):
+    """Model for a post's net votes in one hour (the trending engine's persisted counters)"""
+    __tablename__ = 'post_vote_buckets'
+
+    post_id = db.Column(db.Integer, db.ForeignKey('discussion_posts.id', ondelete='CASCADE'), primary_key=True)
+    hour = db.Column(db.Integer, primary_key=True)  # Hours since the epoch
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id', ondelete='CASCADE'), nullable=False)
+    votes = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_post_vote_buckets_hour', 'hour'),
+    )
+
+    def __repr__(self):
+        return f'<PostVoteBucket post={self.post_id} hour={self.hour} votes={self.votes}>'
+
+
+class PostSignature(db.Model):
+    """Model for a post's MinHash signature (see near_duplicates.py)"""
+    __tablename__ = 'post_signatures'
+
+    post_id = db.Column(db.Integer, db.ForeignKey('discussion_posts.id', ondelete='CASCADE'), primary_key=True)
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id', ondelete='CASCADE'), nullable=False)
+    signature = db.Column(db.LargeBinary, nullable=False)  # NUM_HASHES unsigned 32-bit minimums
+
+    # Index: a course's signatures in post order, for loading and catching up
+    __table_args__ = (
+        db.Index('ix_post_signatures_course_post', 'course_id', 'post_id'),
+    )
+
+    def __repr__(self):
+        return f'<PostSignature post={self.post_id}>'
+
 
 class ReplyVote(db.Model):
     """Model for votes on discussion replies"""
     __tablename__ = 'reply_votes'
 
     id = db.Column(db.Integer, primary_key=True)
-    reply_id = db.Column(db.Integer, db.ForeignKey('discussion_replies.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    reply_id = db.Column(db.Integer, db.ForeignKey('discussion_replies.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     vote_type = db.Column(db.Integer, nullable=False)  # 1 for upvote, -1 for downvote
     created_at = db.Column(db.DateTime, default=datetime.now)
 
@@ -309,21 +608,36 @@ class ReplyVote(db.Model):
     def __repr__(self):
         return f'<ReplyVote user={self.user_id} reply={self.reply_id} type={self.vote_type}>'
 
+    @classmethod
+    def votes_by_user(cls, user_id, reply_ids):
+        """Get {reply_id: vote_type} for a user's votes on a page of replies (one query)"""
+        if not reply_ids:
+            return {}
+        return dict(db.session.execute(
+            db.select(cls.reply_id, cls.vote_type).where(cls.user_id == user_id, cls.reply_id.in_(reply_ids))
+        ).all())
+
 
 class ChatMessage(db.Model):
     """Model for study group chat messages"""
     __tablename__ = 'chat_messages'
 
     id = db.Column(db.Integer, primary_key=True)
-    study_group_id = db.Column(db.Integer, db.ForeignKey('study_groups.id'), nullable=False)
-    author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    study_group_id = db.Column(db.Integer, db.ForeignKey('study_groups.id', ondelete='CASCADE'), nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    content_html = db.Column(db.Text)
+    render_version = db.Column(db.String(20))
     pinned = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.now)
 
     def __repr__(self):
         return f'<ChatMessage by {self.author.username} in group {self.study_group_id}>'
 
+    def rendered_content(self):
+        """Get the content as sanitized HTML (stored at write time)"""
+        return content_render.stored_or_render(self.content, self.content_html, self.render_version)
+
     def time_ago(self):
         """Return human-readable time ago"""
         now = datetime.now()
@@ -346,3 +660,134 @@ class ChatMessage(db.Model):
             return f"{days} days ago"
         else:
             return self.created_at.strftime('%b %d, %Y at %I:%M %p')
+
+
+class Notification(db.Model):
+    """Model for a user's inbox entry (repeat events on the same target are coalesced)"""
+    __tablename__ = 'notifications'
+
+    # Kinds of events; target_id is a discussion post id or a study group id
+    REPLY = 'reply'
+    POST_VOTE = 'post_vote'
+    REPLY_VOTE = 'reply_vote'
+    CHAT_MESSAGE = 'chat_message'
+    GROUP_JOIN = 'group_join'
+    WAITLIST_PROMOTED = 'waitlist_promoted'
+    POST_KINDS = (REPLY, POST_VOTE, REPLY_VOTE)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    target_id = db.Column(db.Integer, nullable=False)
+    subject = db.Column(db.String(200), nullable=False)  # Post or group title when the event happened
+    actor_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))  # Most recent actor
+    count = db.Column(db.Integer, nullable=False, default=1)  # Events folded into this entry
+    is_read = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now)
+
+    actor = db.relationship('User', foreign_keys=[actor_id])
+
+    # Indexes: unread lookup for coalescing, newest-first inbox listing
+    __table_args__ = (
+        db.Index('ix_notifications_user_unread', 'user_id', 'is_read', 'kind', 'target_id'),
+        db.Index('ix_notifications_user_updated', 'user_id', 'updated_at'),
+    )
+
+    def __repr__(self):
+        return f'<Notification {self.kind} for user {self.user_id}>'
+
+    def message(self):
+        """Return the inbox text for this entry"""
+        actor = self.actor.username if self.actor else 'Someone'
+        if self.kind == self.REPLY:
+            if self.count > 1:
+                return f'{self.count} new replies on your post "{self.subject}"'
+            return f'{actor} replied to your post "{self.subject}"'
+        elif self.kind == self.POST_VOTE:
+            if self.count > 1:
+                return f'{self.count} people upvoted your post "{self.subject}"'
+            return f'{actor} upvoted your post "{self.subject}"'
+        elif self.kind == self.REPLY_VOTE:
+            if self.count > 1:
+                return f'{self.count} upvotes on your replies in "{self.subject}"'
+            return f'{actor} upvoted your reply in "{self.subject}"'
+        elif self.kind == self.CHAT_MESSAGE:
+            if self.count > 1:
+                return f'{self.count} new messages in "{self.subject}"'
+            return f'{actor} sent a message in "{self.subject}"'
+        elif self.kind == self.GROUP_JOIN:
+            if self.count > 1:
+                return f'{self.count} people joined "{self.subject}"'
+            return f'{actor} joined "{self.subject}"'
+        else:
+            return f'A seat opened up: you moved off the waitlist into "{self.subject}"'
+
+    def time_ago(self):
+        """Return human-readable time since the latest event"""
+        seconds = (datetime.now() - self.updated_at).total_seconds()
+
+        if seconds < 60:
+            return "just now"
+        elif seconds < 3600:
+            minutes = int(seconds / 60)
+            return f"{minutes} minute{'s' if minutes != 1 else ''} ago"
+        elif seconds < 86400:
+            hours = int(seconds / 3600)
+            return f"{hours} hour{'s' if hours != 1 else ''} ago"
+        elif seconds < 172800:  # 2 days
+            return "Yesterday"
+        else:
+            days = int(seconds / 86400)
+            return f"{days} days ago"
+
+
+class ContentVersion(db.Model):
+    """Model for a version counter bumped whenever a public page's content changes"""
+    __tablename__ = 'content_versions'
+
+    key = db.Column(db.String(50), primary_key=True)  # e.g. 'course:3', 'post:12', 'user:7', 'site:1'
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    def __repr__(self):
+        return f'<ContentVersion {self.key}={self.version}>'
+
+
+class ChatArchiveBlock(db.Model):
+    """Model for a compressed block of old chat messages (see chat_archive.py)"""
+    __tablename__ = 'chat_archive_blocks'
+
+    id = db.Column(db.Integer, primary_key=True)
+    study_group_id = db.Column(db.Integer, db.ForeignKey('study_groups.id', ondelete='CASCADE'), nullable=False)
+    first_message_id = db.Column(db.Integer, nullable=False)
+    last_message_id = db.Column(db.Integer, nullable=False)
+    first_created_at = db.Column(db.DateTime, nullable=False)
+    last_created_at = db.Column(db.DateTime, nullable=False)
+    message_count = db.Column(db.Integer, nullable=False)
+    codec = db.Column(db.String(10), nullable=False)  # 'zstd' or 'zlib'
+    payload = db.Column(db.LargeBinary, nullable=False)  # Compressed JSON list of messages
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    # Index: newest-first block lookups per group for "load older"
+    __table_args__ = (db.Index('ix_chat_archive_blocks_group_last', 'study_group_id', 'last_message_id'),)
+
+    def __repr__(self):
+        return f'<ChatArchiveBlock group={self.study_group_id} messages={self.message_count}>'
+
+
+def _render_content(mapper, connection, target):
+    """Render new content to HTML as the row is written"""
+    target.content_html = content_render.render(target.content)
+    target.render_version = content_render.RENDERER_VERSION
+
+
+def _rerender_edited_content(mapper, connection, target):
+    """Re-render content that changed since it was loaded"""
+    if db.inspect(target).attrs.content.history.has_changes():
+        _render_content(mapper, connection, target)
+
+
+for _model in (DiscussionPost, DiscussionReply, ChatMessage):
+    event.listen(_model, 'before_insert', _render_content)
+    event.listen(_model, 'before_update', _rerender_edited_content)
@@ -0,0 +1,285 @@
+"""
+Near-duplicate question detection for TigerStudy discussion boards
+
+Each post is reduced to a MinHash signature: its title and content are cut
+into overlapping word shingles, and for each of NUM_HASHES hash functions
+the smallest hash of any shingle is kept. The share of equal minimums in
+two signatures estimates the Jaccard similarity of their shingle sets.
+
+Signatures are stored in post_signatures and indexed in memory per course
+with locality-sensitive hashing: the signature is split into BANDS bands
+and each band is hashed to a bucket, so posts whose signatures agree on a
+whole band land in the same bucket. Looking up a new post only compares it
+with the few posts sharing one of its buckets, never with the whole board,
+which keeps the check on submit well under a millisecond. Each lookup first
+loads signatures stored since the last one (one indexed query), so posts
+created by other workers are found too.
+
+When a new post looks like an existing one, create_discussion shows the
+similar posts and asks before posting. Moderators can cluster existing
+posts, and backfill signatures after an import, with:
+
+    python near_duplicates.py --rebuild
+    python near_duplicates.py --tenant princeton [--course COS126] [--threshold 0.5]
+"""
+import argparse
+import hashlib
+import random
+import re
+import threading
+from array import array
+from sqlalchemy import select
+from models import db, Tenant, Course, DiscussionPost, PostSignature
+
+# Hash functions per signature, and how they are split into LSH bands
+NUM_HASHES = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_HASHES // BANDS
+
+# Estimated Jaccard similarity at which a post counts as a likely duplicate
+DUPLICATE_THRESHOLD = 0.5
+
+# Words per shingle
+SHINGLE_SIZE = 3
+
+# Most similar posts shown when creating a post
+MAX_SUGGESTIONS = 5
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Fixed seed: stored signatures are only comparable if every process uses the same hash functions
+_seeded = random.Random(0x5EED)
+_HASH_FUNCTIONS = [(_seeded.randrange(1, _MERSENNE_PRIME), _seeded.randrange(0, _MERSENNE_PRIME))
+                   for _ in range(NUM_HASHES)]
+
+# Signature of a post with no words; it is stored but never indexed or matched
+EMPTY_SIGNATURE = (_MAX_HASH,) * NUM_HASHES
+
+
+def shingles(title, content):
+    """Get the hashed word shingles of a post's text"""
+    words = _WORD_RE.findall(f'{title} {content}'.lower())
+    if len(words) < SHINGLE_SIZE:
+        grams = set(words)
+    else:
+        grams = {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    return [int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), 'little') for gram in grams]
+
+
+def signature(title, content):
+    """Compute a post's MinHash signature (tuple of NUM_HASHES ints)"""
+    hashed = shingles(title, content)
+    if not hashed:
+        return EMPTY_SIGNATURE
+    return tuple(min((a * value + b) % _MERSENNE_PRIME for value in hashed) & _MAX_HASH
+                 for a, b in _HASH_FUNCTIONS)
+
+
+def similarity(first, second):
+    """Estimate the Jaccard similarity of two signatures"""
+    return sum(1 for a, b in zip(first, second) if a == b) / NUM_HASHES
+
+
+def band_keys(sig):
+    """Get the LSH bucket key of each band of a signature"""
+    return [(band, hash(sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])) for band in range(BANDS)]
+
+
+def pack(sig):
+    """Encode a signature for the post_signatures table"""
+    return array('I', sig).tobytes()
+
+
+def unpack(data):
+    """Decode a stored signature"""
+    return tuple(array('I', data))
+
+
+class CourseIndex:
+    """LSH buckets of one course's post signatures"""
+
+    __slots__ = ('signatures', 'buckets', 'last_post_id')
+
+    def __init__(self):
+        self.signatures = {}  # post_id -> signature
+        self.buckets = {}  # (band, key) -> {post_id}
+        self.last_post_id = 0
+
+    def add(self, post_id, sig):
+        """Index a signature (wordless posts are skipped: they would all match each other)"""
+        if sig == EMPTY_SIGNATURE:
+            return
+        self.signatures[post_id] = sig
+        for key in band_keys(sig):
+            self.buckets.setdefault(key, set()).add(post_id)
+
+    def candidates(self, sig):
+        """Get the posts sharing at least one bucket with a signature"""
+        found = set()
+        for key in band_keys(sig):
+            found.update(self.buckets.get(key, ()))
+        return found
+
+
+class DuplicateIndex:
+    """Per-course LSH indexes, loaded from post_signatures on first use"""
+
+    def __init__(self):
+        self._courses = {}  # course_id -> CourseIndex
+        self._lock = threading.Lock()
+
+    def _catch_up(self, course_id):
+        """Load the course's signatures stored since the last lookup"""
+        with self._lock:
+            index = self._courses.get(course_id)
+            last_post_id = index.last_post_id if index else 0
+        rows = db.session.execute(
+            select(PostSignature.post_id, PostSignature.signature)
+            .where(PostSignature.course_id == course_id, PostSignature.post_id > last_post_id)
+        ).all()
+        with self._lock:
+            index = self._courses.setdefault(course_id, CourseIndex())
+            for post_id, data in rows:
+                index.add(post_id, unpack(data))
+                index.last_post_id = max(index.last_post_id, post_id)
+            return index
+
+    def add(self, course_id, post_id, sig):
+        """Index a post that was just stored
+
+        This does not move the catch-up position: posts other workers stored with lower
+        ids may not be loaded yet, so the next lookup still reads everything past it
+        (re-adding this post is harmless).
+        """
+        with self._lock:
+            index = self._courses.get(course_id)
+            if index is not None:
+                index.add(post_id, sig)
+
+    def find(self, course_id, sig, threshold=DUPLICATE_THRESHOLD, limit=MAX_SUGGESTIONS):
+        """Get [(similarity, post_id)] for a course's posts resembling a signature, most similar first"""
+        if sig == EMPTY_SIGNATURE:
+            return []
+        index = self._catch_up(course_id)
+        with self._lock:
+            scored = [(similarity(sig, index.signatures[post_id]), post_id) for post_id in index.candidates(sig)]
+        scored = [entry for entry in scored if entry[0] >= threshold]
+        scored.sort(reverse=True)
+        return scored[:limit]
+
+
+def signature_row(post, sig):
+    """Build the post_signatures row for a new post (add it to the post's transaction)"""
+    return PostSignature(post_id=post.id, course_id=post.course_id, signature=pack(sig))
+
+
+def rebuild_signatures(batch_size=500):
+    """Compute signatures for every post that has none (returns the number stored)"""
+    stored = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(DiscussionPost.id, DiscussionPost.course_id, DiscussionPost.title, DiscussionPost.content)
+            .outerjoin(PostSignature, PostSignature.post_id == DiscussionPost.id)
+            .where(DiscussionPost.id > last_id, PostSignature.post_id.is_(None))
+            .order_by(DiscussionPost.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        db.session.add_all(
+            PostSignature(post_id=post_id, course_id=course_id, signature=pack(signature(title, content)))
+            for post_id, course_id, title, content in rows
+        )
+        db.session.commit()
+        stored += len(rows)
+        last_id = rows[-1][0]
+    return stored
+
+
+def find_clusters(course_id, threshold=DUPLICATE_THRESHOLD):
+    """Group a course's posts into clusters of likely duplicates (lists of post ids, oldest first)"""
+    index = CourseIndex()
+    for post_id, data in db.session.execute(
+        select(PostSignature.post_id, PostSignature.signature).where(PostSignature.course_id == course_id)
+    ):
+        index.add(post_id, unpack(data))
+
+    # Union-find over the candidate pairs that LSH puts in a shared bucket
+    parent = {}
+
+    def root(post_id):
+        while parent.get(post_id, post_id) != post_id:
+            post_id = parent[post_id]
+        return post_id
+
+    for members in index.buckets.values():
+        if len(members) < 2:
+            continue
+        members = sorted(members)
+        for i, first in enumerate(members):
+            for second in members[i + 1:]:
+                if root(first) != root(second) and similarity(index.signatures[first], index.signatures[second]) >= threshold:
+                    parent[max(root(first), root(second))] = min(root(first), root(second))
+
+    clusters = {}
+    for post_id in parent:
+        clusters.setdefault(root(post_id), set()).update((post_id, root(post_id)))
+    return sorted(sorted(members) for members in clusters.values())
+
+
+def init_near_duplicates(app):
+    """Attach the duplicate index to the app"""
+    app.extensions['near_duplicates'] = DuplicateIndex()
+
+
+def get_index(app):
+    """Get the app's duplicate index"""
+    return app.extensions['near_duplicates']
+
+
+def main():
+    """Backfill signatures or print clusters of near-duplicate posts for moderators"""
+    from factory import create_app
+
+    parser = argparse.ArgumentParser(description='Find near-duplicate TigerStudy discussion posts')
+    parser.add_argument('--rebuild', action='store_true', help='compute signatures for posts that have none')
+    parser.add_argument('--tenant', help='campus slug whose courses are clustered')
+    parser.add_argument('--course', help='only cluster this course code')
+    parser.add_argument('--threshold', type=float, default=DUPLICATE_THRESHOLD, help='minimum estimated similarity')
+    args = parser.parse_args()
+    if not args.rebuild and not args.tenant:
+        parser.error('give --rebuild and/or --tenant')
+
+    app = create_app()
+    with app.app_context():
+        if args.rebuild:
+            print(f"Stored signatures for {rebuild_signatures()} posts")
+        if not args.tenant:
+            return
+
+        tenant = Tenant.query.filter_by(slug=args.tenant).first()
+        if tenant is None:
+            parser.error(f'unknown tenant: {args.tenant}')
+        courses = Course.query.filter_by(tenant_id=tenant.id)
+        if args.course:
+            courses = courses.filter_by(code=args.course.upper())
+
+        for course in courses.order_by(Course.code):
+            clusters = find_clusters(course.id, args.threshold)
+            if not clusters:
+                continue
+            titles = dict(db.session.execute(
+                select(DiscussionPost.id, DiscussionPost.title)
+                .where(DiscussionPost.id.in_([post_id for cluster in clusters for post_id in cluster]))
+            ).all())
+            print(f"\n{course.code}: {len(clusters)} cluster(s)")
+            for cluster in clusters:
+                print(f"  - {len(cluster)} posts")
+                for post_id in cluster:
+                    print(f"      #{post_id} {titles.get(post_id, '')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Notification fan-out for TigerStudy
+
+Events (replies, upvotes, chat messages, group joins) are written once per
+recipient into the notifications table at the time they happen, so reading
+an inbox is a single indexed query and the header badge reads the
+users.unread_notifications counter already loaded with current_user.
+
+Repeat events on the same target collapse into the recipient's existing
+unread entry (its count goes up) instead of adding rows, which keeps busy
+chats from flooding inboxes. Fan-out to large groups is done in batches of
+FANOUT_BATCH_SIZE recipients using bulk INSERT/UPDATE statements.
+"""
+from datetime import datetime
+from sqlalchemy import update, insert, select
+from sqlalchemy.orm import joinedload
+from models import db, User, Participant, Notification
+
+FANOUT_BATCH_SIZE = 500
+INBOX_LIMIT = 50
+
+
+def _batches(user_ids):
+    """Split recipients into FANOUT_BATCH_SIZE chunks"""
+    user_ids = sorted(user_ids)
+    for i in range(0, len(user_ids), FANOUT_BATCH_SIZE):
+        yield user_ids[i:i + FANOUT_BATCH_SIZE]
+
+
+def notify(kind, user_ids, target_id, subject, actor_id=None):
+    """Deliver one event to every recipient's inbox (the actor is skipped)"""
+    recipients = set(user_ids)
+    recipients.discard(actor_id)
+    if not recipients:
+        return
+
+    now = datetime.now()
+    for batch in _batches(recipients):
+        # Recipients with an unread entry for this target get it bumped
+        coalesced = set(db.session.execute(
+            select(Notification.user_id).where(
+                Notification.user_id.in_(batch),
+                Notification.is_read.is_(False),
+                Notification.kind == kind,
+                Notification.target_id == target_id
+            )
+        ).scalars())
+
+        if coalesced:
+            db.session.execute(
+                update(Notification)
+                .where(
+                    Notification.user_id.in_(coalesced),
+                    Notification.is_read.is_(False),
+                    Notification.kind == kind,
+                    Notification.target_id == target_id
+                )
+                .values(count=Notification.count + 1, actor_id=actor_id, subject=subject, updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+
+        # Everyone else gets a fresh unread entry and a bumped counter
+        fresh = [user_id for user_id in batch if user_id not in coalesced]
+        if fresh:
+            db.session.execute(insert(Notification), [
+                dict(user_id=user_id, kind=kind, target_id=target_id, subject=subject,
+                     actor_id=actor_id, count=1, is_read=False, created_at=now, updated_at=now)
+                for user_id in fresh
+            ])
+            db.session.execute(
+                update(User)
+                .where(User.id.in_(fresh))
+                .values(unread_notifications=User.unread_notifications + 1)
+                .execution_options(synchronize_session=False)
+            )
+
+    db.session.commit()
+
+
+def notify_group(kind, study_group, actor_id=None):
+    """Deliver an event to every participant of a study group"""
+    member_ids = db.session.execute(
+        select(Participant.user_id).where(Participant.study_group_id == study_group.id)
+    ).scalars().all()
+    notify(kind, member_ids, study_group.id, study_group.title, actor_id)
+
+
+def get_inbox(user_id, limit=INBOX_LIMIT):
+    """Get a user's most recent notifications, newest first"""
+    return Notification.query.options(joinedload(Notification.actor)).filter_by(
+        user_id=user_id
+    ).order_by(Notification.updated_at.desc()).limit(limit).all()
+
+
+def mark_all_read(user_id):
+    """Mark every notification read and reset the unread counter"""
+    db.session.execute(
+        update(Notification)
+        .where(Notification.user_id == user_id, Notification.is_read.is_(False))
+        .values(is_read=True)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        update(User).where(User.id == user_id).values(unread_notifications=0)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
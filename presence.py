@@ -0,0 +1,117 @@
+"""
+Live presence and typing indicators for TigerStudy group chat
+
+The chat page sends a heartbeat every HEARTBEAT_SECONDS (and a "typing"
+heartbeat while the message box is being edited). Heartbeats are kept per
+(group, user) with an expiry; a user is online until PRESENCE_TTL_SECONDS
+pass without a heartbeat and typing until TYPING_TTL_SECONDS pass. None of
+this touches the database, so presence adds no SQL writes no matter how
+many chats are open.
+
+State lives in a per-process MemoryPresenceStore by default. With several
+workers, PRESENCE_STORAGE_URL=redis://... shares it through
+RedisPresenceStore so every worker sees the same online list.
+"""
+import threading
+import time
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# How often the chat page checks in
+HEARTBEAT_SECONDS = 15
+
+# A user drops offline after missing this many seconds of heartbeats
+PRESENCE_TTL_SECONDS = 45
+
+# A typing indicator disappears this long after the last keystroke heartbeat
+TYPING_TTL_SECONDS = 6
+
+
+class MemoryPresenceStore:
+    """Heartbeats held in this process"""
+
+    def __init__(self):
+        self._groups = {}  # group_id -> {user_id: (online_until, typing_until)}
+        self._lock = threading.Lock()
+
+    def heartbeat(self, group_id, user_id, typing=False):
+        """Record that a user has the group's chat open"""
+        now = time.monotonic()
+        with self._lock:
+            members = self._groups.setdefault(group_id, {})
+            _, typing_until = members.get(user_id, (0, 0))
+            members[user_id] = (now + PRESENCE_TTL_SECONDS, now + TYPING_TTL_SECONDS if typing else typing_until)
+
+    def leave(self, group_id, user_id):
+        """Drop a user from the group's online list right away"""
+        with self._lock:
+            members = self._groups.get(group_id)
+            if members:
+                members.pop(user_id, None)
+
+    def online(self, group_id):
+        """Get {user_id: is_typing} for users currently in the group's chat"""
+        now = time.monotonic()
+        with self._lock:
+            members = self._groups.get(group_id, {})
+            for user_id in [user_id for user_id, (until, _) in members.items() if until <= now]:
+                del members[user_id]
+            if not members:
+                self._groups.pop(group_id, None)
+            return {user_id: typing_until > now for user_id, (_, typing_until) in members.items()}
+
+
+class RedisPresenceStore:
+    """Heartbeats shared by every worker through Redis sorted sets (score = expiry)"""
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError('PRESENCE_STORAGE_URL points at Redis but the redis package is not installed')
+        self._client = redis.Redis.from_url(url)
+
+    def heartbeat(self, group_id, user_id, typing=False):
+        """Record that a user has the group's chat open"""
+        now = time.time()
+        pipe = self._client.pipeline()
+        pipe.zadd(f'presence:{group_id}', {user_id: now + PRESENCE_TTL_SECONDS})
+        pipe.expire(f'presence:{group_id}', PRESENCE_TTL_SECONDS)
+        if typing:
+            pipe.zadd(f'typing:{group_id}', {user_id: now + TYPING_TTL_SECONDS})
+            pipe.expire(f'typing:{group_id}', TYPING_TTL_SECONDS)
+        pipe.execute()
+
+    def leave(self, group_id, user_id):
+        """Drop a user from the group's online list right away"""
+        self._client.zrem(f'presence:{group_id}', user_id)
+        self._client.zrem(f'typing:{group_id}', user_id)
+
+    def online(self, group_id):
+        """Get {user_id: is_typing} for users currently in the group's chat"""
+        now = time.time()
+        pipe = self._client.pipeline()
+        pipe.zremrangebyscore(f'presence:{group_id}', '-inf', now)
+        pipe.zrange(f'presence:{group_id}', 0, -1)
+        pipe.zrangebyscore(f'typing:{group_id}', now, '+inf')
+        _, online_ids, typing_ids = pipe.execute()
+        typing_ids = {int(user_id) for user_id in typing_ids}
+        return {int(user_id): int(user_id) in typing_ids for user_id in online_ids}
+
+
+def create_store(url):
+    """Build the presence store named by PRESENCE_STORAGE_URL"""
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisPresenceStore(url)
+    return MemoryPresenceStore()
+
+
+def init_presence(app):
+    """Attach the presence store to the app"""
+    app.extensions['presence'] = create_store(app.config['PRESENCE_STORAGE_URL'])
+
+
+def get_store(app):
+    """Get the app's presence store"""
+    return app.extensions['presence']
@@ -0,0 +1,173 @@
+"""
+Profile activity loader for TigerStudy
+
+Gathers everything the profile pages show about a user (hosted and joined
+groups, discussion posts, reply/karma totals and top contributions) in a
+fixed handful of batched queries, and caches the result per user.
+
+Cached entries are dropped explicitly by the write paths that change a
+user's activity (see invalidate()). The TTL is a safety net for writes made
+by other worker processes, whose invalidations this process never sees.
+Invalidating also bumps the users' public profile versions in http_cache.
+The cache is an LRU of at most MAX_CACHED_PROFILES users, and invalidation
+generations are only kept for users whose snapshot is being loaded, so
+memory stays bounded however many users are viewed.
+"""
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import func, select
+from models import db, StudyGroup, Participant, DiscussionPost, DiscussionReply
+import http_cache
+import read_models
+
+# Longest list rendered in each profile section
+PROFILE_LIST_LIMIT = 50
+
+# Number of top posts / replies shown under "Top Contributions"
+TOP_CONTRIBUTIONS_LIMIT = 5
+
+# Seconds before a cached entry is rebuilt even without an invalidation
+CACHE_TTL_SECONDS = 300
+
+# Most users whose snapshots are kept (least recently viewed are evicted first)
+MAX_CACHED_PROFILES = 2000
+
+_cache = OrderedDict()  # user_id -> (loaded_at, activity), least recently used first
+_loading = {}  # user_id -> [loads in flight, invalidation generation]
+_cache_lock = threading.Lock()
+
+
+class ProfileActivity:
+    """Snapshot of a user's activity as shown on the profile pages"""
+
+    def __init__(self, hosted_groups, joined_groups, discussion_posts, top_posts, top_replies, hosted_count, joined_count, posts_count,
+                 replies_count, total_karma):
+        self.hosted_groups = hosted_groups
+        self.joined_groups = joined_groups
+        self.discussion_posts = discussion_posts
+        self.top_posts = top_posts
+        self.top_replies = top_replies
+        self.hosted_count = hosted_count
+        self.joined_count = joined_count
+        self.posts_count = posts_count
+        self.replies_count = replies_count
+        self.total_karma = total_karma
+
+
+def _load(user_id):
+    """Build a user's activity snapshot from the database"""
+    # All counts and karma totals in a single round trip
+    totals = db.session.execute(select(
+        select(func.count(StudyGroup.id))
+        .where(StudyGroup.host_id == user_id).scalar_subquery(),
+        select(func.count(Participant.id))
+        .where(Participant.user_id == user_id).scalar_subquery(),
+        select(func.count(DiscussionPost.id))
+        .where(DiscussionPost.author_id == user_id).scalar_subquery(),
+        select(func.count(DiscussionReply.id))
+        .where(DiscussionReply.author_id == user_id).scalar_subquery(),
+        select(func.coalesce(func.sum(DiscussionPost.score), 0))
+        .where(DiscussionPost.author_id == user_id).scalar_subquery(),
+        select(func.coalesce(func.sum(DiscussionReply.score), 0))
+        .where(DiscussionReply.author_id == user_id).scalar_subquery(),
+    )).one()
+
+    # Lists are read-model rows: immutable, untracked and safe to share between requests
+    hosted_groups = read_models.fetch(read_models.GroupRow, read_models.select_groups().where(
+        StudyGroup.host_id == user_id
+    ).order_by(
+        StudyGroup.date_time.desc()
+    ).limit(PROFILE_LIST_LIMIT))
+
+    # Join through participants instead of loading the participations first
+    joined_groups = read_models.fetch(read_models.GroupRow, read_models.select_groups().join(
+        Participant, Participant.study_group_id == StudyGroup.id
+    ).where(
+        Participant.user_id == user_id
+    ).order_by(
+        StudyGroup.date_time.desc()
+    ).limit(PROFILE_LIST_LIMIT))
+
+    discussion_posts = read_models.fetch(read_models.PostRow, read_models.select_posts().where(
+        DiscussionPost.author_id == user_id
+    ).order_by(
+        DiscussionPost.created_at.desc()
+    ).limit(PROFILE_LIST_LIMIT))
+
+    top_posts = read_models.fetch(read_models.PostRow, read_models.select_posts().where(
+        DiscussionPost.author_id == user_id
+    ).order_by(
+        DiscussionPost.score.desc()
+    ).limit(TOP_CONTRIBUTIONS_LIMIT))
+
+    top_replies = read_models.fetch(read_models.ReplyRow, read_models.select_replies().where(
+        DiscussionReply.author_id == user_id
+    ).order_by(
+        DiscussionReply.score.desc()
+    ).limit(TOP_CONTRIBUTIONS_LIMIT))
+
+    hosted_count, joined_count, posts_count, replies_count, posts_karma, replies_karma = totals
+
+    return ProfileActivity(
+        hosted_groups=hosted_groups,
+        joined_groups=joined_groups,
+        discussion_posts=discussion_posts,
+        top_posts=top_posts,
+        top_replies=top_replies,
+        hosted_count=hosted_count,
+        joined_count=joined_count,
+        posts_count=posts_count,
+        replies_count=replies_count,
+        total_karma=posts_karma + replies_karma
+    )
+
+
+def get_profile_activity(user_id):
+    """Get a user's activity snapshot, loading it on a cache miss"""
+    now = time.monotonic()
+
+    with _cache_lock:
+        entry = _cache.get(user_id)
+        if entry and now - entry[0] < CACHE_TTL_SECONDS:
+            _cache.move_to_end(user_id)
+            return entry[1]
+        _cache.pop(user_id, None)
+        loading = _loading.setdefault(user_id, [0, 0])
+        loading[0] += 1
+        generation = loading[1]
+
+    activity = None
+    try:
+        activity = _load(user_id)
+    finally:
+        with _cache_lock:
+            loading = _loading[user_id]
+            loading[0] -= 1
+            # Skip storing if a write invalidated this user while we were loading
+            if activity is not None and loading[1] == generation:
+                _cache[user_id] = (now, activity)
+                _cache.move_to_end(user_id)
+                while len(_cache) > MAX_CACHED_PROFILES:
+                    _cache.popitem(last=False)
+            if not loading[0]:
+                del _loading[user_id]
+    return activity
+
+
+def invalidate(*user_ids):
+    """Drop cached activity for users whose profile data just changed"""
+    with _cache_lock:
+        for user_id in user_ids:
+            _cache.pop(user_id, None)
+            if user_id in _loading:
+                _loading[user_id][1] += 1
+    http_cache.bump_users(*user_ids)
+
+
+def clear():
+    """Drop every cached activity snapshot"""
+    with _cache_lock:
+        _cache.clear()
+        for loading in _loading.values():
+            loading[1] += 1
@@ -0,0 +1,260 @@
+"""
+Per-route SQL query budgets for TigerStudy
+
+Requests every main page through the Flask test client and counts the SQL
+statements it issues, including those run while a streamed template is
+rendered. Each route declares a budget in ROUTE_BUDGETS; a route fails when
+it needs more statements than its budget.
+
+The pages are measured against two seeded datasets, a small one and one
+several times larger, each built in a throwaway SQLite database inside a
+fresh interpreter so no cache carries over between them. A page whose query
+count is higher on the large dataset issues queries per row (an N+1 in a
+view or template) and fails even when it is still under budget.
+
+    python query_budget.py [--small 1] [--large 4] [--route LABEL]
+
+The command exits non-zero when any route fails, and test.py runs the same
+check, so a budget overrun also fails the test suite.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Seeded user every measured page is requested as (when login is needed)
+BUDGET_USERNAME = 'budget0'
+BUDGET_PASSWORD = 'password123'
+BUDGET_COURSE = 'COS126'
+
+# (label, url, logged in, most SQL statements allowed); {course}, {post}, {group}
+# and {user} are filled in from the seeded data
+ROUTE_BUDGETS = [
+    ('home (anonymous)', '/', False, 5),
+    ('home', '/', True, 6),
+    ('course', '/course/{course}', True, 5),
+    ('discussions hot', '/course/{course}/discussions?sort=hot', False, 5),
+    ('discussions new', '/course/{course}/discussions?sort=new', False, 5),
+    ('discussions top', '/course/{course}/discussions?sort=top', False, 5),
+    ('discussions active', '/course/{course}/discussions?sort=active', False, 5),
+    ('discussions trending', '/course/{course}/discussions?sort=trending', False, 6),
+    ('discussions (logged in)', '/course/{course}/discussions?sort=hot', True, 5),
+    ('discussion post', '/discussion/{post}', True, 8),
+    ('user profile', '/user/{user}', False, 10),
+    ('own profile', '/profile', True, 8),
+    ('study group', '/study_group/{group}', True, 9),
+    ('notifications', '/notifications', True, 6),
+]
+
+
+@contextmanager
+def count_queries(engine):
+    """Count the statements run on an engine while the block runs (yields a list of SQL strings)"""
+    from sqlalchemy import event
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def seed(scale):
+    """Fill an empty database with a dataset whose row counts grow with scale"""
+    from models import (db, Tenant, User, Course, StudyGroup, Participant, ChatMessage, DiscussionPost,
+                        DiscussionReply, PostVote, ReplyVote, Notification, GroupRecommendation, bcrypt)
+
+    tenant = Tenant(slug='princeton', hostname='localhost', name='Princeton University',
+                    short_name='Princeton', app_name='TigerStudy', email_domain='princeton.edu')
+    db.session.add(tenant)
+    db.session.flush()
+
+    # Hashing once keeps seeding fast at every scale
+    password_hash = bcrypt.generate_password_hash(BUDGET_PASSWORD).decode('utf-8')
+    users = [User(tenant_id=tenant.id, email=f'budget{i}@princeton.edu', username=f'budget{i}',
+                  password_hash=password_hash, full_name=f'Budget User {i}', class_year=2026 + i % 4)
+             for i in range(8 * scale)]
+    courses = [Course(tenant_id=tenant.id, code=code, title=f'{code} course', description='Seeded course')
+               for code in [BUDGET_COURSE] + [f'SEM{100 + i}' for i in range(4 * scale - 1)]]
+    db.session.add_all(users + courses)
+    db.session.flush()
+
+    now = datetime.now()
+    groups = []
+    for course in courses:
+        for i in range(3 * scale):
+            host = users[i % len(users)]
+            members = [users[(i + offset) % len(users)] for offset in range(2 + 2 * scale)]
+            study_group = StudyGroup(course_id=course.id, host_id=host.id, title=f'{course.code} group {i}',
+                                     description='Seeded study group', date_time=now + timedelta(days=i % 14 + 1),
+                                     location='Virtual/Zoom' if i % 3 == 0 else 'Fine Hall 214',
+                                     is_virtual=i % 3 == 0, max_participants=-1, participant_count=len(members))
+            study_group.participants = [Participant(user_id=member.id) for member in members]
+            study_group.chat_messages = [ChatMessage(author_id=members[j % len(members)].id, content=f'Message {j}')
+                                         for j in range(5 * scale)]
+            db.session.add(study_group)
+            groups.append((study_group, {member.id for member in members}))
+
+        for i in range(4 * scale):
+            author = users[i % len(users)]
+            post = DiscussionPost(course_id=course.id, author_id=author.id, title=f'{course.code} question {i}',
+                                  content='Seeded **post**', category='Question',
+                                  created_at=now - timedelta(hours=i))
+            db.session.add(post)
+            db.session.flush()
+
+            replies = []
+            for j in range(3 * scale):
+                parent = replies[j // 2] if j and j % 2 == 0 else None
+                reply = DiscussionReply(post_id=post.id, parent=parent, author_id=users[(i + j + 1) % len(users)].id,
+                                        content=f'Seeded reply {j}', created_at=post.created_at + timedelta(minutes=j))
+                db.session.add(reply)
+                replies.append(reply)
+            db.session.flush()
+
+            voters = [user for user in users if user.id != author.id]
+            db.session.add_all(PostVote(post_id=post.id, user_id=voter.id, vote_type=1) for voter in voters)
+            post.score = len(voters)
+            for reply in replies:
+                db.session.add_all(ReplyVote(reply_id=reply.id, user_id=voter.id, vote_type=1)
+                                   for voter in voters[:scale + 1] if voter.id != reply.author_id)
+
+    for user in users:
+        db.session.add_all(Notification(user_id=user.id, kind=Notification.REPLY, target_id=i + 1,
+                                        subject=f'Seeded post {i}', actor_id=users[(i + 1) % len(users)].id)
+                           for i in range(5 * scale))
+        user.unread_notifications = 5 * scale
+    db.session.flush()
+
+    # Every user gets a feed of groups they have not joined, spread over several courses
+    # (stored directly, so measuring does not need the recommender's numpy/scipy)
+    for user in users:
+        candidates = [study_group for study_group, member_ids in groups if user.id not in member_ids]
+        db.session.add_all(GroupRecommendation(user_id=user.id, study_group_id=study_group.id, rank=rank,
+                                               score=1.0 / rank, computed_at=now)
+                           for rank, study_group in enumerate(candidates[::3 * scale][:20], start=1))
+    db.session.commit()
+
+    import trending
+    trending.rebuild_buckets()
+
+
+def measure(scale):
+    """Seed the current database at a scale and count each route's statements (returns {label: count})"""
+    from app import app
+    from models import db, User, Course, StudyGroup, DiscussionPost
+    import profile_activity
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['RATELIMIT_ENABLED'] = False
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(scale)
+        user = User.query.filter_by(username=BUDGET_USERNAME).one()
+        course = Course.query.filter_by(code=BUDGET_COURSE).one()
+        ids = {
+            'course': BUDGET_COURSE,
+            'user': user.username,
+            'post': DiscussionPost.query.filter_by(course_id=course.id).order_by(DiscussionPost.id).first().id,
+            'group': StudyGroup.query.filter_by(course_id=course.id, host_id=user.id).first().id,
+        }
+        engine = db.engine
+
+    client = app.test_client()
+    client.get('/login')  # Loads the tenant and other per-process caches before counting
+    counts = {}
+    for logged_in in (False, True):
+        if logged_in:
+            client.post('/login', data={'email_or_username': BUDGET_USERNAME, 'password': BUDGET_PASSWORD})
+        for label, url, needs_login, _ in ROUTE_BUDGETS:
+            if needs_login != logged_in:
+                continue
+            profile_activity.clear()  # Profiles are measured cold, not from another page's cache
+            with count_queries(engine) as statements:
+                response = client.get(url.format(**ids))
+                response.get_data()  # Streamed pages query while they render
+            if response.status_code != 200:
+                raise RuntimeError(f'{url.format(**ids)} returned {response.status_code}')
+            counts[label] = len(statements)
+    return counts
+
+
+def measure_in_subprocess(scale):
+    """Run measure() in a fresh interpreter against a throwaway database"""
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ,
+                   DATABASE_URL='sqlite:///' + os.path.join(directory, 'budget.db'),
+                   ACTIVITY_FLUSH_INTERVAL='0',
+                   TRENDING_PERSIST_INTERVAL='0')
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--measure', str(scale)],
+            cwd=PROJECT_DIR, env=env, capture_output=True, text=True
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f'Measuring scale {scale} failed:\n{result.stderr}')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def check_budgets(small, large):
+    """Measure both datasets and judge every route (returns [(label, budget, small, large, problems)])"""
+    small_counts = measure_in_subprocess(small)
+    large_counts = measure_in_subprocess(large)
+
+    results = []
+    for label, _, _, budget in ROUTE_BUDGETS:
+        small_count, large_count = small_counts[label], large_counts[label]
+        problems = []
+        if max(small_count, large_count) > budget:
+            problems.append('over budget')
+        if large_count > small_count:
+            problems.append('grows with data')
+        results.append((label, budget, small_count, large_count, problems))
+    return results
+
+
+def budget_report(small, large, only=None):
+    """Print statement counts per route on both datasets (returns the process exit code)"""
+    print(f"SQL statements per request (datasets at scale {small} and {large})")
+    print(f"\n{'route':<24} {'budget':>6} {'small':>6} {'large':>6}  result")
+    failures = 0
+    for label, budget, small_count, large_count, problems in check_budgets(small, large):
+        if only and label not in only:
+            continue
+        failures += bool(problems)
+        print(f"{label:<24} {budget:>6} {small_count:>6} {large_count:>6}  {', '.join(problems) or 'ok'}")
+
+    if failures:
+        print(f"\n{failures} route(s) failed")
+        return 1
+    return 0
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Check TigerStudy pages against their SQL query budgets')
+    parser.add_argument('--small', type=int, default=1, help='scale of the small dataset')
+    parser.add_argument('--large', type=int, default=4, help='scale of the large dataset')
+    parser.add_argument('--route', action='append', help='only report this route label (repeatable)')
+    parser.add_argument('--measure', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        print(json.dumps(measure(args.measure)))
+        return 0
+    return budget_report(args.small, args.large, args.route)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
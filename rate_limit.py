@@ -0,0 +1,199 @@
+"""
+Rate limiting for TigerStudy
+
+Write-heavy and bcrypt-heavy routes are guarded by token buckets: each key
+(a client IP, a logged-in user, or the account named in a login attempt)
+holds up to `capacity` tokens that refill continuously over `period`
+seconds, and every request spends one. An empty bucket answers 429 Too
+Many Requests with a Retry-After header before the view runs, so a flood
+never reaches SQLite or bcrypt and other users keep their latency.
+
+Buckets live in a per-process MemoryStore by default. Setting
+RATELIMIT_STORAGE_URL to a redis:// URL shares them across workers through
+RedisStore; any object with the same consume() method can be plugged in.
+"""
+import math
+import threading
+import time
+from functools import wraps
+from flask import current_app, request, render_template
+from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Stop tracking keys once this many are live (idle buckets are evicted first)
+MAX_MEMORY_KEYS = 100000
+
+
+class Limit:
+    """A token bucket: `capacity` requests per `period` seconds for one key scope"""
+
+    def __init__(self, scope, capacity, period):
+        self.scope = scope  # 'ip', 'user' or 'account'
+        self.capacity = capacity
+        self.period = period
+
+    @property
+    def refill_rate(self):
+        """Tokens regained per second"""
+        return self.capacity / self.period
+
+
+# Route policies: every limit in a policy must have a token for the request to pass
+POLICIES = {
+    'login': [Limit('ip', 20, 60), Limit('account', 5, 60)],
+    'register': [Limit('ip', 5, 3600)],
+    'vote': [Limit('user', 60, 60), Limit('ip', 120, 60)],
+    'reply': [Limit('user', 10, 60), Limit('ip', 30, 60)],
+    'chat': [Limit('user', 30, 60), Limit('ip', 60, 60)],
+    # An open chat tab beats up to 24 times a minute (typing every 3 s plus the 15 s heartbeat),
+    # so this leaves room for several tabs while still capping a runaway client
+    'presence': [Limit('user', 120, 60)],
+}
+
+
+class MemoryStore:
+    """Token buckets held in this process"""
+
+    def __init__(self, max_keys=MAX_MEMORY_KEYS):
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> (tokens, last_refill)
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        """Spend tokens from a bucket (returns allowed, seconds until enough refill)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last_refill = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last_refill) * refill_rate)
+
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                if len(self._buckets) > self.max_keys:
+                    self._evict()
+                return True, 0
+
+            self._buckets[key] = (tokens, now)
+            return False, (cost - tokens) / refill_rate
+
+    def _evict(self):
+        """Drop the buckets that have been idle longest"""
+        by_age = sorted(self._buckets.items(), key=lambda item: item[1][1])
+        for key, _ in by_age[:len(by_age) - self.max_keys // 2]:
+            del self._buckets[key]
+
+    def reset(self):
+        """Forget every bucket"""
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisStore:
+    """Token buckets shared by every worker through Redis"""
+
+    # Refill and spend atomically on the server; returns {allowed, wait_ms}
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + (now - ts) * rate)
+    local allowed = 0
+    local wait = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    else
+        wait = math.ceil((cost - tokens) / rate * 1000)
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+    return {allowed, wait}
+    """
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError('RATELIMIT_STORAGE_URL points at Redis but the redis package is not installed')
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        """Spend tokens from a bucket (returns allowed, seconds until enough refill)"""
+        allowed, wait_ms = self._script(keys=[f'ratelimit:{key}'], args=[capacity, refill_rate, cost])
+        return bool(allowed), wait_ms / 1000
+
+    def reset(self):
+        """Forget every bucket"""
+        for key in self._client.scan_iter('ratelimit:*'):
+            self._client.delete(key)
+
+
+def create_store(url):
+    """Build the bucket store named by RATELIMIT_STORAGE_URL"""
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisStore(url)
+    return MemoryStore()
+
+
+def init_rate_limit(app):
+    """Attach the bucket store and the 429 error page to the app"""
+    app.extensions['rate_limit'] = create_store(app.config['RATELIMIT_STORAGE_URL'])
+
+    @app.errorhandler(429)
+    def too_many_requests(error):
+        """Handle requests rejected by a rate limit"""
+        retry_after = getattr(error, 'retry_after', None) or 60
+        response = current_app.make_response((render_template('rate_limited.html', retry_after=retry_after), 429))
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+
+def _key_for(rule):
+    """Get the bucket identity for a limit, or None when it does not apply"""
+    if rule.scope == 'user':
+        if not current_user.is_authenticated:
+            return None
+        return f'user:{current_user.id}'
+    elif rule.scope == 'account':
+        account = request.form.get('email_or_username', '').strip().lower()
+        return f'account:{account}' if account else None
+    return f'ip:{request.remote_addr}'
+
+
+def check(policy_name):
+    """Spend one token per limit in the policy (raises 429 when any is empty)"""
+    store = current_app.extensions['rate_limit']
+    waits = []
+    for rule in POLICIES[policy_name]:
+        key = _key_for(rule)
+        if key is None:
+            continue
+        allowed, wait = store.consume(f'{policy_name}:{key}', rule.capacity, rule.refill_rate)
+        if not allowed:
+            waits.append(wait)
+
+    if waits:
+        raise TooManyRequests(retry_after=max(1, math.ceil(max(waits))))
+
+
+def limit(policy_name, methods=('POST',)):
+    """Decorator applying a route policy to the given HTTP methods"""
+    if policy_name not in POLICIES:
+        raise KeyError(f'Unknown rate limit policy: {policy_name}')
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if current_app.config['RATELIMIT_ENABLED'] and request.method in methods:
+                check(policy_name)
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
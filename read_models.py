@@ -0,0 +1,151 @@
+"""
+Read models for TigerStudy list pages
+
+List pages (the course list, course pages, discussion boards and profile
+lists) only print a handful of fields per item, so they read immutable,
+slotted row tuples built from column-only select() queries instead of full
+ORM objects. Rows are not tracked by the session, carry no relationship
+proxies or lazy loaders, and hold the related names they show (course
+code, author and host usernames) as plain fields, so a listed item costs a
+single small tuple and can be cached across requests safely.
+
+Each select_*() function returns a select() of a row type's columns that
+callers filter and order as usual; fetch() turns its result into rows. Row
+types reuse the display helpers of the model they project (time_ago,
+is_full, ...), so pages render the same text either way.
+"""
+from datetime import datetime
+from typing import NamedTuple, Optional
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+from models import db, User, Course, StudyGroup, Participant, WaitlistEntry, DiscussionPost, DiscussionReply
+
+
+class CourseRow(NamedTuple):
+    """A course as listed on the home page"""
+    id: int
+    code: str
+    title: str
+    description: Optional[str]
+
+
+class GroupRow(NamedTuple):
+    """A study group as listed on course and profile pages"""
+    id: int
+    course_id: int
+    course_code: str
+    host_id: int
+    host_username: str
+    host_full_name: str
+    title: str
+    description: str
+    date_time: datetime
+    duration_minutes: int
+    location: str
+    max_participants: int
+    participant_count: int
+    participants: tuple = ()  # (user_id, username) pairs, filled in by with_participants()
+
+    is_full = StudyGroup.is_full
+    is_past = StudyGroup.is_past
+    formatted_capacity = StudyGroup.formatted_capacity
+
+
+class PostRow(NamedTuple):
+    """A discussion post as listed on boards and profile pages"""
+    id: int
+    course_id: int
+    course_code: str
+    author_id: int
+    author_username: str
+    title: str
+    content: str
+    category: str
+    pinned: bool
+    score: int
+    reply_count: int
+    created_at: datetime
+
+    preview_content = DiscussionPost.preview_content
+    time_ago = DiscussionPost.time_ago
+    calculate_hot_score = DiscussionPost.calculate_hot_score
+
+
+class ReplyRow(NamedTuple):
+    """A reply as listed under a profile's top contributions"""
+    id: int
+    post_id: int
+    post_title: str
+    course_code: str
+    content: str
+    score: int
+    created_at: datetime
+
+    time_ago = DiscussionReply.time_ago
+
+
+def select_courses():
+    """Select CourseRow columns"""
+    return select(Course.id, Course.code, Course.title, Course.description)
+
+
+def select_groups():
+    """Select GroupRow columns (joined with the course and host)"""
+    host = aliased(User)
+    return select(
+        StudyGroup.id, StudyGroup.course_id, Course.code, StudyGroup.host_id, host.username, host.full_name,
+        StudyGroup.title, StudyGroup.description, StudyGroup.date_time, StudyGroup.duration_minutes,
+        StudyGroup.location, StudyGroup.max_participants, StudyGroup.participant_count
+    ).join(Course, Course.id == StudyGroup.course_id).join(host, host.id == StudyGroup.host_id)
+
+
+def select_posts():
+    """Select PostRow columns (joined with the course and author)"""
+    return select(
+        DiscussionPost.id, DiscussionPost.course_id, Course.code, DiscussionPost.author_id, User.username,
+        DiscussionPost.title, DiscussionPost.content, DiscussionPost.category, DiscussionPost.pinned,
+        DiscussionPost.score, DiscussionPost.reply_count, DiscussionPost.created_at
+    ).join(Course, Course.id == DiscussionPost.course_id).join(User, User.id == DiscussionPost.author_id)
+
+
+def select_replies():
+    """Select ReplyRow columns (joined with the post and its course)"""
+    return select(
+        DiscussionReply.id, DiscussionReply.post_id, DiscussionPost.title, Course.code,
+        DiscussionReply.content, DiscussionReply.score, DiscussionReply.created_at
+    ).join(DiscussionPost, DiscussionPost.id == DiscussionReply.post_id).join(Course, Course.id == DiscussionPost.course_id)
+
+
+def fetch(row_type, statement):
+    """Run a select_*() statement and build its rows"""
+    return [row_type(*values) for values in db.session.execute(statement)]
+
+
+def with_participants(groups):
+    """Fill in the participants of a list of GroupRows (one query)"""
+    if not groups:
+        return groups
+    members = {}
+    rows = db.session.execute(
+        select(Participant.study_group_id, User.id, User.username)
+        .join(User, User.id == Participant.user_id)
+        .where(Participant.study_group_id.in_([group.id for group in groups]))
+        .order_by(Participant.id)
+    )
+    for group_id, user_id, username in rows:
+        members.setdefault(group_id, []).append((user_id, username))
+    return [group._replace(participants=tuple(members.get(group.id, ()))) for group in groups]
+
+
+def waitlist_positions(user_id, group_ids):
+    """Get {group_id: 1-based waitlist position} for the listed groups a user is waiting on (one query)"""
+    if not group_ids:
+        return {}
+    ahead = aliased(WaitlistEntry)
+    position = (select(func.count(ahead.id))
+                .where(ahead.study_group_id == WaitlistEntry.study_group_id, ahead.id <= WaitlistEntry.id)
+                .scalar_subquery())
+    return dict(db.session.execute(
+        select(WaitlistEntry.study_group_id, position)
+        .where(WaitlistEntry.user_id == user_id, WaitlistEntry.study_group_id.in_(group_ids))
+    ).all())
@@ -0,0 +1,226 @@
+"""
+Study group recommendations for TigerStudy
+
+An offline batch job turns participation, posting, replying and upvoting
+history into sparse user x course and user x group matrices (NumPy/SciPy),
+scores every upcoming group with open seats for every active user using
+item-item cosine similarity, and stores each user's top-k groups in the
+group_recommendations table. The "Recommended for you" feed then reads a
+user's rows with one indexed query, no matter how many users there are.
+
+Only the batch job needs numpy and scipy:
+
+    pip install numpy scipy
+    python recommendations.py [--top-k 20]
+"""
+import argparse
+from datetime import datetime
+from sqlalchemy import delete, func, insert, select
+from models import (db, StudyGroup, Participant, DiscussionPost, DiscussionReply,
+                    PostVote, GroupRecommendation)
+import read_models
+
+# How strongly each kind of activity ties a user to a course
+PARTICIPATION_WEIGHT = 3.0
+POST_WEIGHT = 2.0
+REPLY_WEIGHT = 1.5
+UPVOTE_WEIGHT = 1.0
+
+# Weight of "people who joined your groups also joined" vs. course affinity
+GROUP_COOCCURRENCE_WEIGHT = 0.5
+
+# Recommendations stored per user
+DEFAULT_TOP_K = 20
+
+# Users scored per batch, bounding the dense score matrix held in memory
+USER_CHUNK_SIZE = 2048
+
+# Rows per bulk INSERT when storing results
+INSERT_BATCH_SIZE = 5000
+
+
+def _course_activity():
+    """Aggregate (user_id, course_id, weighted count) over all activity types"""
+    sources = [
+        (PARTICIPATION_WEIGHT,
+         select(Participant.user_id, StudyGroup.course_id, func.count())
+         .join(StudyGroup, StudyGroup.id == Participant.study_group_id)
+         .group_by(Participant.user_id, StudyGroup.course_id)),
+        (POST_WEIGHT,
+         select(DiscussionPost.author_id, DiscussionPost.course_id, func.count())
+         .group_by(DiscussionPost.author_id, DiscussionPost.course_id)),
+        (REPLY_WEIGHT,
+         select(DiscussionReply.author_id, DiscussionPost.course_id, func.count())
+         .join(DiscussionPost, DiscussionPost.id == DiscussionReply.post_id)
+         .group_by(DiscussionReply.author_id, DiscussionPost.course_id)),
+        (UPVOTE_WEIGHT,
+         select(PostVote.user_id, DiscussionPost.course_id, func.count())
+         .join(DiscussionPost, DiscussionPost.id == PostVote.post_id)
+         .where(PostVote.vote_type == 1)
+         .group_by(PostVote.user_id, DiscussionPost.course_id)),
+    ]
+
+    rows = []
+    for weight, query in sources:
+        rows.extend((user_id, course_id, weight * count)
+                    for user_id, course_id, count in db.session.execute(query))
+    return rows
+
+
+def _index(ids):
+    """Map ids to consecutive matrix positions"""
+    return {id_: position for position, id_ in enumerate(ids)}
+
+
+def _normalize(matrix, axis):
+    """Scale rows (axis=1) or columns (axis=0) of a sparse matrix to unit length"""
+    import numpy as np
+    from scipy import sparse
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=axis)).ravel())
+    norms[norms == 0] = 1.0
+    scale = sparse.diags(1.0 / norms)
+    return (scale @ matrix if axis == 1 else matrix @ scale).tocsr()
+
+
+def compute_recommendations(top_k=DEFAULT_TOP_K, now=None):
+    """Score open upcoming groups for every active user and store the top k"""
+    # Imported here so web workers, which only read the stored feed, never load numpy/scipy
+    try:
+        import numpy as np
+        from scipy import sparse
+    except ImportError:
+        raise RuntimeError('Computing recommendations requires numpy and scipy (pip install numpy scipy)')
+
+    now = now or datetime.now()
+
+    activity = _course_activity()
+    if not activity:
+        return 0
+
+    users = sorted({user_id for user_id, _, _ in activity})
+    courses = sorted({course_id for _, course_id, _ in activity})
+    user_pos = _index(users)
+    course_pos = _index(courses)
+
+    # User x course affinity
+    affinity = sparse.coo_matrix(
+        ([weight for _, _, weight in activity],
+         ([user_pos[u] for u, _, _ in activity], [course_pos[c] for _, c, _ in activity])),
+        shape=(len(users), len(courses))
+    ).tocsr()
+
+    # Course-course cosine similarity is tiny (courses x courses), so keep it dense
+    course_sim = (_normalize(affinity, axis=0).T @ _normalize(affinity, axis=0)).toarray()
+    course_pref = _normalize(affinity, axis=1) @ course_sim
+
+    # User x group participation (every group, past ones included, carries signal)
+    memberships = db.session.execute(select(Participant.user_id, Participant.study_group_id)).all()
+    groups = sorted({group_id for _, group_id in memberships})
+    group_pos = _index(groups)
+    membership_pairs = [(user_pos[u], group_pos[g]) for u, g in memberships if u in user_pos]
+    joined = sparse.coo_matrix(
+        (np.ones(len(membership_pairs)),
+         ([u for u, _ in membership_pairs], [g for _, g in membership_pairs])),
+        shape=(len(users), len(groups))
+    ).tocsr()
+
+    # Candidates: upcoming groups that still have a seat
+    candidates = db.session.execute(
+        select(StudyGroup.id, StudyGroup.course_id).where(
+            StudyGroup.date_time >= now,
+            db.or_(
+                StudyGroup.max_participants == -1,
+                StudyGroup.participant_count < StudyGroup.max_participants
+            )
+        )
+    ).all()
+    candidates = [(group_id, course_id) for group_id, course_id in candidates if course_id in course_pos]
+    if not candidates:
+        return _store([])
+
+    candidate_ids = np.array([group_id for group_id, _ in candidates])
+    candidate_courses = np.array([course_pos[course_id] for _, course_id in candidates])
+
+    # Candidate columns of the participation matrix (new groups may have none)
+    candidate_cols = sparse.lil_matrix((len(groups), len(candidates)))
+    for col, group_id in enumerate(candidate_ids):
+        if group_id in group_pos:
+            candidate_cols[group_pos[group_id], col] = 1.0
+    candidate_cols = candidate_cols.tocsr()
+
+    # Group-group cosine similarity restricted to candidate columns
+    normalized_groups = _normalize(joined, axis=0)
+    group_sim = normalized_groups.T @ (normalized_groups @ candidate_cols)
+    already_joined = joined @ candidate_cols
+
+    rows = []
+    computed_at = datetime.now()
+    for start in range(0, len(users), USER_CHUNK_SIZE):
+        stop = min(start + USER_CHUNK_SIZE, len(users))
+
+        scores = course_pref[start:stop][:, candidate_courses]
+        scores += GROUP_COOCCURRENCE_WEIGHT * (joined[start:stop] @ group_sim).toarray()
+        scores[already_joined[start:stop].toarray() > 0] = 0.0
+
+        k = min(top_k, scores.shape[1])
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+        for offset, columns in enumerate(best):
+            ranked = sorted(columns, key=lambda col: -scores[offset, col])
+            rank = 0
+            for col in ranked:
+                if scores[offset, col] <= 0:
+                    break
+                rank += 1
+                rows.append({
+                    'user_id': users[start + offset],
+                    'study_group_id': int(candidate_ids[col]),
+                    'rank': rank,
+                    'score': float(scores[offset, col]),
+                    'computed_at': computed_at,
+                })
+
+    return _store(rows)
+
+
+def _store(rows):
+    """Replace the recommendation table contents in a single transaction"""
+    db.session.execute(delete(GroupRecommendation))
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.session.execute(insert(GroupRecommendation), rows[start:start + INSERT_BATCH_SIZE])
+    db.session.commit()
+    return len(rows)
+
+
+def get_recommendations(user_id, limit=6):
+    """Get a user's recommended groups that are still upcoming and not yet joined (as GroupRows)"""
+    return read_models.fetch(read_models.GroupRow, read_models.select_groups().join(
+        GroupRecommendation, GroupRecommendation.study_group_id == StudyGroup.id
+    ).where(
+        GroupRecommendation.user_id == user_id,
+        StudyGroup.date_time >= datetime.now(),
+        ~select(Participant.id).where(
+            Participant.study_group_id == StudyGroup.id,
+            Participant.user_id == user_id
+        ).exists()
+    ).order_by(GroupRecommendation.rank).limit(limit))
+
+
+def main():
+    """Recompute recommendations for every user"""
+    from factory import create_app
+
+    parser = argparse.ArgumentParser(description='Recompute TigerStudy study group recommendations')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help='recommendations stored per user')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        stored = compute_recommendations(top_k=args.top_k)
+    print(f"Stored {stored} recommendations")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Threaded discussion replies for TigerStudy
+
+Replies form a tree under each post. Every reply stores a materialized path
+(its ancestors' ids and its own, zero-padded, e.g. "0000000012/0000000040/")
+plus its depth and direct-reply count. Because paths sort like the tree, a
+reply's whole subtree is the index range (post_id, path) between its own
+path and path + "~", so a page of threads loads in two queries (the top-level
+replies, then all their visible descendants) however deep the tree is.
+
+A post page shows TOP_LEVEL_PAGE_SIZE top-level replies (best first) with up
+to INLINE_DEPTH levels beneath each; deeper or overflowing branches collapse
+into a "continue this thread" link that opens the branch on its own page.
+Replies are never nested more than MAX_DEPTH levels deep.
+"""
+from collections import Counter
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload
+from models import db, DiscussionReply
+
+# Top-level replies per page of a post
+TOP_LEVEL_PAGE_SIZE = 20
+
+# Levels shown beneath each top-level reply before the branch collapses
+INLINE_DEPTH = 3
+
+# Deepest nesting; replies to a reply this deep go to its parent instead
+MAX_DEPTH = 8
+
+# Most descendants loaded for one page
+THREAD_REPLY_LIMIT = 300
+
+
+class ThreadEntry:
+    """A reply as placed on a thread page"""
+
+    def __init__(self, reply, indent, hidden_replies):
+        self.reply = reply
+        self.indent = indent  # Levels below the page's top replies
+        self.hidden_replies = hidden_replies  # Direct replies not shown on this page
+
+
+def _subtree(path):
+    """Filter for the strict descendants of the reply at path"""
+    return and_(DiscussionReply.path > path, DiscussionReply.path < path + '~')
+
+
+def _descendants(post_id, roots, max_depth):
+    """Load the roots' descendants down to max_depth, in path order"""
+    if not roots:
+        return []
+    return DiscussionReply.query.options(joinedload(DiscussionReply.author)).filter(
+        DiscussionReply.post_id == post_id,
+        DiscussionReply.depth <= max_depth,
+        or_(*[_subtree(root.path) for root in roots])
+    ).order_by(DiscussionReply.path).limit(THREAD_REPLY_LIMIT).all()
+
+
+def _arrange(roots, descendants):
+    """Place each root's loaded descendants after it, in tree order"""
+    by_root = {}
+    if roots:
+        prefix_length = len(roots[0].path)
+        for reply in descendants:
+            by_root.setdefault(reply.path[:prefix_length], []).append(reply)
+
+    shown_children = Counter(reply.parent_id for reply in descendants)
+    entries = []
+    for root in roots:
+        for reply in [root] + by_root.get(root.path, []):
+            entries.append(ThreadEntry(reply, reply.depth - root.depth,
+                                       reply.child_count - shown_children[reply.id]))
+    return entries
+
+
+def load_page(post_id, page=1):
+    """Get a page of a post's threads (returns entries, has_more_pages)"""
+    roots = DiscussionReply.query.options(joinedload(DiscussionReply.author)).filter(
+        DiscussionReply.post_id == post_id,
+        DiscussionReply.parent_id.is_(None)
+    ).order_by(
+        DiscussionReply.score.desc(),
+        DiscussionReply.created_at.asc()
+    ).offset((page - 1) * TOP_LEVEL_PAGE_SIZE).limit(TOP_LEVEL_PAGE_SIZE + 1).all()
+
+    has_more = len(roots) > TOP_LEVEL_PAGE_SIZE
+    roots = roots[:TOP_LEVEL_PAGE_SIZE]
+    return _arrange(roots, _descendants(post_id, roots, INLINE_DEPTH)), has_more
+
+
+def load_branch(reply):
+    """Get one reply and its descendants, INLINE_DEPTH levels down"""
+    return _arrange([reply], _descendants(reply.post_id, [reply], reply.depth + INLINE_DEPTH))
+
+
+def reply_target(parent):
+    """Get the reply a new reply should hang under, respecting MAX_DEPTH"""
+    while parent.depth >= MAX_DEPTH:
+        parent = db.session.get(DiscussionReply, parent.parent_id)
+    return parent
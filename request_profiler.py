@@ -0,0 +1,179 @@
+"""
+On-demand sampling profiler for TigerStudy requests
+
+A request is profiled when it carries an X-Profile header holding the
+PROFILER_TOKEN, or at random for a PROFILER_SAMPLE_RATE fraction of
+requests. While any profiled request is running, one background thread
+wakes every SAMPLE_INTERVAL_SECONDS, reads the Python stack of each
+profiled request's thread and counts it under the request's endpoint. The
+requests themselves run unmodified (no tracing hooks), so a profiled
+request is barely slower, and the profiler costs nothing at all unless
+PROFILER_TOKEN is set.
+
+Samples are aggregated in memory per endpoint as collapsed stacks (one
+"frame;frame;frame count" line per distinct stack), the input format of
+flamegraph.pl and speedscope. They are served with the same token:
+
+    curl -H 'X-Profile-Token: $PROFILER_TOKEN' https://host/_profile
+    curl -H 'X-Profile-Token: $PROFILER_TOKEN' https://host/_profile/discussion_board > board.folded
+    flamegraph.pl board.folded > board.svg
+
+A DELETE to /_profile clears the collected samples.
+"""
+import hmac
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from flask import abort, jsonify, request
+
+# Seconds between stack samples of each profiled request
+SAMPLE_INTERVAL_SECONDS = 0.005
+
+# Distinct stacks kept per endpoint; rarer stacks beyond this are counted as "[other]"
+MAX_STACKS_PER_ENDPOINT = 5000
+
+# Deepest stack recorded (outermost frames are dropped past this)
+MAX_STACK_DEPTH = 128
+
+# Request header that asks for a profile and the header that authorizes the endpoints
+PROFILE_HEADER = 'X-Profile'
+TOKEN_HEADER = 'X-Profile-Token'
+
+
+def _frame_label(frame):
+    """Label a frame as module:function"""
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+def collapse(frame):
+    """Turn a frame into a collapsed stack string, outermost frame first"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class SamplingProfiler:
+    """Samples the stacks of registered request threads and aggregates them per endpoint"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self._active = {}  # thread id -> endpoint being profiled
+        self._stacks = {}  # endpoint -> Counter of collapsed stacks
+        self._requests = Counter()  # endpoint -> profiled requests
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start_request(self, endpoint):
+        """Start sampling the current thread under an endpoint"""
+        with self._lock:
+            self._active[threading.get_ident()] = endpoint
+            self._requests[endpoint] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def finish_request(self):
+        """Stop sampling the current thread"""
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+
+    def _run(self):
+        """Sample while requests are registered, sleep while none are"""
+        while True:
+            self._wake.wait()
+            with self._lock:
+                active = dict(self._active)
+                if not active:
+                    self._wake.clear()
+                    continue
+            frames = sys._current_frames()
+            samples = [(endpoint, collapse(frames[thread_id]))
+                       for thread_id, endpoint in active.items() if thread_id in frames]
+            with self._lock:
+                for endpoint, stack in samples:
+                    stacks = self._stacks.setdefault(endpoint, Counter())
+                    if stack in stacks or len(stacks) < MAX_STACKS_PER_ENDPOINT:
+                        stacks[stack] += 1
+                    else:
+                        stacks['[other]'] += 1
+            del frames
+            time.sleep(self.interval)
+
+    def summary(self):
+        """Get {endpoint: {'requests': n, 'samples': n}} for everything collected"""
+        with self._lock:
+            return {endpoint: {'requests': self._requests[endpoint], 'samples': sum(stacks.values())}
+                    for endpoint, stacks in self._stacks.items()}
+
+    def collapsed(self, endpoint):
+        """Get an endpoint's samples as collapsed-stack text (None if it has none)"""
+        with self._lock:
+            stacks = self._stacks.get(endpoint)
+            if not stacks:
+                return None
+            return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+    def clear(self):
+        """Forget every collected sample"""
+        with self._lock:
+            self._stacks.clear()
+            self._requests.clear()
+
+
+def _token_matches(value, token):
+    """Compare a presented token with the configured one in constant time"""
+    return bool(value) and hmac.compare_digest(value.encode(), token.encode())
+
+
+def init_request_profiler(app):
+    """Profile sampled or requested requests and serve the results (only when PROFILER_TOKEN is set)"""
+    token = app.config.get('PROFILER_TOKEN')
+    if not token:
+        return
+
+    profiler = app.extensions['request_profiler'] = SamplingProfiler()
+    sample_rate = app.config.get('PROFILER_SAMPLE_RATE', 0)
+
+    @app.before_request
+    def start_profiling():
+        """Decide whether this request is profiled"""
+        if request.endpoint in (None, 'static', 'dist_asset', 'profiler_summary', 'profiler_stacks'):
+            return
+        if _token_matches(request.headers.get(PROFILE_HEADER), token) or (sample_rate and random.random() < sample_rate):
+            profiler.start_request(request.endpoint)
+
+    @app.teardown_request
+    def finish_profiling(error=None):
+        """Stop sampling once the response (including a streamed body) is done"""
+        profiler.finish_request()
+
+    def authorize():
+        """Reject requests without the profiler token"""
+        if not _token_matches(request.headers.get(TOKEN_HEADER), token):
+            abort(403)
+
+    def profiler_summary():
+        """List profiled endpoints, or clear the samples on DELETE"""
+        authorize()
+        if request.method == 'DELETE':
+            profiler.clear()
+            return '', 204
+        return jsonify(profiler.summary())
+
+    def profiler_stacks(endpoint):
+        """Serve an endpoint's samples as collapsed stacks for flamegraph tools"""
+        authorize()
+        collapsed = profiler.collapsed(endpoint)
+        if collapsed is None:
+            # Answered directly; the app's 404 handler would redirect to the home page
+            return f'No samples for {endpoint}\n', 404, {'Content-Type': 'text/plain; charset=utf-8'}
+        return collapsed, 200, {'Content-Type': 'text/plain; charset=utf-8', 'Cache-Control': 'no-store'}
+
+    app.add_url_rule('/_profile', 'profiler_summary', profiler_summary, methods=['GET', 'DELETE'])
+    app.add_url_rule('/_profile/<endpoint>', 'profiler_stacks', profiler_stacks)
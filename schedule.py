@@ -0,0 +1,85 @@
+"""
+Schedule conflict detection for TigerStudy study groups
+
+A session occupies [date_time, date_time + duration_minutes). Because no
+session is longer than MAX_DURATION_MINUTES, every session overlapping a
+window [start, end) must begin inside [start - MAX_DURATION, end). That
+turns each overlap check into a range scan on a start-time index:
+
+  - per user:     participants(user_id) joined to study_groups(date_time)
+  - per room:     study_groups(location_key, date_time), within one campus
+  - per course:   study_groups(course_id, date_time)
+
+and only the handful of rows in that range are compared exactly.
+"""
+from datetime import datetime, timedelta
+from models import Course, StudyGroup, Participant, MAX_DURATION_MINUTES, normalize_location
+from locations import is_virtual_location
+
+MAX_DURATION = timedelta(minutes=MAX_DURATION_MINUTES)
+
+# Hours of the day considered when listing free slots
+DAY_START_HOUR = 8
+DAY_END_HOUR = 23
+
+
+def _overlapping(query, start, end, exclude_group_id=None):
+    """Narrow a study group query to sessions overlapping [start, end)"""
+    query = query.filter(
+        StudyGroup.date_time > start - MAX_DURATION,
+        StudyGroup.date_time < end
+    )
+    if exclude_group_id is not None:
+        query = query.filter(StudyGroup.id != exclude_group_id)
+    return [group for group in query.order_by(StudyGroup.date_time).all() if group.overlaps(start, end)]
+
+
+def find_user_conflicts(user_id, start, end, exclude_group_id=None):
+    """Get the user's joined study groups that overlap [start, end)"""
+    query = StudyGroup.query.join(Participant, Participant.study_group_id == StudyGroup.id).filter(
+        Participant.user_id == user_id
+    )
+    return _overlapping(query, start, end, exclude_group_id)
+
+
+def find_location_conflicts(tenant_id, location, start, end, exclude_group_id=None):
+    """Get the campus's study groups booked in the same room during [start, end)"""
+    if is_virtual_location(location):
+        return []
+    query = StudyGroup.query.join(Course, StudyGroup.course_id == Course.id).filter(
+        StudyGroup.location_key == normalize_location(location),
+        Course.tenant_id == tenant_id
+    )
+    return _overlapping(query, start, end, exclude_group_id)
+
+
+def _merge(intervals):
+    """Merge overlapping (start, end) intervals"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_slots(course_id, day, user_id=None, min_minutes=60):
+    """Get (start, end) gaps on a day with no session for the course (or the user)"""
+    window_start = datetime.combine(day, datetime.min.time()) + timedelta(hours=DAY_START_HOUR)
+    window_end = datetime.combine(day, datetime.min.time()) + timedelta(hours=DAY_END_HOUR)
+
+    busy = _overlapping(StudyGroup.query.filter(StudyGroup.course_id == course_id), window_start, window_end)
+    if user_id is not None:
+        busy += find_user_conflicts(user_id, window_start, window_end)
+
+    # Nothing before now is bookable
+    cursor = max(window_start, datetime.now().replace(second=0, microsecond=0))
+    slots = []
+    for start, end in _merge((group.date_time, group.end_time()) for group in busy):
+        if start - cursor >= timedelta(minutes=min_minutes):
+            slots.append((cursor, start))
+        cursor = max(cursor, end)
+    if window_end - cursor >= timedelta(minutes=min_minutes):
+        slots.append((cursor, window_end))
+    return slots
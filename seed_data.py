@@ -2,29 +2,83 @@
 Seed script for Princeton Study Group Finder
 Populates the database with Princeton courses and sample study groups
 """
-from app import app
-from models import db, User, Course, StudyGroup, Participant, DiscussionPost, DiscussionReply, PostVote, ReplyVote
+from factory import create_app
+from models import db, Tenant, Building, User, PostVoteBucket, PostSignature, Course, StudyGroup, Participant, WaitlistEntry, GroupRecommendation, Notification, ContentVersion, DiscussionPost, DiscussionReply, PostVote, ReplyVote
 from datetime import datetime, timedelta
+import os
 import random
+import locations
+import near_duplicates
+import trending
+
+# Bare app (database + Bcrypt only) - seeding needs no routes, forms or templates
+app = create_app()
 
 
 def clear_database():
     """Clear all existing data from the database"""
     print("Clearing existing data...")
     with app.app_context():
+        ContentVersion.query.delete()
+        Notification.query.delete()
         ReplyVote.query.delete()
+        PostVoteBucket.query.delete()
+        PostSignature.query.delete()
         PostVote.query.delete()
         DiscussionReply.query.delete()
         DiscussionPost.query.delete()
+        GroupRecommendation.query.delete()
+        WaitlistEntry.query.delete()
         Participant.query.delete()
         StudyGroup.query.delete()
+        Building.query.delete()
         Course.query.delete()
         User.query.delete()
+        Tenant.query.delete()
         db.session.commit()
     print("Database cleared!")
 
 
-def seed_users():
+def seed_tenant():
+    """Seed the default Princeton tenant"""
+    print("\nSeeding tenant...")
+    tenant = Tenant(
+        slug='princeton',
+        hostname=os.environ.get('TENANT_HOSTNAME', 'localhost'),
+        name='Princeton University',
+        short_name='Princeton',
+        app_name='TigerStudy',
+        email_domain='princeton.edu'
+    )
+    db.session.add(tenant)
+    db.session.commit()
+    print(f"  Created tenant {tenant.slug} ({tenant.hostname})")
+    return tenant
+
+
+def seed_buildings(tenant):
+    """Seed the Princeton buildings study groups meet in"""
+    print("\nSeeding buildings...")
+    buildings = [
+        ('Fine Hall', ''),
+        ('Frist Campus Center', 'Frist'),
+        ('Lewis Library', 'Lewis'),
+        ('Friend Center', ''),
+        ('McCosh Hall', 'McCosh'),
+        ('Firestone Library', 'Firestone'),
+        ('Butler College', 'Butler'),
+        ('Whitman College', 'Whitman'),
+        ('Chancellor Green', ''),
+        ('Engineering Quadrangle', 'Engineering Quad,E-Quad'),
+    ]
+    for name, aliases in buildings:
+        db.session.add(Building(tenant_id=tenant.id, name=name, aliases=aliases))
+    db.session.commit()
+    locations.clear_cache()
+    print(f"  Added {len(buildings)} buildings")
+
+
+def seed_users(tenant):
     """Seed sample Princeton users"""
     print("\nSeeding users...")
 
@@ -50,6 +104,7 @@ def seed_users():
     users = []
     for user_data in users_data:
         user = User(
+            tenant_id=tenant.id,
             email=user_data['email'],
             username=user_data['username'],
             full_name=user_data['full_name'],
@@ -64,7 +119,7 @@ def seed_users():
     return users
 
 
-def seed_courses():
+def seed_courses(tenant):
     """Seed Princeton courses"""
     print("\nSeeding courses...")
 
@@ -148,7 +203,7 @@ def seed_courses():
 
     with app.app_context():
         for course_data in courses_data:
-            course = Course(**course_data)
+            course = Course(tenant_id=tenant.id, **course_data)
             db.session.add(course)
             print(f"  Added: {course.code} - {course.title}")
 
@@ -169,7 +224,7 @@ def seed_study_groups(users):
         return
 
     # Sample locations
-    locations = [
+    sample_locations = [
         'Fine Hall 214',
         'Frist Campus Center, 3rd Floor',
         'Lewis Library Study Room 3A',
@@ -273,7 +328,8 @@ def seed_study_groups(users):
                 meeting_date = datetime.now() + timedelta(days=days_offset, hours=hour-datetime.now().hour, minutes=minute-datetime.now().minute)
 
                 # Random location
-                location = random.choice(locations)
+                location = random.choice(sample_locations)
+                is_virtual, building_id = locations.classify(course.tenant_id, location)
 
                 # Random capacity
                 max_participants = random.choice([4, 5, 6, 8, 10, -1])
@@ -288,6 +344,8 @@ def seed_study_groups(users):
                     description=description,
                     date_time=meeting_date,
                     location=location,
+                    is_virtual=is_virtual,
+                    building_id=building_id,
                     max_participants=max_participants
                 )
 
@@ -324,7 +382,9 @@ def seed_study_groups(users):
                             )
                         db.session.add(participant)
 
-                print(f"  Added: {course.code} - {title} ({study_group.participant_count()} participants)")
+                study_group.participant_count = len(added_participants)
+
+                print(f"  Added: {course.code} - {title} ({study_group.participant_count} participants)")
 
         db.session.commit()
     print("Successfully seeded study groups!")
@@ -460,6 +520,7 @@ def seed_discussions(users):
 
                 # Add 0-3 replies to each post
                 num_replies = random.randint(0, 3)
+                post_replies = []
 
                 for j in range(num_replies):
                     # Get available reply authors (different from post author)
@@ -471,14 +532,22 @@ def seed_discussions(users):
                         reply_hours_offset = random.randint(2, 72)
                         reply_time = created_time + timedelta(hours=reply_hours_offset)
 
+                        # Some replies answer an earlier reply instead of the post
+                        parent = None
+                        if post_replies and random.random() < 0.4:
+                            parent = random.choice(post_replies)
+                            reply_time = parent.created_at + timedelta(hours=random.randint(1, 24))
+
                         reply = DiscussionReply(
                             post_id=post.id,
+                            parent=parent,
                             author_id=reply_user.id,
                             content=random.choice(reply_templates),
                             created_at=reply_time
                         )
 
                         db.session.add(reply)
+                        post_replies.append(reply)
                         reply_count += 1
 
                 post_count += 1
@@ -615,23 +684,35 @@ def main():
 
         # Clear existing data (moved inside context)
         print("Clearing existing data...")
+        ContentVersion.query.delete()
+        Notification.query.delete()
         ReplyVote.query.delete()
+        PostVoteBucket.query.delete()
+        PostSignature.query.delete()
         PostVote.query.delete()
         DiscussionReply.query.delete()
         DiscussionPost.query.delete()
+        GroupRecommendation.query.delete()
+        WaitlistEntry.query.delete()
         Participant.query.delete()
         StudyGroup.query.delete()
+        Building.query.delete()
         Course.query.delete()
         User.query.delete()
+        Tenant.query.delete()
         db.session.commit()
         print("Database cleared!")
 
-        # Seed data (IMPORTANT: Users FIRST!)
-        users = seed_users()
-        seed_courses()
+        # Seed data (IMPORTANT: Tenant, then Users FIRST!)
+        tenant = seed_tenant()
+        seed_buildings(tenant)
+        users = seed_users(tenant)
+        seed_courses(tenant)
         seed_study_groups(users)
         seed_discussions(users)
         seed_votes(users)
+        trending.rebuild_buckets()
+        near_duplicates.rebuild_signatures()
 
     print("\n" + "="*60)
     print("Database seeding completed successfully!")
@@ -19,6 +19,10 @@ echo ""
 echo "Installing dependencies..."
 ./venv/bin/pip install -r requirements.txt
 
+echo ""
+echo "Building static assets..."
+./venv/bin/python build_assets.py
+
 echo ""
 echo "Seeding database..."
 ./venv/bin/python seed_data.py
@@ -0,0 +1,113 @@
+"""
+Startup profiling for TigerStudy
+
+Two reports for keeping worker boot and CLI startup fast:
+
+  python startup_profile.py importtime [--module app] [--top 25] [--budget-ms 900]
+      Runs `python -X importtime -c "import <module>"` in a fresh interpreter
+      and summarizes the slowest imports. With --budget-ms the command exits
+      non-zero when the total import time is over budget.
+
+  python startup_profile.py bench [--runs 10]
+      Times cold starts of the web app (import app) and of the bare app used
+      by CLI tools (factory.create_app) across fresh interpreters.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Cold-start targets for the benchmark: (label, code run in a fresh interpreter)
+BENCH_TARGETS = [
+    ('web worker (import app)', 'import app'),
+    ('cli tools (factory.create_app)', 'import factory; factory.create_app()'),
+]
+
+_TIMER = '''
+import time
+_start = time.perf_counter()
+{code}
+print(time.perf_counter() - _start)
+'''
+
+
+def parse_importtime(stderr):
+    """Parse -X importtime output into (self_us, cumulative_us, module) rows"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        rows.append((int(self_us), int(cumulative_us), module.strip()))
+    return rows
+
+
+def run_importtime(module):
+    """Import a module in a fresh interpreter and return its importtime rows"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=PROJECT_DIR, capture_output=True, text=True, check=True
+    )
+    return parse_importtime(result.stderr)
+
+
+def importtime_report(module, top, budget_ms):
+    """Print the slowest imports for a module (returns the process exit code)"""
+    rows = run_importtime(module)
+    total_ms = sum(self_us for self_us, _, _ in rows) / 1000
+
+    print(f"Import time for '{module}': {total_ms:.1f} ms across {len(rows)} modules")
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for self_us, cumulative_us, name in sorted(rows, key=lambda r: r[1], reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+    if budget_ms is not None and total_ms > budget_ms:
+        print(f"\nOver budget: {total_ms:.1f} ms > {budget_ms:.1f} ms")
+        return 1
+    return 0
+
+
+def time_cold_start(code):
+    """Run code in a fresh interpreter and return its wall time in seconds"""
+    result = subprocess.run(
+        [sys.executable, '-c', _TIMER.format(code=code)],
+        cwd=PROJECT_DIR, capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def bench_report(runs):
+    """Print cold-start timings for the web app and the CLI app"""
+    print(f"Cold start over {runs} fresh interpreters (ms)")
+    print(f"\n{'target':<34} {'min':>8} {'median':>8} {'max':>8}")
+    for label, code in BENCH_TARGETS:
+        samples = [time_cold_start(code) * 1000 for _ in range(runs)]
+        print(f"{label:<34} {min(samples):>8.1f} {statistics.median(samples):>8.1f} {max(samples):>8.1f}")
+    return 0
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='TigerStudy startup profiling')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    importtime = subparsers.add_parser('importtime', help='summarize python -X importtime')
+    importtime.add_argument('--module', default='app', help='module to import (default: app)')
+    importtime.add_argument('--top', type=int, default=25, help='number of imports to list')
+    importtime.add_argument('--budget-ms', type=float, help='fail if total import time exceeds this')
+
+    bench = subparsers.add_parser('bench', help='benchmark cold startup')
+    bench.add_argument('--runs', type=int, default=10, help='fresh interpreters per target')
+
+    args = parser.parse_args()
+
+    if args.command == 'importtime':
+        return importtime_report(args.module, args.top, args.budget_ms)
+    return bench_report(args.runs)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Static asset helpers for TigerStudy
+
+Templates reference the built CSS bundle and icon sprite through two
+template globals:
+
+  asset_url('app.css')      -> URL of the content-hashed file, or None if
+                               build_assets.py has not produced it
+  icon('chat', 'w-5 h-5')   -> <svg> that points into the icon sprite, or the
+                               inline icon when no sprite has been built
+
+Hashed files are served from /static/dist with far-future, immutable cache
+headers, using the precompressed .br/.gz variant the client accepts.
+"""
+import json
+import mimetypes
+import os
+import re
+from flask import request, send_from_directory, url_for
+from markupsafe import Markup, escape
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+ICONS_DIR = os.path.join(PROJECT_DIR, 'assets', 'icons')
+DIST_DIR = os.path.join(PROJECT_DIR, 'static', 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+# Hashed filenames never change content, so clients may keep them for a year
+FAR_FUTURE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Precompressed variants in order of preference: (Accept-Encoding token, suffix)
+PRECOMPRESSED = [('br', '.br'), ('gzip', '.gz')]
+
+_SVG_RE = re.compile(r'<svg\b([^>]*)>(.*)</svg>', re.S)
+_ATTR_RE = re.compile(r'([\w:-]+)="([^"]*)"')
+
+
+def load_icons(icons_dir=ICONS_DIR):
+    """Read icon sources into {name: (attributes, inner markup)}"""
+    icons = {}
+    for filename in sorted(os.listdir(icons_dir)):
+        if not filename.endswith('.svg'):
+            continue
+        with open(os.path.join(icons_dir, filename)) as f:
+            match = _SVG_RE.search(f.read())
+        attrs = dict(_ATTR_RE.findall(match.group(1)))
+        inner = re.sub(r'>\s+<', '><', match.group(2).strip())
+        icons[filename[:-len('.svg')]] = (attrs, inner)
+    return icons
+
+
+def build_sprite(icons):
+    """Combine icons into a single SVG sprite of <symbol> elements"""
+    symbols = ''.join(
+        f'<symbol id="{name}" viewBox="{attrs["viewBox"]}">{inner}</symbol>'
+        for name, (attrs, inner) in sorted(icons.items())
+    )
+    return f'<svg xmlns="http://www.w3.org/2000/svg">{symbols}</svg>'
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """Load the logical name -> hashed filename map written by build_assets.py"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def serve_dist_asset(filename):
+    """Serve a hashed build output, preferring a precompressed variant"""
+    mimetype = mimetypes.guess_type(filename)[0]
+
+    for encoding, suffix in PRECOMPRESSED:
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(DIST_DIR, filename + suffix)):
+            response = send_from_directory(DIST_DIR, filename + suffix, mimetype=mimetype,
+                                           max_age=FAR_FUTURE_MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(DIST_DIR, filename, mimetype=mimetype, max_age=FAR_FUTURE_MAX_AGE)
+
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_static_assets(app):
+    """Register the dist route and the asset_url / icon template globals"""
+    manifest = load_manifest()
+    icons = load_icons()
+
+    def asset_url(name):
+        """URL of a built asset, or None when it has not been built"""
+        hashed = manifest.get(name)
+        return url_for('dist_asset', filename=hashed) if hashed else None
+
+    def icon(name, classes='', fill=None):
+        """Render an icon from the sprite (inline when no sprite is built)"""
+        attrs, inner = icons[name]
+        svg_attrs = f'class="{escape(classes)}" fill="{escape(fill or attrs["fill"])}"'
+        if 'stroke' in attrs:
+            svg_attrs += f' stroke="{attrs["stroke"]}"'
+        svg_attrs += f' viewBox="{attrs["viewBox"]}"'
+
+        sprite_url = asset_url('icons.svg')
+        if sprite_url:
+            return Markup(f'<svg {svg_attrs}><use href="{sprite_url}#{name}"></use></svg>')
+        return Markup(f'<svg {svg_attrs}>{inner}</svg>')
+
+    app.add_url_rule('/static/dist/<path:filename>', 'dist_asset', serve_dist_asset)
+    app.add_template_global(asset_url)
+    app.add_template_global(icon)
@@ -0,0 +1,41 @@
+"""
+Streaming page rendering for TigerStudy
+
+Long discussion threads and chat transcripts are rendered with Flask's
+stream_template, so the page header reaches the browser before the reply or
+message list has been read. Chat transcripts are passed to the template as
+a yield_per() iterator over a server-side cursor, so only one batch of rows
+is held in memory at a time; discussion threads are already bounded to one
+page by reply_threads.
+
+Headers (including the session cookie) are sent before the template body
+runs, so anything the body would write to the session has to happen up
+front: stream_page() pops pending flash messages and issues the CSRF token
+before streaming starts.
+"""
+from flask import current_app, render_template, stream_template, get_flashed_messages
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+
+# Rows fetched from the cursor per round trip
+STREAM_BATCH_SIZE = 100
+
+
+def iter_rows(query, batch_size=STREAM_BATCH_SIZE):
+    """Iterate a query's results batch by batch instead of loading them all"""
+    return query.yield_per(batch_size)
+
+
+def stream_page(template_name, **context):
+    """Render a template as a streamed response (buffered when STREAM_TEMPLATES is off)"""
+    if not current_app.config['STREAM_TEMPLATES']:
+        return render_template(template_name, **context)
+
+    # Flashes are popped from the session now; base.html reads them from the request
+    get_flashed_messages(with_categories=True)
+
+    # Forms are only rendered for logged-in users, so only they need a token
+    if current_user.is_authenticated:
+        generate_csrf()
+
+    return current_app.response_class(stream_template(template_name, **context))
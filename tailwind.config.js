@@ -0,0 +1,13 @@
+/** Tailwind build configuration for TigerStudy (used by build_assets.py) */
+module.exports = {
+  content: ['./templates/**/*.html'],
+  theme: {
+    extend: {
+      colors: {
+        'princeton-orange': '#FF8F00',
+        'princeton-black': '#000000',
+      },
+    },
+  },
+  plugins: [],
+}
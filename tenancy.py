@@ -0,0 +1,138 @@
+"""
+Multi-campus (tenant) support for TigerStudy
+
+One deployment serves several universities. Each request is mapped to a
+Tenant by its hostname before any view runs, and the tenant is available as
+g.tenant in views and as `tenant` in templates (for branding).
+
+Courses and users carry a tenant_id; everything else (study groups,
+discussions, chat, votes) hangs off a course or a user, so scoping the
+course and user lookups scopes the whole app. The get_*_or_404 helpers
+below are the tenant-checked replacements for Model.query.get_or_404().
+
+Hostname lookups are served from an in-process map, so resolving the tenant
+costs no query after the first request for each host. Only hostnames that
+belong to a tenant are kept; any other host costs one hostname lookup and
+then shares a single cached default tenant, so made-up Host headers cannot
+grow the map.
+"""
+import threading
+from flask import g, request, current_app
+from models import Tenant, Course, StudyGroup, DiscussionPost, DiscussionReply
+
+_tenants_by_host = {}
+_default_tenant = None
+_tenants_lock = threading.Lock()
+
+
+class TenantInfo:
+    """Detached snapshot of a tenant row, safe to share between requests"""
+
+    def __init__(self, tenant):
+        self.id = tenant.id
+        self.slug = tenant.slug
+        self.hostname = tenant.hostname
+        self.name = tenant.name
+        self.short_name = tenant.short_name
+        self.app_name = tenant.app_name
+        self.email_domain = tenant.email_domain
+
+    def __repr__(self):
+        return f'<TenantInfo {self.slug}>'
+
+
+def _default():
+    """Get the tenant serving unknown hosts (None if it does not exist)"""
+    global _default_tenant
+    with _tenants_lock:
+        info = _default_tenant
+    if info is not None:
+        return info
+
+    tenant = Tenant.query.filter_by(slug=current_app.config['DEFAULT_TENANT']).first()
+    if tenant is None:
+        return None
+
+    info = TenantInfo(tenant)
+    with _tenants_lock:
+        _default_tenant = info
+    return info
+
+
+def resolve_tenant(hostname):
+    """Get the tenant serving a hostname (the default tenant for unknown hosts)"""
+    hostname = hostname.split(':', 1)[0].lower()
+
+    with _tenants_lock:
+        info = _tenants_by_host.get(hostname)
+    if info is not None:
+        return info
+
+    tenant = Tenant.query.filter_by(hostname=hostname).first()
+    if tenant is None:
+        return _default()
+
+    info = TenantInfo(tenant)
+    with _tenants_lock:
+        _tenants_by_host[hostname] = info
+    return info
+
+
+def clear_cache():
+    """Forget resolved hostnames (call after adding or editing tenants)"""
+    global _default_tenant
+    with _tenants_lock:
+        _tenants_by_host.clear()
+        _default_tenant = None
+
+
+def current_tenant_id():
+    """Get the id of the tenant serving the current request"""
+    return g.tenant.id
+
+
+def init_tenancy(app):
+    """Resolve the tenant for every request and expose it to templates"""
+
+    @app.before_request
+    def load_tenant():
+        """Attach the request's tenant to g"""
+        g.tenant = resolve_tenant(request.host)
+        if g.tenant is None:
+            return 'No campus is configured for this host.', 404
+
+    @app.context_processor
+    def tenant_processor():
+        """Add the current tenant to all templates"""
+        return dict(tenant=g.get('tenant'))
+
+
+def get_course_or_404(course_code):
+    """Get a course of the current tenant by code"""
+    return Course.query.filter_by(tenant_id=current_tenant_id(), code=course_code.upper()).first_or_404()
+
+
+def get_group_or_404(group_id):
+    """Get a study group of the current tenant by id"""
+    return StudyGroup.query.join(Course, StudyGroup.course_id == Course.id).filter(
+        StudyGroup.id == group_id,
+        Course.tenant_id == current_tenant_id()
+    ).first_or_404()
+
+
+def get_post_or_404(post_id):
+    """Get a discussion post of the current tenant by id"""
+    return DiscussionPost.query.join(Course, DiscussionPost.course_id == Course.id).filter(
+        DiscussionPost.id == post_id,
+        Course.tenant_id == current_tenant_id()
+    ).first_or_404()
+
+
+def get_reply_or_404(reply_id):
+    """Get a discussion reply of the current tenant by id"""
+    return DiscussionReply.query.join(
+        DiscussionPost, DiscussionReply.post_id == DiscussionPost.id
+    ).join(Course, DiscussionPost.course_id == Course.id).filter(
+        DiscussionReply.id == reply_id,
+        Course.tenant_id == current_tenant_id()
+    ).first_or_404()
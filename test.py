@@ -0,0 +1,129 @@
+"""
+Tests for TigerStudy
+
+The tests run against a throwaway SQLite database filled with the small
+query_budget.seed() dataset, so they never touch study_groups.db:
+
+    python -m pytest test.py
+    python test.py
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+_DATABASE_DIR = tempfile.mkdtemp(prefix='tigerstudy-test-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_DATABASE_DIR, 'test.db')
+os.environ['ACTIVITY_FLUSH_INTERVAL'] = '0'
+os.environ['TRENDING_PERSIST_INTERVAL'] = '0'
+
+from app import app  # noqa: E402 (the database location must be set first)
+from models import db, User, Course, StudyGroup, DiscussionPost, DiscussionReply, ChatMessage  # noqa: E402
+import activity_tracker  # noqa: E402
+import content_render  # noqa: E402
+import query_budget  # noqa: E402
+
+app.config['RATELIMIT_ENABLED'] = False
+
+
+def setUpModule():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        query_budget.seed(1)
+
+
+def tearDownModule():
+    # Write buffered activity now; the exit-time flush would find the database gone
+    with app.app_context():
+        activity_tracker.flush()
+        db.engine.dispose()
+    shutil.rmtree(_DATABASE_DIR, ignore_errors=True)
+
+
+class HttpCacheTest(unittest.TestCase):
+    """Public pages answer anonymous visitors with shareable, revalidatable responses"""
+
+    def public_urls(self):
+        with app.app_context():
+            course = Course.query.filter_by(code=query_budget.BUDGET_COURSE).one()
+            post = DiscussionPost.query.filter_by(course_id=course.id).first()
+            user = User.query.filter_by(username=query_budget.BUDGET_USERNAME).one()
+            return ['/', f'/user/{user.username}', f'/course/{course.code}',
+                    f'/course/{course.code}/discussions', f'/discussion/{post.id}']
+
+    def test_cookieless_get_is_public_with_etag(self):
+        for url in self.public_urls():
+            with self.subTest(url=url):
+                client = app.test_client(use_cookies=False)
+                response = client.get(url)
+                response.get_data()
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.headers['Cache-Control'].startswith('public'))
+                self.assertIsNotNone(response.headers.get('ETag'))
+                self.assertNotIn('Set-Cookie', response.headers)
+
+                revalidated = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+                self.assertEqual(revalidated.status_code, 304)
+
+
+
+class ContentRenderTest(unittest.TestCase):
+    """Rendering never fails on, or is steered by, hostile input"""
+
+    HOSTILE = [
+        'hello \x000\x00 there',
+        'x \x005\x00',
+        '[x](https://e.com) \x000\x00 tail',
+        '`a` \x001\x00 [b](https://e.com) \x00\x00 **c**',
+        '<script>alert(1)</script> [x](javascript:alert(1))',
+    ]
+
+    def test_hostile_input_renders_safely(self):
+        for text in self.HOSTILE:
+            with self.subTest(text=text):
+                html = content_render.render(text)
+                self.assertNotIn('\x00', html)
+                self.assertNotIn('<script', html)
+                self.assertNotIn('href="javascript', html)
+                self.assertEqual(html.count('<a '), html.count('</a>'))
+                self.assertLessEqual(html.count('<a '), text.count('](https://'))
+
+    def test_hostile_posts_are_stored(self):
+        with app.app_context():
+            user = User.query.filter_by(username=query_budget.BUDGET_USERNAME).one()
+            post = DiscussionPost.query.filter(DiscussionPost.author_id != user.id).first()
+            group = StudyGroup.query.filter_by(host_id=user.id).first()
+            post_id, group_id = post.id, group.id
+
+        app.config['WTF_CSRF_ENABLED'] = False
+        try:
+            client = app.test_client()
+            client.post('/login', data={'email_or_username': query_budget.BUDGET_USERNAME,
+                                        'password': query_budget.BUDGET_PASSWORD})
+            reply = client.post(f'/discussion/{post_id}/reply', data={'content': 'hello \x000\x00 there'})
+            message = client.post(f'/study_group/{group_id}/message', data={'content': 'x \x005\x00'})
+        finally:
+            app.config['WTF_CSRF_ENABLED'] = True
+        self.assertEqual(reply.status_code, 302)
+        self.assertEqual(message.status_code, 302)
+
+        with app.app_context():
+            stored_reply = DiscussionReply.query.filter_by(post_id=post_id).order_by(DiscussionReply.id.desc()).first()
+            stored_message = ChatMessage.query.filter_by(study_group_id=group_id).order_by(ChatMessage.id.desc()).first()
+            self.assertEqual(stored_reply.content_html, '<p>hello 0 there</p>')
+            self.assertEqual(stored_message.content_html, '<p>x 5</p>')
+
+
+
+class QueryBudgetTest(unittest.TestCase):
+    """Pages stay within their SQL query budgets and issue no per-row queries"""
+
+    def test_routes_within_budget(self):
+        for label, budget, small, large, problems in query_budget.check_budgets(1, 4):
+            with self.subTest(route=label):
+                self.assertEqual(problems, [], f'{label}: budget {budget}, {small} statements small, {large} large')
+
+
+if __name__ == '__main__':
+    unittest.main()
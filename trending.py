@@ -0,0 +1,233 @@
+"""
+Vote-velocity trending for TigerStudy discussion boards
+
+Every change to a post's score is counted in the post's hourly bucket. Each
+post keeps a ring buffer of WINDOW_HOURS buckets in memory, and its trending
+score is the sum of its buckets with exponential decay (a vote loses half
+its weight every HALF_LIFE_HOURS). Posts collecting votes right now outrank
+posts that were popular yesterday, however high their total score.
+
+Each course's top TOP_N posts are picked with a heap and cached for
+TOP_CACHE_SECONDS (or until the next vote in that course), so the board's
+"Trending" sort reads no vote rows at all.
+
+Counts are written to post_vote_buckets every TRENDING_PERSIST_INTERVAL
+seconds as additive deltas. After each write the window is reloaded from
+the table, so every worker converges on the votes of all workers and a
+restarted process starts warm. `flask rebuild-trending` recomputes the
+table from post_votes.
+"""
+import atexit
+import heapq
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+from models import db, DiscussionPost, PostVote, PostVoteBucket
+
+# Bucket width and how many buckets each post keeps
+BUCKET_SECONDS = 3600
+WINDOW_HOURS = 48
+
+# A vote's weight halves every this many hours
+HALF_LIFE_HOURS = 6
+
+# Posts listed per course
+TOP_N = 20
+
+# How long a course's top list is reused when no new votes arrive
+TOP_CACHE_SECONDS = 60
+
+# Seconds between writes to post_vote_buckets (TRENDING_PERSIST_INTERVAL overrides)
+PERSIST_INTERVAL_SECONDS = 60
+
+
+def current_hour(now=None):
+    """Get the bucket number (hours since the epoch) for a time"""
+    return int((now or time.time()) // BUCKET_SECONDS)
+
+
+class PostCounter:
+    """Ring buffer of a post's hourly vote counts"""
+
+    __slots__ = ('course_id', 'hours', 'votes')
+
+    def __init__(self, course_id):
+        self.course_id = course_id
+        self.hours = [None] * WINDOW_HOURS
+        self.votes = [0] * WINDOW_HOURS
+
+    def add(self, hour, votes):
+        """Count votes in an hour's bucket (recycling the slot if it holds an older hour)"""
+        slot = hour % WINDOW_HOURS
+        if self.hours[slot] != hour:
+            self.hours[slot] = hour
+            self.votes[slot] = 0
+        self.votes[slot] += votes
+
+    def score(self, now_hour):
+        """Decayed vote velocity as of now_hour"""
+        total = 0.0
+        for hour, votes in zip(self.hours, self.votes):
+            if hour is not None and votes and now_hour - hour < WINDOW_HOURS:
+                total += votes * math.pow(0.5, (now_hour - hour) / HALF_LIFE_HOURS)
+        return total
+
+    def is_stale(self, now_hour):
+        """Check if every bucket has left the window"""
+        return all(hour is None or now_hour - hour >= WINDOW_HOURS for hour in self.hours)
+
+
+class TrendingEngine:
+    """In-memory vote buckets with per-course top lists"""
+
+    def __init__(self):
+        self._counters = {}  # post_id -> PostCounter
+        self._pending = {}  # (post_id, hour) -> (course_id, votes) not yet written
+        self._top = {}  # course_id -> (computed_at, [(score, post_id)])
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def record_vote(self, course_id, post_id, votes, when=None):
+        """Count a change of `votes` to a post's score"""
+        hour = current_hour(when)
+        with self._lock:
+            counter = self._counters.get(post_id)
+            if counter is None:
+                counter = self._counters[post_id] = PostCounter(course_id)
+            counter.add(hour, votes)
+            _, pending = self._pending.get((post_id, hour), (course_id, 0))
+            self._pending[(post_id, hour)] = (course_id, pending + votes)
+            self._top.pop(course_id, None)
+
+    def top_posts(self, course_id, limit=TOP_N):
+        """Get [(score, post_id)] for a course's hottest posts, best first"""
+        if not self._loaded:
+            self.reload()
+
+        now = time.monotonic()
+        with self._lock:
+            cached = self._top.get(course_id)
+            if cached is not None and now - cached[0] < TOP_CACHE_SECONDS:
+                return cached[1][:limit]
+
+            now_hour = current_hour()
+            scored = ((counter.score(now_hour), post_id) for post_id, counter in self._counters.items()
+                      if counter.course_id == course_id)
+            top = heapq.nlargest(TOP_N, (entry for entry in scored if entry[0] > 0))
+            self._top[course_id] = (now, top)
+            return top[:limit]
+
+    def flush(self):
+        """Add pending counts to post_vote_buckets (returns the number of buckets written)"""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+        if not pending:
+            return 0
+
+        rows = [dict(post_id=post_id, hour=hour, course_id=course_id, votes=votes)
+                for (post_id, hour), (course_id, votes) in pending.items() if votes]
+        try:
+            if rows:
+                statement = insert(PostVoteBucket).values(rows)
+                db.session.execute(statement.on_conflict_do_update(
+                    index_elements=[PostVoteBucket.post_id, PostVoteBucket.hour],
+                    set_=dict(votes=PostVoteBucket.votes + statement.excluded.votes)
+                ))
+            db.session.execute(delete(PostVoteBucket).where(PostVoteBucket.hour <= current_hour() - WINDOW_HOURS))
+            db.session.commit()
+        except Exception:
+            # Keep the counts for the next attempt
+            db.session.rollback()
+            with self._lock:
+                for key, (course_id, votes) in pending.items():
+                    _, newer = self._pending.get(key, (course_id, 0))
+                    self._pending[key] = (course_id, votes + newer)
+            raise
+        return len(rows)
+
+    def reload(self):
+        """Rebuild the in-memory window from post_vote_buckets plus unwritten local votes"""
+        now_hour = current_hour()
+        rows = db.session.execute(
+            select(PostVoteBucket.post_id, PostVoteBucket.course_id, PostVoteBucket.hour, PostVoteBucket.votes)
+            .where(PostVoteBucket.hour > now_hour - WINDOW_HOURS)
+        ).all()
+
+        counters = {}
+        for post_id, course_id, hour, votes in rows:
+            counter = counters.get(post_id)
+            if counter is None:
+                counter = counters[post_id] = PostCounter(course_id)
+            counter.add(hour, votes)
+
+        with self._lock:
+            for (post_id, hour), (course_id, votes) in self._pending.items():
+                counter = counters.get(post_id)
+                if counter is None:
+                    counter = counters[post_id] = PostCounter(course_id)
+                counter.add(hour, votes)
+            self._counters = {post_id: counter for post_id, counter in counters.items()
+                              if not counter.is_stale(now_hour)}
+            self._top = {}
+            self._loaded = True
+
+
+def rebuild_buckets():
+    """Recompute post_vote_buckets from the votes cast within the window"""
+    cutoff = datetime.now() - timedelta(hours=WINDOW_HOURS)
+    db.session.execute(delete(PostVoteBucket))
+
+    # created_at is naive local time; convert to epoch seconds so buckets line up with current_hour()
+    hour = db.cast(func.strftime('%s', PostVote.created_at, 'utc'), db.Integer) // BUCKET_SECONDS
+    rows = db.session.execute(
+        select(PostVote.post_id, DiscussionPost.course_id, hour, func.sum(PostVote.vote_type))
+        .join(DiscussionPost, PostVote.post_id == DiscussionPost.id)
+        .where(PostVote.created_at >= cutoff)
+        .group_by(PostVote.post_id, DiscussionPost.course_id, hour)
+    ).all()
+    if rows:
+        db.session.execute(insert(PostVoteBucket).values([
+            dict(post_id=post_id, course_id=course_id, hour=bucket, votes=votes)
+            for post_id, course_id, bucket, votes in rows
+        ]))
+    db.session.commit()
+    return len(rows)
+
+
+def _persist_loop(app, engine, interval, stop):
+    """Write and reload the buckets every interval seconds until stopped"""
+    while not stop.wait(interval):
+        with app.app_context():
+            try:
+                engine.flush()
+                engine.reload()
+            except Exception:
+                app.logger.exception('Failed to persist trending buckets')
+
+
+def init_trending(app):
+    """Attach the trending engine to the app and start persisting it"""
+    engine = app.extensions['trending'] = TrendingEngine()
+
+    interval = app.config.get('TRENDING_PERSIST_INTERVAL', PERSIST_INTERVAL_SECONDS)
+    if interval:
+        stop = threading.Event()
+        threading.Thread(target=_persist_loop, args=(app, engine, interval, stop), name='trending-persist',
+                         daemon=True).start()
+        atexit.register(stop.set)
+
+    def flush_on_exit():
+        """Write whatever is still pending when the process stops"""
+        with app.app_context():
+            engine.flush()
+
+    atexit.register(flush_on_exit)
+
+
+def get_engine(app):
+    """Get the app's trending engine"""
+    return app.extensions['trending']